@@ -29,9 +29,13 @@ https://hackingmaterials.lbl.gov/matminer/dataset_summary.html
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap
 
+from mat_eda.composition import element_count_matrix, element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.stats import plot_histograms, summarize
+
 
 plt.rc("font", size=16)
 plt.rc("savefig", bbox="tight", dpi=200)
@@ -40,30 +44,33 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_boltz = load_dataset("boltztrap_mp")
-df_boltz.describe()
+df_boltz, _ = load_dataset("boltztrap_mp")
+# one pass over all numeric columns, reused by describe() and the histograms
+boltz_stats = summarize(df_boltz)
+boltz_stats.describe()
 
 
 # %%
-ptable_heatmap(df_boltz.formula, log=True)
+elem_counts = element_count_matrix(df_boltz.formula)
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elements in BoltzTraP MP dataset")
-plt.savefig("boltztrap_mp-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "boltztrap_mp-ptable-heatmap.pdf")
 
 
 # %%
-ptable_heatmap(df_boltz.sort_values("pf_n").tail(100).formula)
+top_100_pf_n = df_boltz.sort_values("pf_n").tail(100).formula
+ptable_heatmap(element_prevalence(element_count_matrix(top_100_pf_n)))
 plt.title("Elements of top 100 n-type powerfactors in BoltzTraP MP dataset")
-plt.savefig("boltztrap_mp-ptable-heatmap-top-100-nPF.pdf")
+save_fig(plt.gcf(), "boltztrap_mp-ptable-heatmap-top-100-nPF.pdf")
 
 
 # %%
-df_boltz.hist(bins=50, log=True, layout=[2, 3], figsize=[18, 8])
+plot_histograms(boltz_stats, bins=50, log=True, layout=[2, 3], figsize=[18, 8])
 plt.suptitle("BoltzTraP MP")
-plt.savefig("boltztrap_mp-hists.pdf")
+save_fig(plt.gcf(), "boltztrap_mp-hists.pdf")
 
 
 # %%
-df_boltz.sort_values("pf_n", ascending=False).head(1000).hist(
-    bins=50, log=True, layout=[2, 3], figsize=[18, 8]
-)
+top_1000_pf_n = summarize(df_boltz.sort_values("pf_n", ascending=False).head(1000))
+plot_histograms(top_1000_pf_n, bins=50, log=True, layout=[2, 3], figsize=[18, 8])
 plt.suptitle("BoltzTraP MP")
@@ -19,9 +19,14 @@ import os
 
 import matplotlib.pyplot as plt
 import pandas as pd
-import requests
 from pymatgen.symmetry.groups import SpaceGroup
-from pymatviz import annotate_bars, count_elements, ptable_heatmap, spacegroup_sunburst
+from pymatviz import annotate_bars, ptable_heatmap, spacegroup_sunburst
+
+from mat_eda.cache import CACHE_DIR
+from mat_eda.composition import element_count_matrix, element_prevalence
+from mat_eda.download import download
+from mat_eda.export import save_fig
+from mat_eda.ingest import json_array_to_parquet
 
 
 plt.rc("font", size=16)
@@ -31,17 +36,20 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %% Download data (if needed)
-if os.path.isfile("camd-2022-wo-features.csv.bz2"):
-    print("Loading local data...")
-    df = pd.read_csv("camd-2022-wo-features.csv.bz2")
-else:
+with_feat = False
+feat_tag = "w" if with_feat else "wo"
+parquet_path = f"camd-2022-{feat_tag}-features.parquet"
+
+if not os.path.isfile(parquet_path):
     print("Fetching data from AWS...")
     url = "https://s3.amazonaws.com/publications.matr.io/7/deployment/data/files"
-    with_feat = False
-    dataset = f"/camd_data_to_release_{'w' if with_feat else 'wo'}features.json"
-    data = requests.get(url + dataset).json()
-    df = pd.DataFrame(data)
-    df = pd.to_csv(f"camd-2022-{'w' if with_feat else 'wo'}-features.csv.bz2")
+    json_name = f"camd_data_to_release_{feat_tag}features.json"
+    # stream to disk (resumable if interrupted), then convert chunk by chunk so the
+    # full JSON never has to fit in memory
+    json_path = download(f"{url}/{json_name}", f"{CACHE_DIR}/camd_2022/{json_name}")
+    json_array_to_parquet(json_path, parquet_path)
+
+df = pd.read_parquet(parquet_path)
 
 
 # %%
@@ -49,10 +57,10 @@ df.hist(bins=50)
 
 
 # %%
-elem_counts = count_elements(df.reduced_formula)
-ptable_heatmap(elem_counts, log=True)
+elem_counts = element_count_matrix(df.reduced_formula)
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elements in CAMD 2022 dataset")
-plt.savefig("camd-2022-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "camd-2022-ptable-heatmap.pdf")
 
 
 # %%
@@ -65,5 +73,5 @@ df["spg_num"] = [SpaceGroup(x).int_number for x in df.space_group]
 
 fig = spacegroup_sunburst(df.spg_num, show_counts="percent")
 fig.show()
-fig.write_image("camd-2022-spacegroup-sunburst.pdf")
+save_fig(fig, "camd-2022-spacegroup-sunburst.pdf")
 fig.show()
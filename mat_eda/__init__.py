@@ -0,0 +1,6 @@
+"""Shared helpers used by the analyze_*.py scripts in this repo."""
+
+import os
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
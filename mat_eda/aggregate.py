@@ -0,0 +1,436 @@
+"""Plot summaries of large datasets instead of every point.
+
+plotly serializes every point into the figure JSON. So violins with points="all"
+and scatter plots of 10k+ structures produce figures of many MB that browsers
+render slowly. violin() and scatter() take the main arguments of px.violin() and
+px.scatter() and return the usual plotly figure for small dataframes. Above
+max_rows (default: MAT_EDA_AGGREGATE_ROWS env var or 5,000), they compute kernel
+density estimates, quartiles and 2D binned counts in NumPy and only send those to
+plotly, plus a random sample of outliers that keep their hover info.
+
+plotly is only imported when a figure is built, the summary functions only need
+NumPy.
+"""
+
+from __future__ import annotations
+
+import os
+import warnings
+from typing import TYPE_CHECKING, Any, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+AGGREGATE_ROWS = int(os.getenv("MAT_EDA_AGGREGATE_ROWS", "5000"))
+
+# px keyword arguments that aggregated plots apply to their layout
+LAYOUT_KWARGS = ("title", "width", "height", "template")
+
+
+def silverman_bandwidth(values: np.ndarray) -> float:
+    """Kernel bandwidth from Silverman's rule of thumb with the same constant
+    (1.059) and lower bound (1% of the data range) as plotly.js violins, so
+    aggregated violins match px.violin() for the same data.
+    """
+    span = np.ptp(values)
+    if span == 0:  # all values identical
+        return 1e-3 * (abs(values[0]) or 1)
+    std = values.std(ddof=1)
+    q1, q3 = np.quantile(values, [0.25, 0.75])
+    bandwidth = 1.059 * min(std, (q3 - q1) / 1.349) * len(values) ** -0.2
+    return max(bandwidth, span / 100)
+
+
+def gaussian_kde(
+    values: Sequence[float], n_points: int = 256, bandwidth: float | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Gaussian kernel density estimate on a regular grid extending 2 bandwidths
+    beyond the data (like plotly's default violin span). Values are linearly binned
+    onto the grid and then convolved with the kernel, so cost grows with
+    len(values) + n_points * kernel width instead of len(values) * n_points.
+
+    Args:
+        values (Sequence[float]): Samples. NaNs and infs are ignored.
+        n_points (int): Number of grid points. Defaults to 256.
+        bandwidth (float, optional): Kernel standard deviation. Defaults to
+            silverman_bandwidth(values).
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Grid and density at each grid point.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return np.empty(0), np.empty(0)
+    bandwidth = bandwidth or silverman_bandwidth(values)
+    grid = np.linspace(
+        values.min() - 2 * bandwidth, values.max() + 2 * bandwidth, n_points
+    )
+    step = grid[1] - grid[0]
+
+    # split the weight of each value between its two nearest grid points
+    pos = (values - grid[0]) / step
+    left = np.clip(np.floor(pos).astype(int), 0, n_points - 2)
+    frac = pos - left
+    weights = np.bincount(left, 1 - frac, n_points)
+    weights += np.bincount(left + 1, frac, n_points)
+
+    half_width = min(int(np.ceil(4 * bandwidth / step)), (n_points - 1) // 2)
+    offsets = np.arange(-half_width, half_width + 1) * step
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= bandwidth * np.sqrt(2 * np.pi)
+    density = np.convolve(weights, kernel, mode="same") / len(values)
+    return grid, density
+
+
+def box_stats(values: Sequence[float]) -> dict[str, float]:
+    """Quartiles, mean and Tukey fences (most extreme values within 1.5 IQR of the
+    box) in the format of go.Box(q1=..., median=..., ...).
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    return dict(
+        q1=q1,
+        median=median,
+        q3=q3,
+        mean=values.mean(),
+        lowerfence=values[values >= q1 - 1.5 * iqr].min(),
+        upperfence=values[values <= q3 + 1.5 * iqr].max(),
+    )
+
+
+def binned_counts(
+    x: Sequence[float],
+    y: Sequence[float],
+    bins: int = 200,
+    log_x: bool = False,
+    log_y: bool = False,
+    range_x: Sequence[float] | None = None,
+    range_y: Sequence[float] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """2D histogram of point counts. Log axes get logarithmically spaced bins.
+    Points that are non-finite, non-positive on a log axis or outside the given
+    ranges are dropped.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: Counts of shape (bins, bins)
+            (indexed [x_bin, y_bin]), x bin edges and y bin edges.
+    """
+    edges = []
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    mask = _valid(x, log_x, range_x) & _valid(y, log_y, range_y)
+    x, y = x[mask], y[mask]
+    for vals, log, rng in ((x, log_x, range_x), (y, log_y, range_y)):
+        lo, hi = rng if rng is not None else (vals.min(), vals.max())
+        if log:
+            edges.append(np.geomspace(lo, hi, bins + 1))
+        else:
+            edges.append(np.linspace(lo, hi, bins + 1))
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=edges)
+    return counts, x_edges, y_edges
+
+
+def _valid(
+    values: np.ndarray, log: bool, rng: Sequence[float] | None = None
+) -> np.ndarray:
+    """Mask of values that can be shown on an axis."""
+    mask = np.isfinite(values)
+    if log:
+        mask &= values > 0
+    if rng is not None:
+        mask &= (values >= rng[0]) & (values <= rng[1])
+    return mask
+
+
+def _sample(indices: np.ndarray, n: int, seed: int = 0) -> np.ndarray:
+    """At most n of indices, chosen randomly but reproducibly."""
+    if len(indices) <= n:
+        return indices
+    return np.sort(np.random.default_rng(seed).choice(indices, n, replace=False))
+
+
+def _hover_template(
+    x: str,
+    y: str,
+    hover_data: Sequence[str],
+    labels: dict[str, str],
+    hover_name: str | None,
+) -> str:
+    lines = [
+        f"{labels.get(col, col)}=%{{{axis}}}" for col, axis in ((x, "x"), (y, "y"))
+    ]
+    lines += [
+        f"{labels.get(col, col)}=%{{customdata[{idx}]}}"
+        for idx, col in enumerate(hover_data)
+    ]
+    if hover_name:
+        lines.insert(0, "<b>%{hovertext}</b>")
+    return "<br>".join(lines) + "<extra></extra>"
+
+
+def _update_layout(fig: go.Figure, func: str, kwargs: dict[str, Any]) -> None:
+    """Apply the LAYOUT_KWARGS among kwargs meant for px.{func}() to an aggregated
+    figure and warn about all others, which aggregated plots can't honor.
+    """
+    fig.update_layout({key: val for key, val in kwargs.items() if key in LAYOUT_KWARGS})
+    if ignored := sorted(set(kwargs) - set(LAYOUT_KWARGS)):
+        warnings.warn(
+            f"{func}() ignores {ignored} when aggregating more than max_rows rows",
+            stacklevel=3,
+        )
+
+
+def violin(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    labels: dict[str, str] | None = None,
+    hover_name: str | None = None,
+    hover_data: Sequence[str] = (),
+    category_orders: dict[str, Sequence[str]] | None = None,
+    log_y: bool = False,
+    jitter: float = 1,
+    max_rows: int | None = None,
+    n_outliers: int = 200,
+    **kwargs: Any,
+) -> go.Figure:
+    """Violin plot of df[y] for each category in df[x], colored by category.
+
+    Args:
+        df (pd.DataFrame): Data to plot.
+        x (str): Categorical column. Each category gets one violin.
+        y (str): Numeric column.
+        labels (dict[str, str], optional): Axis and hover labels by column name.
+        hover_name (str, optional): Column shown in bold in hover tooltips.
+        hover_data (Sequence[str]): Extra columns shown in hover tooltips.
+        category_orders (dict[str, Sequence[str]], optional): Order of
+            categories in df[x]. Defaults to the order of first appearance.
+        log_y (bool): Log-scale y axis. Densities are estimated in log space.
+        jitter (float): Horizontal spread of points. Defaults to 1.
+        max_rows (int, optional): Above this many rows, plot the density, box
+            and a sample of outliers of each category instead of all points.
+            Defaults to AGGREGATE_ROWS.
+        n_outliers (int): Max number of outliers (values beyond the whiskers)
+            per category shown as points in aggregated plots. Defaults to 200.
+        **kwargs: Passed to px.violin() for small dataframes. Aggregated plots
+            only apply LAYOUT_KWARGS (title, width, ...) and warn about others.
+
+    Returns:
+        go.Figure: px.violin(df, points="all", ...) for small dataframes. Else
+            one filled density outline, one box (with precomputed quartiles) and
+            one trace of outliers per category at x positions 0, 1, 2, ...
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    labels = labels or {}
+    categories = list((category_orders or {}).get(x, df[x].dropna().unique()))
+    if len(df) <= (AGGREGATE_ROWS if max_rows is None else max_rows):
+        return px.violin(
+            df,
+            x=x,
+            y=y,
+            color=x,
+            labels=labels,
+            points="all",
+            hover_name=hover_name,
+            hover_data=list(hover_data),
+            category_orders={x: categories},
+            log_y=log_y,
+            **kwargs,
+        ).update_traces(jitter=jitter)
+
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    hover_template = _hover_template(x, y, hover_data, labels, hover_name)
+    for idx, category in enumerate(categories):
+        color = colors[idx % len(colors)]
+        df_cat = df[df[x] == category]
+        values = df_cat[y].to_numpy(dtype=float)
+        mask = _valid(values, log_y)
+        values = np.log10(values[mask]) if log_y else values[mask]
+        if len(values) == 0:
+            continue
+
+        grid, density = gaussian_kde(values)
+        y_grid = 10**grid if log_y else grid
+        width = 0.4 * density / density.max()
+        fig.add_scatter(
+            x=np.concatenate([idx + width, (idx - width)[::-1]]),
+            y=np.concatenate([y_grid, y_grid[::-1]]),
+            fill="toself",
+            mode="lines",
+            line=dict(color=color, width=1),
+            opacity=0.5,
+            name=str(category),
+            legendgroup=str(category),
+            hoverinfo="skip",
+        )
+        stats = box_stats(values)
+        if log_y:
+            stats = {key: 10**val for key, val in stats.items()}
+        fig.add_box(
+            x=[idx],
+            **{key: [val] for key, val in stats.items()},
+            width=0.08,
+            line=dict(color=color),
+            boxpoints=False,
+            name=str(category),
+            legendgroup=str(category),
+            showlegend=False,
+        )
+
+        raw = 10**values if log_y else values
+        outlier_idx = np.flatnonzero(
+            (raw < stats["lowerfence"]) | (raw > stats["upperfence"])
+        )
+        outlier_idx = _sample(outlier_idx, n_outliers, seed=idx)
+        if len(outlier_idx) == 0:
+            continue
+        df_out = df_cat[mask].iloc[outlier_idx]
+        rng = np.random.default_rng(idx)
+        fig.add_scatter(
+            x=idx + rng.uniform(-0.2, 0.2, len(df_out)) * jitter,
+            y=df_out[y],
+            mode="markers",
+            marker=dict(color=color, size=4),
+            hovertext=df_out[hover_name] if hover_name else None,
+            customdata=df_out[list(hover_data)] if hover_data else None,
+            hovertemplate=hover_template,
+            name=str(category),
+            legendgroup=str(category),
+            showlegend=False,
+        )
+
+    fig.update_layout(
+        xaxis=dict(
+            title=labels.get(x, x),
+            tickvals=list(range(len(categories))),
+            ticktext=list(map(str, categories)),
+        ),
+        yaxis=dict(title=labels.get(y, y), type="log" if log_y else "linear"),
+    )
+    _update_layout(fig, "violin", kwargs)
+    return fig
+
+
+def scatter(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    labels: dict[str, str] | None = None,
+    hover_name: str | None = None,
+    hover_data: Sequence[str] = (),
+    log_x: bool = False,
+    log_y: bool = False,
+    range_x: Sequence[float] | None = None,
+    range_y: Sequence[float] | None = None,
+    max_rows: int | None = None,
+    bins: int = 200,
+    max_outlier_count: int = 2,
+    n_outliers: int = 1000,
+    **kwargs: Any,
+) -> go.Figure:
+    """Scatter plot of df[y] vs df[x].
+
+    Args:
+        df (pd.DataFrame): Data to plot.
+        x (str): Column for the x axis.
+        y (str): Column for the y axis.
+        labels (dict[str, str], optional): Axis and hover labels by column name.
+        hover_name (str, optional): Column shown in bold in hover tooltips.
+        hover_data (Sequence[str]): Extra columns shown in hover tooltips.
+        log_x (bool): Log-scale x axis (with logarithmic bins).
+        log_y (bool): Log-scale y axis (with logarithmic bins).
+        range_x (Sequence[float], optional): x axis range. Aggregated plots only
+            bin points inside it.
+        range_y (Sequence[float], optional): y axis range, like range_x.
+        max_rows (int, optional): Above this many rows, plot a heatmap of point
+            counts instead of all points. Defaults to AGGREGATE_ROWS.
+        bins (int): Number of bins along each axis of the heatmap. Defaults to 200.
+        max_outlier_count (int): Points in bins with at most this many points
+            are also drawn as markers so they keep their hover info. Defaults to
+            2.
+        n_outliers (int): Max number of such markers. Defaults to 1000.
+        **kwargs: Passed to px.scatter() for small dataframes, e.g. color or
+            size. Aggregated plots only apply LAYOUT_KWARGS (title, width, ...)
+            and warn about others.
+
+    Returns:
+        go.Figure: px.scatter(df, ...) for small dataframes. Else a heatmap of
+            counts plus a sample of points from sparse bins.
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    labels = labels or {}
+    if len(df) <= (AGGREGATE_ROWS if max_rows is None else max_rows):
+        return px.scatter(
+            df,
+            x=x,
+            y=y,
+            labels=labels,
+            hover_name=hover_name,
+            hover_data=list(hover_data),
+            log_x=log_x,
+            log_y=log_y,
+            range_x=range_x,
+            range_y=range_y,
+            **kwargs,
+        )
+
+    x_vals, y_vals = df[x].to_numpy(dtype=float), df[y].to_numpy(dtype=float)
+    counts, x_edges, y_edges = binned_counts(
+        x_vals, y_vals, bins, log_x, log_y, range_x, range_y
+    )
+    # plot bin centers in the space of their axis
+    x_centers, y_centers = (
+        np.sqrt(edges[1:] * edges[:-1]) if log else (edges[1:] + edges[:-1]) / 2
+        for edges, log in ((x_edges, log_x), (y_edges, log_y))
+    )
+    fig = go.Figure(
+        go.Heatmap(
+            x=x_centers,
+            y=y_centers,
+            z=np.where(counts > 0, counts, np.nan).T,
+            colorscale="Viridis",
+            colorbar=dict(title="Count"),
+            hovertemplate=f"{labels.get(x, x)}=%{{x:.3g}}<br>"
+            f"{labels.get(y, y)}=%{{y:.3g}}<br>Count=%{{z}}<extra></extra>",
+        )
+    )
+
+    mask = _valid(x_vals, log_x, range_x) & _valid(y_vals, log_y, range_y)
+    row_idx = np.flatnonzero(mask)
+    x_bin = np.clip(np.searchsorted(x_edges, x_vals[mask], "right") - 1, 0, bins - 1)
+    y_bin = np.clip(np.searchsorted(y_edges, y_vals[mask], "right") - 1, 0, bins - 1)
+    sparse = counts[x_bin, y_bin] <= max_outlier_count
+    df_out = df.iloc[_sample(row_idx[sparse], n_outliers)]
+    if len(df_out) > 0:
+        fig.add_scatter(
+            x=df_out[x],
+            y=df_out[y],
+            mode="markers",
+            marker=dict(color="black", size=4, opacity=0.6),
+            hovertext=df_out[hover_name] if hover_name else None,
+            customdata=df_out[list(hover_data)] if hover_data else None,
+            hovertemplate=_hover_template(x, y, hover_data, labels, hover_name),
+            showlegend=False,
+        )
+
+    fig.update_layout(
+        xaxis=dict(title=labels.get(x, x), type="log" if log_x else "linear"),
+        yaxis=dict(title=labels.get(y, y), type="log" if log_y else "linear"),
+    )
+    if range_x is not None:
+        fig.update_xaxes(range=np.log10(range_x) if log_x else range_x)
+    if range_y is not None:
+        fig.update_yaxes(range=np.log10(range_y) if log_y else range_y)
+    _update_layout(fig, "scatter", kwargs)
+    return fig
@@ -0,0 +1,391 @@
+"""Benchmarks for the featurization stages shared by the analyze_*.py scripts.
+
+Each stage (dataset load, space group detection, Wyckoff labels, neighbor lists,
+composition parsing, plot rendering) runs on synthetic datasets of several sizes,
+so no downloads are needed and results are comparable across machines and runs.
+Every (stage, size) case runs in a fresh process. Its throughput, the peak memory
+it allocated in that process (sampled while the stage runs) and the peak memory of
+its largest worker process (if any) are reported and compared with a stored
+baseline.
+The exit code is 1 if any case got slower or used more memory than the baseline by
+more than a threshold.
+
+    python -m mat_eda.bench --sizes 1000 10000  # compare to baseline
+    python -m mat_eda.bench --save-baseline  # record current results as baseline
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Callable, Iterator, Sequence
+
+import numpy as np
+from pymatgen.core import Lattice, Structure
+
+from mat_eda.cache import CACHE_DIR
+from mat_eda.structures import StructureBatch
+
+
+BASELINE_PATH = f"{CACHE_DIR}/benchmarks/baseline.json"
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+# (space group, lattice type, Wyckoff site coords) of common prototypes
+PROTOTYPES: list[tuple[str, str, list[list[float]]]] = [
+    ("Fm-3m", "cubic", [[0, 0, 0], [0.5, 0.5, 0.5]]),  # rock salt
+    ("Pm-3m", "cubic", [[0, 0, 0], [0.5, 0.5, 0.5], [0.5, 0.5, 0]]),  # perovskite
+    ("Fd-3m", "cubic", [[0, 0, 0]]),  # diamond
+    ("Im-3m", "cubic", [[0, 0, 0]]),  # bcc
+    ("P6_3/mmc", "hexagonal", [[1 / 3, 2 / 3, 0.25]]),  # hcp
+    ("F-43m", "cubic", [[0, 0, 0], [0.25, 0.25, 0.25]]),  # zinc blende
+    ("I4/mmm", "tetragonal", [[0, 0, 0], [0, 0, 0.35]]),
+    ("P4/mmm", "tetragonal", [[0, 0, 0], [0.5, 0.5, 0.5], [0, 0.5, 0.5]]),
+]
+SPECIES = ["Li", "Na", "K", "Mg", "Ca", "Sr", "Ba", "Ti", "Fe", "Co", "Ni", "Cu"]
+SPECIES += ["Zn", "Al", "Ga", "Si", "Ge", "Sn", "O", "S", "Se", "N", "F", "Cl"]
+
+
+def synthetic_structures(n_structures: int, seed: int = 0) -> StructureBatch:
+    """Deterministic set of structures built from common prototypes with random
+    elements and lattice constants. Every other structure has its sites randomly
+    displaced, lowering its symmetry like real relaxed structures.
+
+    Args:
+        n_structures (int): Number of structures.
+        seed (int): Random seed. Defaults to 0.
+
+    Returns:
+        StructureBatch: Synthetic structures.
+    """
+    rng = np.random.default_rng(seed)
+    templates = []
+    for spg, lattice_type, coords in PROTOTYPES:
+        if lattice_type == "cubic":
+            lattice = Lattice.cubic(1)
+        elif lattice_type == "hexagonal":
+            lattice = Lattice.hexagonal(1, 1.63)
+        else:
+            lattice = Lattice.tetragonal(1, 1.4)
+        species = SPECIES[: len(coords)]
+        templates.append(Structure.from_spacegroup(spg, lattice, species, coords))
+
+    structures = []
+    for idx in range(n_structures):
+        template = templates[idx % len(templates)]
+        n_elems = len(set(template.species))
+        elems = rng.choice(SPECIES, size=n_elems, replace=False)
+        # scale lattice so each site gets ~15 Angstrom^3 (~12 neighbors within 5 A)
+        scale = (15 * len(template) / template.volume) ** (1 / 3)
+        scale *= rng.uniform(0.95, 1.05)
+        species_map = dict(zip(sorted(set(template.species)), elems))
+        frac_coords = template.frac_coords
+        if idx % 2:
+            frac_coords = frac_coords + rng.normal(0, 0.01, frac_coords.shape)
+        structures.append(
+            Structure(
+                Lattice(template.lattice.matrix * scale),
+                [species_map[site.specie] for site in template],
+                frac_coords,
+            )
+        )
+    return StructureBatch.from_structures(structures)
+
+
+def _bench_load(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    import pandas as pd
+
+    tmp_dir = f"{CACHE_DIR}/benchmarks/load-{len(batch)}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    formulas = batch.formulas()
+    pd.DataFrame({"formula": formulas, "target": np.arange(len(batch))}).to_parquet(
+        f"{tmp_dir}/table.parquet"
+    )
+    batch.save(f"{tmp_dir}/structures")
+
+    def run() -> Any:
+        df = pd.read_parquet(f"{tmp_dir}/table.parquet")
+        return df, StructureBatch.load(f"{tmp_dir}/structures")
+
+    return run
+
+
+def _bench_spacegroups(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    from mat_eda.featurize import get_spacegroups
+
+    structures = batch.to_structures()
+    return lambda: get_spacegroups(structures, cache=False, n_jobs=n_jobs)
+
+
+def _bench_wyckoff(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    # fail during setup rather than in the timed run if aviary isn't installed
+    from aviary.wren.utils import get_aflow_label_spglib  # noqa: F401
+
+    from mat_eda.featurize import get_wyckoff_labels
+
+    structures = batch.to_structures()
+    return lambda: get_wyckoff_labels(structures, cache=False, n_jobs=n_jobs)
+
+
+def _bench_symmetry(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    from mat_eda.featurize import get_symmetry_info
+
+    structures = batch.to_structures()
+    return lambda: get_symmetry_info(structures, cache=False, n_jobs=n_jobs)
+
+
+def _bench_neighbors(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    from mat_eda.neighbors import get_neighbor_lists
+
+    return lambda: get_neighbor_lists(batch, r=5, n_jobs=n_jobs)
+
+
+def _bench_composition(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    from mat_eda.composition import element_count_matrix, element_prevalence
+
+    formulas = batch.formulas()
+    return lambda: element_prevalence(element_count_matrix(formulas, cache=False))
+
+
+def _bench_plot(batch: StructureBatch, n_jobs: int) -> Callable[[], Any]:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    volumes, n_sites = batch.volumes, batch.n_sites
+
+    def run() -> Any:
+        # histogram + scatter saved to PDF like the analyze_*.py scripts do
+        fig, (ax1, ax2) = plt.subplots(1, 2)
+        ax1.hist(volumes, bins=50, log=True)
+        ax2.scatter(n_sites, volumes, s=1)
+        fig.savefig(io.BytesIO(), format="pdf")
+        plt.close(fig)
+
+    return run
+
+
+# each returns a zero-argument function running the stage on a batch of structures
+# so that setup (e.g. building pymatgen objects) isn't part of the timing
+BENCHMARKS: dict[str, Callable[[StructureBatch, int], Callable[[], Any]]] = {
+    "load": _bench_load,
+    "spacegroups": _bench_spacegroups,
+    "wyckoff": _bench_wyckoff,
+    "symmetry": _bench_symmetry,
+    "neighbors": _bench_neighbors,
+    "composition": _bench_composition,
+    "plot": _bench_plot,
+}
+
+
+def _max_rss_mb(who: int) -> float:
+    # ru_maxrss is in KB on Linux but in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * unit / 1024**2
+
+
+def _rss() -> float:
+    """Current resident memory of this process in MB. Without procfs (e.g. on
+    macOS) this is the process's peak so far, so decreases aren't seen.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            n_pages = int(file.read().split()[1])
+        return n_pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except OSError:
+        return _max_rss_mb(resource.RUSAGE_SELF)
+
+
+def _children_max_rss() -> float:
+    """Peak resident memory in MB of the largest terminated child process (e.g.
+    pool workers). 0 if there were none.
+    """
+    return _max_rss_mb(resource.RUSAGE_CHILDREN)
+
+
+@contextmanager
+def _track_peak_rss(interval: float = 0.005) -> Iterator[dict[str, float]]:
+    """Sample this process's memory in a background thread while the context is
+    open. Yields a dict whose "peak_mb" is the largest increase over the memory in
+    use when entering (set on exit). Unlike ru_maxrss, which is a high-water mark
+    of the whole process, this isn't masked by memory that setup code (e.g.
+    building the synthetic structures) used and freed before the stage.
+    """
+    start_rss = _rss()
+    result = dict(peak_mb=0.0)
+    stop = threading.Event()
+
+    def sample() -> None:
+        peak = start_rss
+        while not stop.wait(interval):
+            peak = max(peak, _rss())
+        result["peak_mb"] = max(peak, _rss()) - start_rss
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        yield result
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _run_case(stage: str, size: int, n_jobs: int) -> dict[str, Any]:
+    """Time one stage on one dataset size. Runs in a fresh process so worker
+    processes started by the stage are the only children.
+    """
+    batch = synthetic_structures(size)
+    try:
+        run = BENCHMARKS[stage](batch, n_jobs)
+    except ImportError as exc:
+        return dict(stage=stage, size=size, skipped=f"missing dependency: {exc}")
+    with _track_peak_rss() as memory:
+        start = perf_counter()
+        run()
+        seconds = perf_counter() - start
+    # absolute, unlike peak_mem_mb, since workers start with the imports and
+    # pickled inputs they need
+    worker_peak_mb = _children_max_rss()
+    return dict(
+        stage=stage,
+        size=size,
+        seconds=seconds,
+        throughput=size / seconds,
+        # memory allocated by the stage in this process (sampled, so very short
+        # spikes can be missed)
+        peak_mem_mb=memory["peak_mb"],
+        worker_peak_mem_mb=worker_peak_mb or None,
+    )
+
+
+def run_benchmarks(
+    stages: Sequence[str] = tuple(BENCHMARKS),
+    sizes: Sequence[int] = DEFAULT_SIZES,
+    n_jobs: int = 1,
+) -> list[dict[str, Any]]:
+    """Run every stage at every size, each case in a new process.
+
+    Args:
+        stages (Sequence[str]): Names of BENCHMARKS to run. Defaults to all.
+        sizes (Sequence[int]): Number of structures. Defaults to DEFAULT_SIZES.
+        n_jobs (int): Worker processes for stages that support parallelism.
+            Defaults to 1 to measure single-core throughput.
+
+    Returns:
+        list[dict]: One result per case with keys stage, size, seconds, throughput
+            (structures per second), peak_mem_mb (increase in the benchmark
+            process) and worker_peak_mem_mb (resident memory of the largest
+            worker process, None if the stage started none), or skipped if the
+            stage's optional dependency isn't installed.
+    """
+    results = []
+    for size in sizes:
+        for stage in stages:
+            with ProcessPoolExecutor(1) as executor:
+                result = executor.submit(_run_case, stage, size, n_jobs).result()
+            if "skipped" in result:
+                print(f"{stage:>12} {size:>8,}  skipped ({result['skipped']})")
+            else:
+                worker_mem = result["worker_peak_mem_mb"]
+                print(
+                    f"{stage:>12} {size:>8,}  {result['seconds']:8.2f} s  "
+                    f"{result['throughput']:10,.0f} /s  "
+                    f"{result['peak_mem_mb']:8.1f} MB"
+                    + ("" if worker_mem is None else f"  (workers {worker_mem:.1f} MB)")
+                )
+            results.append(result)
+    return results
+
+
+def find_regressions(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    threshold: float = 0.2,
+) -> list[str]:
+    """Compare results to a baseline.
+
+    Args:
+        results (list[dict]): As returned by run_benchmarks().
+        baseline (list[dict]): Earlier results of run_benchmarks().
+        threshold (float): Allowed relative drop in throughput or increase in peak
+            memory. Defaults to 0.2, i.e. 20%.
+
+    Returns:
+        list[str]: Descriptions of all regressions. Empty if none.
+    """
+    baseline_cases = {(res["stage"], res["size"]): res for res in baseline}
+    regressions = []
+    for res in results:
+        base = baseline_cases.get((res["stage"], res["size"]))
+        if base is None or "skipped" in res or "skipped" in base:
+            continue
+        case = f"{res['stage']} (n={res['size']:,})"
+        if res["throughput"] < base["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{case} throughput {res['throughput']:,.0f}/s < baseline "
+                f"{base['throughput']:,.0f}/s"
+            )
+        for key, label in (
+            ("peak_mem_mb", "peak memory"),
+            ("worker_peak_mem_mb", "worker peak memory"),
+        ):
+            if res.get(key) is None or base.get(key) is None:
+                continue
+            # ignore memory differences too small to measure reliably
+            if res[key] > base[key] * (1 + threshold) + 5:
+                regressions.append(
+                    f"{case} {label} {res[key]:,.1f} MB > baseline "
+                    f"{base[key]:,.1f} MB"
+                )
+    return regressions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Command line entry point. Returns exit code 1 on regressions."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--stages", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS)
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES))
+    parser.add_argument("-j", "--n-jobs", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Allowed relative regression"
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store results as the new baseline instead of comparing",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.stages, args.sizes, args.n_jobs)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print(f"No baseline at {args.baseline}, create one with --save-baseline")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}", file=sys.stderr)
+    return int(bool(regressions))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,228 @@
+"""Persistent content-addressed cache for expensive per-structure results like space
+groups and Wyckoff labels.
+
+Keys are canonical hashes of a structure's lattice, species and fractional
+coordinates (plus any settings like symprec that affect the result), so identical
+structures share cache entries across datasets, e.g. matbench_log_gvrh and
+matbench_log_kvrh or matbench_mp_gap and matbench_mp_e_form.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Iterable
+
+import numpy as np
+from pymatgen.core import Structure
+
+from mat_eda import ROOT
+from mat_eda.structures import ELEMENT_SYMBOLS, StructureBatch
+
+
+CACHE_DIR = os.getenv("MAT_EDA_CACHE_DIR", f"{ROOT}/.cache")
+
+
+def structure_hash(struct: Structure, decimals: int = 6, **settings: Any) -> str:
+    """Canonical hash of a structure that is invariant to site order and to
+    fractional coordinates differing by lattice translations. Like StructureBatch,
+    it only considers the element of each site (not its oxidation state), so
+    Structures and StructureBatches share cache entries.
+
+    Args:
+        struct (Structure): pymatgen Structure.
+        decimals (int): Lattice parameters and coordinates are rounded to this many
+            decimals before hashing to absorb floating point noise. Defaults to 6.
+        **settings: Extra parameters that affect the cached result (e.g.
+            symprec=0.01). Included in the hash so different settings don't collide.
+
+    Returns:
+        str: Hex digest.
+    """
+    # disordered sites can't be in a StructureBatch, keep their full composition
+    species = [
+        site.specie.symbol if site.is_ordered else site.species_string
+        for site in struct
+    ]
+    return _sites_hash(
+        struct.lattice.matrix, species, struct.frac_coords, decimals, settings
+    )
+
+
+def batch_hashes(
+    batch: StructureBatch, decimals: int = 6, **settings: Any
+) -> list[str]:
+    """structure_hash() of every structure in a batch without building pymatgen
+    Structures. Equal to structure_hash() of the Structures the batch was built
+    from (with or without oxidation states), so both share cache entries.
+    """
+    offsets = batch.offsets
+    return [
+        _sites_hash(
+            batch.lattices[idx],
+            [
+                ELEMENT_SYMBOLS[Z]
+                for Z in batch.atomic_nums[offsets[idx] : offsets[idx + 1]]
+            ],
+            batch.frac_coords[offsets[idx] : offsets[idx + 1]],
+            decimals,
+            settings,
+        )
+        for idx in range(len(batch))
+    ]
+
+
+def _sites_hash(
+    lattice: np.ndarray,
+    species: list[str],
+    frac_coords: np.ndarray,
+    decimals: int,
+    settings: dict[str, Any],
+) -> str:
+    frac_coords = np.round(frac_coords % 1, decimals) % 1
+    sites = sorted(zip(species, map(tuple, frac_coords.tolist())))
+
+    hasher = hashlib.blake2b(digest_size=20)
+    # adding 0.0 turns -0.0 into 0.0, which has different bytes
+    hasher.update((np.round(lattice, decimals) + 0.0).tobytes())
+    hasher.update(json.dumps(sites).encode())
+    hasher.update(json.dumps(settings, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+class DiskCache:
+    """SQLite-backed key-value store with size-bounded least-recently-used eviction.
+
+    Values must be JSON-serializable. Lookups are batched so a whole dataset can be
+    checked in a single query.
+    """
+
+    def __init__(
+        self,
+        path: str = f"{CACHE_DIR}/symmetry.sqlite",
+        max_size: int = 500 * 1024**2,
+    ) -> None:
+        """
+        Args:
+            path (str): SQLite database file. Created if missing.
+            max_size (int): Max total size of stored values in bytes. Least recently
+                used entries are evicted once exceeded. Defaults to 500 MB.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self.hits = self.misses = self.evictions = 0
+
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, "
+            "size INTEGER, last_used REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_used ON cache (last_used)"
+        )
+        self._conn.commit()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.path!r}, {self.stats()})"
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        query = "SELECT 1 FROM cache WHERE key = ?"
+        return self._conn.execute(query, (key,)).fetchone() is not None
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Look up many keys at once. Missing keys are absent from the returned dict.
+        Updates hit/miss counts and marks found entries as recently used.
+        """
+        keys = list(dict.fromkeys(keys))
+        found: dict[str, Any] = {}
+        # stay below SQLite's default limit on the number of query parameters
+        for start in range(0, len(keys), 900):
+            batch = keys[start : start + 900]
+            query = (
+                "SELECT key, value FROM cache WHERE key IN "
+                f"({', '.join('?' * len(batch))})"
+            )
+            for key, value in self._conn.execute(query, batch):
+                found[key] = json.loads(value)
+
+        now = time.time()
+        self._conn.executemany(
+            "UPDATE cache SET last_used = ? WHERE key = ?",
+            [(now, key) for key in found],
+        )
+        self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Look up a single key."""
+        return self.get_many([key]).get(key, default)
+
+    def set_many(self, items: dict[str, Any]) -> None:
+        """Store many key-value pairs at once, then evict least recently used
+        entries if the cache grew beyond max_size.
+        """
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            serialized = json.dumps(value)
+            rows.append((key, serialized, len(serialized), now))
+        self._conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+        self._conn.commit()
+        self._evict()
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a single key-value pair."""
+        self.set_many({key: value})
+
+    def size(self) -> int:
+        """Total size of stored values in bytes."""
+        query = "SELECT COALESCE(SUM(size), 0) FROM cache"
+        return self._conn.execute(query).fetchone()[0]
+
+    def _evict(self) -> None:
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return
+        stale = []
+        query = "SELECT key, size FROM cache ORDER BY last_used"
+        for key, size in self._conn.execute(query):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", stale)
+        self._conn.commit()
+        self.evictions += len(stale)
+
+    def clear(self) -> None:
+        """Delete all entries and reset statistics."""
+        self._conn.execute("DELETE FROM cache")
+        self._conn.commit()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Hit/miss/eviction counts since this instance was created plus current
+        number of entries and size on disk.
+        """
+        n_lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / n_lookups if n_lookups else 0,
+            evictions=self.evictions,
+            entries=len(self),
+            size=self.size(),
+        )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        self._conn.close()
@@ -0,0 +1,106 @@
+"""Out-of-core analysis of datasets with bounded memory.
+
+load_dataset() followed by add_features() holds all structures and derived
+columns of a dataset in memory at once (several GB for matbench_mp_e_form on
+workers with little RAM). aggregate_dataset() instead streams the dataset in
+fixed-size chunks of rows (see iter_dataset()), adds derived columns to each
+chunk, reduces the chunk to mergeable aggregates (histograms, moments and
+quantiles from mat_eda.stats, per-element totals from mat_eda.composition) and
+drops it before reading the next one. Peak memory then depends on the chunk size
+(MAT_EDA_CHUNK_SIZE, default 10,000 rows), not on the dataset size.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from mat_eda import trace
+from mat_eda.composition import ElementSums, element_count_matrix
+from mat_eda.data import DATASET_ROW_GROUP_SIZE, iter_dataset
+from mat_eda.features import DATASET_FEATURES, add_features
+from mat_eda.stats import DatasetSummary
+from mat_eda.structures import N_ELEMENTS
+
+
+CHUNK_SIZE = int(os.getenv("MAT_EDA_CHUNK_SIZE", DATASET_ROW_GROUP_SIZE))
+
+
+@dataclass
+class DatasetAggregates:
+    """Everything aggregate_dataset() keeps of a dataset."""
+
+    n_rows: int
+    stats: DatasetSummary  # of all numeric columns incl. derived ones
+    elements: ElementSums  # see ElementSums.prevalence() and .target_means()
+    kept: pd.DataFrame  # the columns passed as keep, for all rows
+
+
+def aggregate_dataset(
+    name: str,
+    groups: Sequence[str] | None = None,
+    target: str | None = None,
+    formula_col: str | None = None,
+    keep: Sequence[str] = (),
+    chunk_size: int | None = None,
+    columns: Sequence[str] | None = None,
+    **kwargs: Any,
+) -> DatasetAggregates:
+    """Aggregate a dataset and its derived columns one chunk of rows at a time.
+
+    Args:
+        name (str): matminer dataset name, e.g. "matbench_mp_e_form".
+        groups (Sequence[str], optional): Feature groups (keys of
+            mat_eda.features.FEATURE_GROUPS) to add to each chunk. Defaults to
+            DATASET_FEATURES[name].
+        target (str, optional): Column to average per element (see
+            ElementSums.target_means()).
+        formula_col (str, optional): Column of formula strings to count elements
+            in for datasets without structures.
+        keep (Sequence[str]): Columns (raw or derived) to keep for every row,
+            e.g. for scatter plots. Memory grows with the dataset for these.
+        chunk_size (int, optional): Rows per chunk. Defaults to CHUNK_SIZE.
+        columns (Sequence[str], optional): Only read these non-structure columns.
+        **kwargs: Passed to add_features(), e.g. n_jobs.
+
+    Returns:
+        DatasetAggregates: Row count, column stats, element totals and kept
+            columns.
+    """
+    if groups is None:
+        groups = DATASET_FEATURES.get(name, ())
+    stats, elements, kept, n_rows = DatasetSummary(), None, [], 0
+
+    with trace.span("aggregate_dataset", dataset=name) as span:
+        for df, structures in iter_dataset(name, chunk_size or CHUNK_SIZE, columns):
+            add_features(df, structures, groups, **kwargs)
+            stats.update(df)
+            if structures is not None:
+                counts = structures.element_counts()
+            elif formula_col is not None:
+                counts = element_count_matrix(df[formula_col])
+            else:
+                raise ValueError(f"{name} has no structures, pass formula_col")
+            chunk_elements = ElementSums.from_counts(
+                counts, None if target is None else df[target]
+            )
+            elements = (
+                chunk_elements if elements is None else elements.merge(chunk_elements)
+            )
+            if keep:
+                kept.append(df[list(keep)])
+            n_rows += len(df)
+        span.set(items=n_rows)
+
+    if elements is None:  # empty dataset
+        elements = ElementSums.from_counts(csr_matrix((0, N_ELEMENTS)))
+    return DatasetAggregates(
+        n_rows=n_rows,
+        stats=stats,
+        elements=elements,
+        kept=pd.concat(kept) if kept else pd.DataFrame(),
+    )
@@ -0,0 +1,195 @@
+"""Shrink a dataframe to a compact typed schema before writing it to disk.
+
+Tables like ricci_boltztrap_mp_tabular store numbers as strings with units
+("12.3 µV/K") and all other values as float64 or Python objects. Stripping units
+one column at a time with str.replace() and astype(float) runs a regex and a parse
+per column. compact_dataframe() instead:
+
+- strips units from all unit-suffixed columns at once: they are concatenated into
+  one Arrow string array that is regex-replaced and cast to float in single
+  vectorized Arrow kernels
+- downcasts float64 columns to float32 where float32 holds every value to the
+  column's observed decimal precision, e.g. 12.345 in a column of values with at
+  most 3 decimal places, or integer-valued columns (IDs, counts) up to 2**24
+- turns string columns with few distinct values (e.g. the DFT functional) into
+  categoricals
+
+and returns a memory report (per-column dtype and bytes before and after, noting
+float columns that were kept as float64). Parquet keeps float32 and categorical
+dtypes, see mat_eda.data.save_columnar().
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+def strip_units(
+    df: pd.DataFrame, columns: Sequence[str], units: Sequence[str]
+) -> pd.DataFrame:
+    """Parse columns of strings like "12.3 µV/K" into floats (in place).
+
+    Args:
+        df (pd.DataFrame): Table to convert.
+        columns (Sequence[str]): Columns holding numbers with unit suffixes.
+        units (Sequence[str]): All units that may follow the numbers.
+
+    Raises:
+        pyarrow.ArrowInvalid: If a value isn't a number after stripping its unit.
+
+    Returns:
+        pd.DataFrame: df
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = list(columns)
+    if not columns or df.empty:
+        return df
+    # longest first so e.g. µV/K is stripped as a whole rather than just its K
+    alternatives = "|".join(map(re.escape, sorted(units, key=len, reverse=True)))
+    stacked = pa.chunked_array([pa.array(df[col].astype("string")) for col in columns])
+    numbers = pc.cast(
+        pc.replace_substring_regex(stacked, rf"\s*(?:{alternatives})?\s*$", ""),
+        pa.float64(),
+    )
+    values = numbers.to_numpy().reshape(len(columns), len(df))
+    for col, col_values in zip(columns, values):
+        df[col] = col_values
+    return df
+
+
+def decimal_places(values: np.ndarray, max_decimals: int = 15) -> int | None:
+    """Fewest decimal places that represent all finite values exactly, e.g. 2 for
+    [1.5, 0.25]. None if more than max_decimals are needed (e.g. computed values
+    with full float64 precision).
+
+    >>> decimal_places(np.array([1.5, 0.25, np.nan]))
+    2
+    >>> decimal_places(np.array([1 / 3]))
+    """
+    finite = values[np.isfinite(values)]
+    for decimals in range(max_decimals + 1):
+        if np.array_equal(np.round(finite, decimals), finite):
+            return decimals
+    return None
+
+
+def downcast_floats(
+    df: pd.DataFrame, columns: Sequence[str] | None = None
+) -> list[str]:
+    """Convert float64 columns to float32 (in place) where no value loses precision.
+
+    A relative tolerance can't tell whether float32 is enough: its rounding error
+    (~6e-8) is below any useful tolerance, so every in-range value would pass
+    while a value like 123456.783 silently becomes 123456.78125. Instead, a
+    column is only downcast if rounding its float32 values to the column's
+    observed decimal places (see decimal_places()) recovers every value exactly.
+    This keeps measured or tabulated values with few significant digits as
+    float32 and rejects computed values with full float64 precision and integers
+    (e.g. IDs) beyond 2**24, e.g. 123456789.0 would become 123456792.0.
+
+    Args:
+        df (pd.DataFrame): Table to convert.
+        columns (Sequence[str], optional): Columns to consider. Defaults to all
+            float64 columns.
+
+    Returns:
+        list[str]: Names of downcast columns. The other columns considered are
+            kept as float64.
+    """
+    if columns is None:
+        columns = df.select_dtypes(include="float64").columns
+    downcast = []
+    for col in columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        decimals = decimal_places(values)
+        if decimals is None:
+            continue
+        with np.errstate(over="ignore"):
+            values32 = values.astype(np.float32)
+        restored = np.round(values32.astype(np.float64), decimals)
+        if not np.array_equal(restored, values, equal_nan=True):
+            continue
+        df[col] = values32
+        downcast.append(col)
+    return downcast
+
+
+def to_categoricals(
+    df: pd.DataFrame, max_unique_frac: float = 0.5, min_rows: int = 1
+) -> list[str]:
+    """Convert string columns with few distinct values to categoricals (in place).
+
+    Args:
+        df (pd.DataFrame): Table to convert.
+        max_unique_frac (float): Only convert columns with at most this many
+            distinct values per row. Defaults to 0.5.
+        min_rows (int): Skip tables with fewer rows. Defaults to 1.
+
+    Returns:
+        list[str]: Names of converted columns.
+    """
+    converted = []
+    if len(df) < min_rows:
+        return converted
+    for col in df.select_dtypes(include=["object", "string"]):
+        if pd.api.types.infer_dtype(df[col], skipna=True) != "string":
+            continue
+        if df[col].nunique() <= max_unique_frac * len(df):
+            df[col] = df[col].astype("category")
+            converted.append(col)
+    return converted
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Dtype and memory in bytes (including Python objects) of each column before
+    and after conversion, plus a total row.
+    """
+    report = pd.DataFrame(
+        {
+            "dtype_before": before.dtypes.astype(str),
+            "bytes_before": before.memory_usage(deep=True, index=False),
+            "dtype_after": after.dtypes.astype(str),
+            "bytes_after": after.memory_usage(deep=True, index=False),
+        }
+    )
+    report.loc["total"] = ["", report.bytes_before.sum(), "", report.bytes_after.sum()]
+    report["ratio"] = report.bytes_after / report.bytes_before
+    return report
+
+
+def compact_dataframe(
+    df: pd.DataFrame,
+    unit_columns: Sequence[str] = (),
+    units: Sequence[str] = (),
+    max_unique_frac: float = 0.5,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Strip units, downcast floats and convert repeated strings to categoricals.
+
+    Args:
+        df (pd.DataFrame): Table to convert. Not modified.
+        unit_columns (Sequence[str]): Columns of numbers with unit suffixes, see
+            strip_units().
+        units (Sequence[str]): Units to strip from unit_columns.
+        max_unique_frac (float): See to_categoricals(). Defaults to 0.5.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: Compact copy of df and its
+            memory_report() with a note column marking float columns kept as
+            float64 because float32 would lose precision.
+    """
+    compact = df.copy()
+    strip_units(compact, unit_columns, units)
+    float_cols = compact.select_dtypes(include="float64").columns
+    downcast = downcast_floats(compact, float_cols)
+    to_categoricals(compact, max_unique_frac)
+    report = memory_report(df, compact)
+    report["note"] = ""
+    rejected = [col for col in float_cols if col not in downcast]
+    report.loc[rejected, "note"] = "kept float64 (float32 loses precision)"
+    return compact, report
@@ -0,0 +1,251 @@
+"""Sparse element-count matrices for fast composition statistics.
+
+Parsing formula strings row by row (as ptable_heatmap(df.formula) and
+count_elements() do) is slow for datasets with 100k+ rows. element_count_matrix()
+parses each unique formula once into a sparse (n_materials, 118) matrix (column j
+is the element with atomic number j + 1) and caches the result on disk (evicting
+least recently used results beyond COMPOSITION_CACHE_MAX_SIZE). Elemental
+prevalence, per-element target means and element co-occurrence are then sparse
+matrix reductions.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Literal, Sequence
+
+import numpy as np
+import pandas as pd
+from pymatgen.core import Composition, Element
+from scipy.sparse import csr_matrix, load_npz, save_npz
+
+from mat_eda import trace
+from mat_eda.cache import CACHE_DIR
+from mat_eda.structures import N_ELEMENTS
+
+
+ELEMENTS = [Element.from_Z(Z).symbol for Z in range(1, N_ELEMENTS + 1)]
+COMPOSITION_CACHE_DIR = f"{CACHE_DIR}/compositions"
+# total bytes of cached matrices, like DiskCache's max_size
+COMPOSITION_CACHE_MAX_SIZE = 500 * 1024**2
+
+CountMode = Literal["composition", "fractional", "occurrence"]
+
+
+def _parse_formulas(formulas: Sequence[str | None]) -> csr_matrix:
+    codes, uniques = pd.factorize(pd.Series(formulas, dtype=object))
+    rows, cols, amounts = [], [], []
+    for row, formula in enumerate(uniques):
+        for elem, amt in Composition(formula).element_composition.items():
+            rows.append(row)
+            cols.append(elem.Z - 1)
+            amounts.append(amt)
+    unique_counts = csr_matrix(
+        (amounts, (rows, cols)), shape=(len(uniques) + 1, N_ELEMENTS)
+    )
+    # pd.factorize() marks missing formulas with -1 which maps onto the empty last
+    # row of unique_counts
+    return unique_counts[codes]
+
+
+@trace.traced("element_count_matrix")
+def element_count_matrix(
+    formulas: Sequence[str | None], cache: bool = True
+) -> csr_matrix:
+    """Parse formulas into a sparse matrix of element amounts.
+
+    Args:
+        formulas (Sequence[str | None]): Chemical formulas (or anything
+            pymatgen.Composition accepts). Missing values give empty rows.
+        cache (bool): Whether to store/load the result in COMPOSITION_CACHE_DIR,
+            keyed by a hash of all formulas. Least recently used results are
+            deleted once the directory exceeds COMPOSITION_CACHE_MAX_SIZE.
+            Defaults to True.
+
+    Returns:
+        csr_matrix: shape (len(formulas), 118) with the amount of element with
+            atomic number j + 1 in column j.
+    """
+    formulas = [None if pd.isna(x) else str(x) for x in formulas]
+    if not cache:
+        return _parse_formulas(formulas)
+
+    hasher = hashlib.blake2b(digest_size=20)
+    for formula in formulas:
+        hasher.update(f"{formula}\n".encode())
+    path = f"{COMPOSITION_CACHE_DIR}/{hasher.hexdigest()}.npz"
+
+    try:
+        counts = load_npz(path).tocsr()
+        os.utime(path)  # mark as recently used
+        return counts
+    except FileNotFoundError:  # not cached yet or just evicted
+        pass
+
+    counts = _parse_formulas(formulas)
+    os.makedirs(COMPOSITION_CACHE_DIR, exist_ok=True)
+    # rename into place so concurrent readers never see a partial file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    save_npz(tmp_path, counts)
+    os.replace(tmp_path, path)
+    _evict_lru(COMPOSITION_CACHE_DIR, COMPOSITION_CACHE_MAX_SIZE)
+    return counts
+
+
+def _evict_lru(cache_dir: str, max_size: int) -> None:
+    """Delete the least recently used (oldest mtime) .npz files in cache_dir until
+    their total size is at most max_size.
+    """
+    files = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".npz") and ".tmp" not in entry.name:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # evicted by another process
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _weights(counts: csr_matrix, mode: CountMode) -> csr_matrix:
+    if mode == "composition":
+        return counts
+    if mode == "occurrence":
+        return (counts > 0).astype(np.int32)
+    if mode == "fractional":
+        totals = np.asarray(counts.sum(axis=1)).ravel()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_totals = np.where(totals > 0, 1 / totals, 0)
+        return csr_matrix(counts.multiply(inv_totals[:, None]))
+    raise ValueError(f"Unknown {mode=}, must be one of {CountMode.__args__}")
+
+
+def element_prevalence(
+    counts: csr_matrix, mode: CountMode = "composition"
+) -> pd.Series:
+    """Count how often each element occurs across all materials.
+
+    Args:
+        counts (csr_matrix): As returned by element_count_matrix() or
+            StructureBatch.element_counts().
+        mode ("composition" | "fractional" | "occurrence"): Sum element amounts,
+            sum element fractions per material or count materials containing each
+            element. Defaults to "composition".
+
+    Returns:
+        pd.Series: Element symbols mapped to counts. Elements that don't occur are
+            omitted. Can be passed directly to pymatviz.ptable_heatmap().
+    """
+    totals = np.asarray(_weights(counts, mode).sum(axis=0)).ravel()
+    srs = pd.Series(totals, index=ELEMENTS, name=f"{mode} count")
+    return srs[srs > 0]
+
+
+def element_target_means(counts: csr_matrix, target: Sequence[float]) -> pd.Series:
+    """Mean target value of all materials containing each element.
+
+    Args:
+        counts (csr_matrix): As returned by element_count_matrix().
+        target (Sequence[float]): One target value per material (row of counts).
+            NaNs are ignored.
+
+    Returns:
+        pd.Series: Element symbols mapped to mean target value.
+    """
+    target = np.asarray(target, dtype=float)
+    if len(target) != counts.shape[0]:
+        raise ValueError(f"{len(target)=} must match {counts.shape[0]=}")
+    valid = ~np.isnan(target)
+    occurrence = _weights(counts[valid], "occurrence")
+    n_materials = np.asarray(occurrence.sum(axis=0)).ravel()
+    target_sums = occurrence.T @ target[valid]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = target_sums / n_materials
+    srs = pd.Series(means, index=ELEMENTS, name="mean target")
+    return srs[n_materials > 0]
+
+
+def element_cooccurrence(counts: csr_matrix) -> pd.DataFrame:
+    """Number of materials in which each pair of elements occurs together. The
+    diagonal holds the number of materials containing each element.
+
+    Args:
+        counts (csr_matrix): As returned by element_count_matrix().
+
+    Returns:
+        pd.DataFrame: Symmetric matrix of co-occurrence counts with element
+            symbols as index and columns, restricted to elements that occur.
+    """
+    occurrence = _weights(counts, "occurrence")
+    cooc = (occurrence.T @ occurrence).toarray()
+    present = np.diag(cooc) > 0
+    elems = np.array(ELEMENTS)[present]
+    return pd.DataFrame(cooc[present][:, present], index=elems, columns=elems)
+
+
+@dataclass
+class ElementSums:
+    """Per-element totals that can be accumulated over chunks of a dataset and
+    give the same results as element_prevalence() and element_target_means() on
+    the whole dataset.
+    """
+
+    composition: np.ndarray  # summed element amounts
+    fractional: np.ndarray  # summed element fractions
+    occurrence: np.ndarray  # number of materials containing each element
+    target_sums: np.ndarray  # sum of non-NaN targets of materials with each element
+    target_counts: np.ndarray  # number of such materials
+
+    @classmethod
+    def from_counts(
+        cls, counts: csr_matrix, target: Sequence[float] | None = None
+    ) -> ElementSums:
+        """Totals of one chunk.
+
+        Args:
+            counts (csr_matrix): As returned by element_count_matrix() or
+                StructureBatch.element_counts().
+            target (Sequence[float], optional): One target value per material.
+                Needed for target_means().
+        """
+        sums = {
+            mode: np.asarray(_weights(counts, mode).sum(axis=0), dtype=float).ravel()
+            for mode in CountMode.__args__
+        }
+        target_sums = target_counts = np.zeros(N_ELEMENTS)
+        if target is not None:
+            target = np.asarray(target, dtype=float)
+            valid = ~np.isnan(target)
+            occurrence = _weights(counts[valid], "occurrence")
+            target_sums = occurrence.T @ target[valid]
+            target_counts = np.asarray(occurrence.sum(axis=0), dtype=float).ravel()
+        return cls(**sums, target_sums=target_sums, target_counts=target_counts)
+
+    def merge(self, other: ElementSums) -> ElementSums:
+        """Totals of both chunks."""
+        return ElementSums(
+            **{key: val + getattr(other, key) for key, val in vars(self).items()}
+        )
+
+    def prevalence(self, mode: CountMode = "composition") -> pd.Series:
+        """Same as element_prevalence() of the combined chunks."""
+        srs = pd.Series(getattr(self, mode), index=ELEMENTS, name=f"{mode} count")
+        return srs[srs > 0]
+
+    def target_means(self) -> pd.Series:
+        """Same as element_target_means() of the combined chunks."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means = self.target_sums / self.target_counts
+        srs = pd.Series(means, index=ELEMENTS, name="mean target")
+        return srs[self.target_counts > 0]
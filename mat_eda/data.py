@@ -0,0 +1,377 @@
+"""Fast loading of matminer datasets from a columnar on-disk cache.
+
+matminer's load_dataset() decompresses a json.gz file and rebuilds every pymatgen
+object from dicts on every call, which takes minutes and several GB of RAM for
+matbench_mp_e_form (132,752 rows). load_dataset() below does that once per
+dataset, then stores structures as flat NumPy arrays (see StructureBatch) and all
+other columns as a Parquet file so later loads are near-instant.
+
+If the dataset's json.gz is already on disk (in the mirror, see mat_eda.mirror,
+or matminer's data_home), that first conversion streams it in chunks of
+DATASET_ROW_GROUP_SIZE rows, so it needs about as little memory as iter_dataset().
+Otherwise matminer downloads and loads the whole dataset at once. On workers with
+little RAM, run python -m mat_eda.mirror first (or convert large datasets ahead of
+time on a bigger node with ensure_cached() and share the cache directory).
+"""
+
+from __future__ import annotations
+
+import gzip
+import os
+import shutil
+import uuid
+from itertools import islice
+from typing import Any, Callable, Iterator, Sequence, TypeVar
+
+import pandas as pd
+
+from mat_eda import trace
+from mat_eda.cache import CACHE_DIR
+from mat_eda.structures import StructureBatch, StructureBatchWriter
+
+
+DATASET_CACHE_DIR = f"{CACHE_DIR}/datasets"
+DATASET_ROW_GROUP_SIZE = 10_000
+
+_T = TypeVar("_T")
+
+
+def to_columnar(
+    df: pd.DataFrame, structure_col: str = "structure"
+) -> tuple[pd.DataFrame, StructureBatch | None]:
+    """Split a dataframe into plain columns and a StructureBatch.
+
+    pymatgen objects in other columns (e.g. Composition) are converted to strings.
+    Missing values (None, NaN) in those columns become None, not "nan".
+
+    Args:
+        df (pd.DataFrame): As returned by matminer.datasets.load_dataset().
+        structure_col (str): Name of the structure column. Defaults to "structure".
+
+    Returns:
+        tuple[pd.DataFrame, StructureBatch | None]: df without the structure
+            column and the structures (None if df has no structure column).
+    """
+    structures = None
+    if structure_col in df:
+        structures = StructureBatch.from_structures(df[structure_col])
+        df = df.drop(columns=structure_col)
+
+    for col in df.select_dtypes(include="object"):
+        if not all(isinstance(x, str) or x is None for x in df[col]):
+            df[col] = df[col].map(_to_str)
+
+    return df, structures
+
+
+def _to_str(value: Any) -> str | None:
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    return str(value)
+
+
+def ensure_cached(
+    name: str, cache_dir: str = DATASET_CACHE_DIR, refresh: bool = False, **kwargs: Any
+) -> str:
+    """Convert a matminer dataset to the columnar cache unless already done.
+
+    Streams the conversion if the dataset's json.gz is on disk (see module
+    docstring), else loads it with matminer, downloading it if needed.
+
+    Safe to call from many processes (and nodes sharing cache_dir) at once: each
+    converts into its own temp dir and the first to finish wins (see
+    save_columnar()). Convert large datasets once up front to avoid duplicate work.
+
+    Args:
+        name (str): matminer dataset name, e.g. "matbench_mp_gap".
+        cache_dir (str): See load_dataset().
+        refresh (bool): Rebuild the cache even if it exists. Defaults to False.
+        **kwargs: Passed to matminer.datasets.load_dataset().
+
+    Returns:
+        str: The dataset's cache directory.
+    """
+    dataset_dir = f"{cache_dir}/{name}"
+    table_path = f"{dataset_dir}/table.parquet"
+
+    if refresh or not os.path.isfile(table_path):
+        from matminer.datasets import load_dataset as load_matminer_dataset
+        from matminer.datasets.utils import _get_data_home
+
+        from mat_eda.mirror import mirror_kwargs
+
+        # read from the local mirror if the dataset was prefetched
+        kwargs = {**mirror_kwargs(name), **kwargs}
+        json_path = f"{_get_data_home(kwargs.get('data_home'))}/{name}.json.gz"
+        with trace.span("convert_dataset", dataset=name):
+            if os.path.isfile(json_path):
+                convert_json(json_path, dataset_dir, overwrite=refresh)
+            else:
+                df, structures = to_columnar(load_matminer_dataset(name, **kwargs))
+                save_columnar(df, structures, dataset_dir, overwrite=refresh)
+    return dataset_dir
+
+
+def convert_json(
+    json_path: str,
+    dataset_dir: str,
+    overwrite: bool = True,
+    chunk_size: int = DATASET_ROW_GROUP_SIZE,
+) -> int:
+    """Convert a matminer json.gz file to the layout written by save_columnar(),
+    one chunk of rows at a time, so peak memory is set by chunk_size rather than
+    the dataset size.
+
+    matminer stores datasets as pandas' orient="split" JSON with pymatgen objects
+    as monty dicts. Each chunk is decoded, split with to_columnar() and appended to
+    the Parquet table (see mat_eda.ingest.tables_to_parquet() for how column types
+    that differ between chunks are reconciled) and the structure arrays.
+
+    Args:
+        json_path (str): matminer dataset file, e.g. {mirror_dir}/{name}.json.gz.
+        dataset_dir (str): Output directory.
+        overwrite (bool): See save_columnar(). Defaults to True.
+        chunk_size (int): Rows per chunk and Parquet row group. Defaults to
+            DATASET_ROW_GROUP_SIZE.
+
+    Returns:
+        int: Number of rows converted.
+    """
+    import pyarrow as pa
+    from monty.json import MontyDecoder
+
+    from mat_eda.ingest import split_json_rows, tables_to_parquet
+
+    decoder = MontyDecoder()
+
+    def convert(tmp_dir: str) -> int:
+        with gzip.open(json_path, "rb") as file, StructureBatchWriter(
+            f"{tmp_dir}/structures"
+        ) as struct_writer:
+            header, rows = split_json_rows(file)
+            index = header.get("index")
+            # store the default index as range metadata like df.to_parquet()
+            is_range = index is None or index == list(range(len(index)))
+
+            def chunks() -> Iterator[pa.Table]:
+                start = 0
+                while chunk := list(islice(rows, chunk_size)):
+                    stop = start + len(chunk)
+                    chunk_df = pd.DataFrame(
+                        decoder.process_decoded(chunk),
+                        columns=header.get("columns"),
+                        index=pd.RangeIndex(start, stop)
+                        if is_range
+                        else index[start:stop],  # type: ignore[index]
+                    )
+                    chunk_df, structures = to_columnar(chunk_df)
+                    if structures is not None:
+                        struct_writer.append(structures)
+                    yield pa.Table.from_pandas(chunk_df, preserve_index=not is_range)
+                    start = stop
+
+            return tables_to_parquet(chunks(), f"{tmp_dir}/table.parquet")
+
+    return _write_atomically(convert, dataset_dir, overwrite)
+
+
+def n_rows(name: str, cache_dir: str = DATASET_CACHE_DIR, **kwargs: Any) -> int:
+    """Number of rows of a dataset (read from Parquet metadata, converting the
+    dataset first if needed, see ensure_cached()).
+    """
+    import pyarrow.parquet as pq
+
+    dataset_dir = ensure_cached(name, cache_dir, **kwargs)
+    return pq.ParquetFile(f"{dataset_dir}/table.parquet").metadata.num_rows
+
+
+def save_columnar(
+    df: pd.DataFrame,
+    structures: StructureBatch | None,
+    dataset_dir: str,
+    overwrite: bool = True,
+) -> None:
+    """Write a table and its structures in the layout read by load_dataset(), i.e.
+    load_dataset(name, cache_dir) reads {cache_dir}/{name}. Column dtypes like
+    float32 and categoricals are preserved.
+
+    Args:
+        df (pd.DataFrame): Non-structure columns, see to_columnar().
+        structures (StructureBatch | None): The table's structures.
+        dataset_dir (str): Output directory.
+        overwrite (bool): Replace dataset_dir if it exists. If False and another
+            process completed dataset_dir first, keep theirs. Defaults to True.
+    """
+
+    def write(tmp_dir: str) -> None:
+        if structures is not None:
+            structures.save(f"{tmp_dir}/structures")
+        # fixed-size row groups let iter_dataset() read one chunk at a time
+        df.to_parquet(f"{tmp_dir}/table.parquet", row_group_size=DATASET_ROW_GROUP_SIZE)
+
+    _write_atomically(write, dataset_dir, overwrite)
+
+
+def _write_atomically(
+    write: Callable[[str], _T], dataset_dir: str, overwrite: bool
+) -> _T:
+    """Call write(tmp_dir), then rename tmp_dir to dataset_dir."""
+    # write to a temp dir unique to this call first, so an interrupted conversion
+    # isn't mistaken for a complete cache and concurrent writers don't collide
+    tmp_dir = f"{dataset_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+    try:
+        result = write(tmp_dir)
+        # complete directories are only ever renamed into place, so one without a
+        # table is left over from an older layout or failed delete
+        if overwrite or not os.path.isfile(f"{dataset_dir}/table.parquet"):
+            shutil.rmtree(dataset_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, dataset_dir)
+        except OSError:
+            # another writer's directory is in place (renaming onto a non-empty
+            # directory fails), theirs has the same content
+            if not os.path.isfile(f"{dataset_dir}/table.parquet"):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return result
+
+
+def load_dataset(
+    name: str,
+    cache_dir: str = DATASET_CACHE_DIR,
+    mmap: bool = False,
+    refresh: bool = False,
+    **kwargs: Any,
+) -> tuple[pd.DataFrame, StructureBatch | None]:
+    """Load a matminer dataset, converting it to a columnar on-disk cache the first
+    time it's requested.
+
+    Args:
+        name (str): matminer dataset name, e.g. "matbench_mp_gap".
+        cache_dir (str): Where to store converted datasets. Defaults to
+            DATASET_CACHE_DIR.
+        mmap (bool): Memory-map structure arrays instead of reading them into RAM.
+            Defaults to False.
+        refresh (bool): Rebuild the cache from matminer even if it exists.
+            Defaults to False.
+        **kwargs: Passed to matminer.datasets.load_dataset() on cache misses.
+
+    Returns:
+        tuple[pd.DataFrame, StructureBatch | None]: All non-structure columns and
+            the dataset's structures (None for composition-only datasets). Use
+            structures[idx] or structures.to_structures() to get pymatgen objects.
+    """
+    dataset_dir = ensure_cached(name, cache_dir, refresh, **kwargs)
+    table_path = f"{dataset_dir}/table.parquet"
+
+    with trace.span("load_dataset", dataset=name) as span:
+        df = pd.read_parquet(table_path)
+        structures = None
+        if os.path.isdir(f"{dataset_dir}/structures"):
+            structures = StructureBatch.load(
+                f"{dataset_dir}/structures", mmap_mode="r" if mmap else None
+            )
+        span.set(items=len(df))
+    return df, structures
+
+
+def iter_dataset(
+    name: str,
+    chunk_size: int = DATASET_ROW_GROUP_SIZE,
+    columns: Sequence[str] | None = None,
+    cache_dir: str = DATASET_CACHE_DIR,
+    **kwargs: Any,
+) -> Iterator[tuple[pd.DataFrame, StructureBatch | None]]:
+    """Stream a dataset in chunks of rows so that memory use is bounded by
+    chunk_size instead of the dataset size. Structures are memory-mapped and only
+    the pages of the current chunk are read.
+
+    Args:
+        name (str): matminer dataset name, e.g. "matbench_mp_e_form".
+        chunk_size (int): Rows per chunk. Defaults to DATASET_ROW_GROUP_SIZE.
+        columns (Sequence[str], optional): Only read these non-structure columns.
+        cache_dir (str): See load_dataset().
+        **kwargs: Passed to matminer.datasets.load_dataset() on cache misses.
+
+    Yields:
+        tuple[pd.DataFrame, StructureBatch | None]: Consecutive chunks of the
+            dataset in the same format as load_dataset(). The index continues
+            across chunks.
+    """
+    import pyarrow.parquet as pq
+
+    dataset_dir = ensure_cached(name, cache_dir, **kwargs)
+    structures = None
+    if os.path.isdir(f"{dataset_dir}/structures"):
+        structures = StructureBatch.load(f"{dataset_dir}/structures", mmap_mode="r")
+
+    table = pq.ParquetFile(f"{dataset_dir}/table.parquet")
+    if columns is not None:  # pandas index columns must be read to restore the index
+        index_cols = table.schema_arrow.pandas_metadata.get("index_columns", [])
+        columns = [*columns, *(col for col in index_cols if isinstance(col, str))]
+    start = 0
+    for batch in table.iter_batches(chunk_size, columns=columns):
+        stop = start + batch.num_rows
+        with trace.span("iter_dataset", dataset=name, items=batch.num_rows):
+            df = batch.to_pandas()
+            if isinstance(df.index, pd.RangeIndex):  # each batch starts at 0
+                df.index = pd.RangeIndex(start, stop)
+            chunk_structs = None if structures is None else structures[start:stop]
+        yield df, chunk_structs
+        start = stop
+
+
+def load_rows(
+    name: str,
+    start: int,
+    stop: int,
+    columns: Sequence[str] | None = None,
+    cache_dir: str = DATASET_CACHE_DIR,
+    **kwargs: Any,
+) -> tuple[pd.DataFrame, StructureBatch | None]:
+    """Load rows start to stop (exclusive) of a dataset, reading only the Parquet
+    row groups that contain them and memory-mapping the structures.
+
+    Args:
+        name (str): matminer dataset name, e.g. "matbench_mp_e_form".
+        start (int): First row.
+        stop (int): Row after the last one, clipped to the dataset size.
+        columns (Sequence[str], optional): Only read these non-structure columns.
+        cache_dir (str): See load_dataset().
+        **kwargs: Passed to matminer.datasets.load_dataset() on cache misses.
+
+    Returns:
+        tuple[pd.DataFrame, StructureBatch | None]: Like load_dataset() but only
+            the requested rows, indexed start to stop for RangeIndex datasets.
+    """
+    import pyarrow.parquet as pq
+
+    dataset_dir = ensure_cached(name, cache_dir, **kwargs)
+    table = pq.ParquetFile(f"{dataset_dir}/table.parquet")
+    if columns is not None:
+        index_cols = table.schema_arrow.pandas_metadata.get("index_columns", [])
+        columns = [*columns, *(col for col in index_cols if isinstance(col, str))]
+
+    stop = min(stop, table.metadata.num_rows)
+    # row groups overlapping [start, stop) and the first row of the first one
+    row_groups, offset, first_row = [], 0, None
+    for idx in range(table.num_row_groups):
+        n_rows = table.metadata.row_group(idx).num_rows
+        if offset < stop and offset + n_rows > start:
+            row_groups.append(idx)
+            first_row = offset if first_row is None else first_row
+        offset += n_rows
+
+    with trace.span("load_rows", dataset=name, items=max(stop - start, 0)):
+        df = table.read_row_groups(row_groups, columns=columns).to_pandas()
+        df = df.iloc[start - (first_row or 0) : stop - (first_row or 0)]
+        if isinstance(df.index, pd.RangeIndex):
+            df.index = pd.RangeIndex(start, start + len(df))
+        structures = None
+        if os.path.isdir(f"{dataset_dir}/structures"):
+            structures = StructureBatch.load(
+                f"{dataset_dir}/structures", mmap_mode="r"
+            )[start:stop]
+    return df, structures
@@ -0,0 +1,114 @@
+"""Resumable HTTP downloads.
+
+Large files (like the ~100k-structure CAMD 2022 JSON) are streamed to disk in chunks
+instead of being held in memory. Partial downloads are kept next to the target file
+with a .part suffix and resumed with an HTTP Range request on the next attempt.
+"""
+
+from __future__ import annotations
+
+import os
+import warnings
+
+import requests
+from tqdm import tqdm
+
+
+def download(
+    url: str,
+    path: str,
+    chunk_size: int = 1024**2,
+    session: requests.Session | None = None,
+    retries: int = 3,
+    timeout: float = 60,
+    desc: str | None = None,
+) -> str:
+    """Stream a URL to a local file, resuming a previous partial download if one
+    exists. Does nothing if path already exists.
+
+    Args:
+        url (str): File to download.
+        path (str): Where to save it. Data is written to path + ".part" and only
+            renamed to path once complete.
+        chunk_size (int): Bytes to read from the response at a time. Defaults to
+            1 MiB.
+        session (requests.Session, optional): Reuse an existing session (and its
+            connection pool). Defaults to a new session.
+        retries (int): Number of times to resume after connection errors before
+            giving up. Defaults to 3.
+        timeout (float): Seconds to wait for the server to respond. Defaults to 60.
+        desc (str, optional): Progress bar description. Defaults to file name.
+
+    Raises:
+        OSError: If the server closed the connection before sending all bytes it
+            announced and retries are exhausted.
+
+    Returns:
+        str: path
+    """
+    if os.path.isfile(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    part_path = f"{path}.part"
+    session = session or requests.Session()
+
+    desc = desc or os.path.basename(path)
+    for attempt in range(retries + 1):
+        try:
+            _download_part(url, part_path, chunk_size, session, timeout, desc)
+            break
+        except requests.HTTPError:
+            raise  # e.g. 404, retrying won't help
+        except OSError as exc:  # includes requests' connection errors and timeouts
+            if attempt == retries:
+                raise
+            warnings.warn(
+                f"Download of {url} interrupted ({exc}), resuming...", stacklevel=2
+            )
+
+    os.replace(part_path, path)
+    return path
+
+
+def _download_part(
+    url: str,
+    part_path: str,
+    chunk_size: int,
+    session: requests.Session,
+    timeout: float,
+    desc: str,
+) -> None:
+    """Append the missing bytes of url to part_path."""
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    # byte offsets for resuming refer to the raw file, so ask for no compression
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as resp:
+        if offset and resp.status_code == 416:
+            # requested range starts at or beyond the end of the file, i.e. the
+            # previous attempt already got everything
+            return
+        resp.raise_for_status()
+        if offset and resp.status_code != 206:
+            offset = 0  # server ignored the Range header, start over
+
+        content_length = resp.headers.get("Content-Length")
+        total = offset + int(content_length) if content_length else None
+        with open(part_path, "ab" if offset else "wb") as file, tqdm(
+            total=total,
+            initial=offset,
+            unit="B",
+            unit_scale=True,
+            desc=desc,
+        ) as pbar:
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+                pbar.update(len(chunk))
+
+    if total is not None and os.path.getsize(part_path) < total:
+        raise OSError(
+            f"Connection closed after {os.path.getsize(part_path):,} of "
+            f"{total:,} bytes"
+        )
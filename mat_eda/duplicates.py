@@ -0,0 +1,211 @@
+"""Find structures that occur in several datasets.
+
+Many datasets share structures (matbench_log_gvrh and matbench_log_kvrh, mp_gap
+and mp_e_form, boltztrap_mp and ricci_boltztrap_mp_tabular). Comparing all pairs
+of structures with pymatgen's StructureMatcher is quadratic in the number of
+structures across all datasets and far too slow. find_duplicates() first buckets
+structures by cheap invariants (reduced formula, number of sites, space group)
+and sorts each bucket by volume per atom. Only structures in the same bucket whose
+volumes per atom are within vol_tol of each other are passed to StructureMatcher,
+and each structure is only compared to one representative of every cluster found
+so far. Buckets are matched in parallel.
+
+    python -m mat_eda.duplicates matbench_log_gvrh matbench_log_kvrh -o dups.csv
+
+prints how many structures of each dataset also occur in each other dataset.
+"""
+
+from __future__ import annotations
+
+import argparse
+from functools import partial
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+from pymatgen.analysis.structure_matcher import StructureMatcher
+from pymatgen.core import Structure
+
+from mat_eda import trace
+from mat_eda.featurize import get_spacegroups, parallel_map
+from mat_eda.structures import StructureBatch
+
+
+def invariant_keys(
+    structures: StructureBatch, symmetry: bool = True, **kwargs: Any
+) -> pd.DataFrame:
+    """Invariants that duplicate structures must share.
+
+    Args:
+        structures (StructureBatch): Structures to describe.
+        symmetry (bool): Include space group numbers (cached, see
+            get_spacegroups()). Defaults to True.
+        **kwargs: Passed to get_spacegroups(), e.g. n_jobs.
+
+    Returns:
+        pd.DataFrame: Columns formula (reduced), n_sites, spg_num (0 if
+            symmetry=False) and volume_per_atom, one row per structure. formula
+            is None for missing structures.
+    """
+    keys = pd.DataFrame(
+        dict(
+            formula=structures.formulas(reduced=True),
+            n_sites=structures.n_sites,
+            spg_num=0,
+            volume_per_atom=structures.volumes_per_atom,
+        )
+    )
+    present = keys.formula.notna().to_numpy()
+    if symmetry and present.any():
+        present_structs = structures.take(np.flatnonzero(present))
+        keys.loc[present, "spg_num"] = [
+            spg_num for _, spg_num in get_spacegroups(present_structs, **kwargs)
+        ]
+    return keys
+
+
+def _match_bucket(
+    bucket: tuple[list[Structure], np.ndarray],
+    vol_tol: float,
+    matcher_kwargs: dict[str, Any],
+) -> list[tuple[int, int]]:
+    """Match structures of one bucket sorted by volume per atom. Returns pairs of
+    (structure, cluster representative) indices within the bucket.
+    """
+    structures, volumes = bucket
+    matcher = StructureMatcher(**matcher_kwargs)
+    reps: list[int] = []
+    pairs = []
+    for idx, struct in enumerate(structures):
+        # compare to representatives with similar volume, most similar first
+        match = None
+        for rep in reversed(reps):
+            if volumes[rep] < volumes[idx] / (1 + vol_tol):
+                break
+            if matcher.fit(struct, structures[rep]):
+                match = rep
+                break
+        if match is None:
+            reps.append(idx)
+        else:
+            pairs.append((idx, match))
+    return pairs
+
+
+def find_duplicates(
+    datasets: dict[str, StructureBatch],
+    vol_tol: float = 0.05,
+    symmetry: bool = True,
+    n_jobs: int | None = None,
+    **matcher_kwargs: Any,
+) -> pd.DataFrame:
+    """Cluster equivalent structures within and across datasets.
+
+    Args:
+        datasets (dict[str, StructureBatch]): Dataset names mapped to structures.
+        vol_tol (float): Max relative difference in volume per atom of structures
+            to compare. Structures further apart aren't considered duplicates
+            even if StructureMatcher (which rescales volumes) would match them.
+            Defaults to 0.05.
+        symmetry (bool): Also require equal space groups. Defaults to True.
+        n_jobs (int, optional): Worker processes for space groups and matching.
+        **matcher_kwargs: Passed to pymatgen's StructureMatcher, e.g. ltol, stol,
+            angle_tol.
+
+    Returns:
+        pd.DataFrame: One row per structure with columns dataset, idx (row in its
+            dataset), the invariant keys, cluster (equal for duplicates, -1 for
+            missing structures) and cluster_size.
+    """
+    with trace.span("invariant_keys"):
+        keys = pd.concat(
+            [
+                invariant_keys(structs, symmetry, n_jobs=n_jobs).assign(
+                    dataset=name, idx=np.arange(len(structs))
+                )
+                for name, structs in datasets.items()
+            ],
+            ignore_index=True,
+        )
+    keys = keys[["dataset", "idx", "formula", "n_sites", "spg_num", "volume_per_atom"]]
+
+    # union-find over all structures, only structures sharing a bucket get merged
+    parents = np.arange(len(keys))
+    buckets, bucket_rows = [], []
+    present = keys[keys.formula.notna()].sort_values("volume_per_atom")
+    groups = present.groupby(["formula", "n_sites", "spg_num"]).indices
+    for positions in groups.values():
+        if len(positions) < 2:
+            continue
+        rows = present.index[positions]  # still sorted by volume per atom
+        structs = [datasets[keys.dataset[row]][int(keys.idx[row])] for row in rows]
+        buckets.append((structs, keys.loc[rows, "volume_per_atom"].to_numpy()))
+        bucket_rows.append(np.asarray(rows))
+
+    with trace.span("match_buckets", items=len(buckets)):
+        matches = parallel_map(
+            partial(_match_bucket, vol_tol=vol_tol, matcher_kwargs=matcher_kwargs),
+            buckets,
+            n_jobs=n_jobs,
+            desc="Matching structures",
+        )
+    for rows, pairs in zip(bucket_rows, matches):
+        for idx, rep in pairs:  # reps are never merged themselves, no chains
+            parents[rows[idx]] = rows[rep]
+
+    keys["cluster"] = pd.factorize(parents)[0]
+    keys.loc[keys.formula.isna(), "cluster"] = -1
+    keys["cluster_size"] = keys.groupby("cluster").cluster.transform("size")
+    keys.loc[keys.cluster == -1, "cluster_size"] = 0
+    return keys
+
+
+def dataset_overlap(duplicates: pd.DataFrame) -> pd.DataFrame:
+    """Number of structures of each dataset (rows) that also occur in each other
+    dataset (columns). The diagonal counts structures occurring more than once in
+    their own dataset.
+
+    Args:
+        duplicates (pd.DataFrame): Output of find_duplicates().
+    """
+    dups = duplicates[duplicates.cluster_size > 1]
+    names = list(duplicates.dataset.unique())
+    clusters = dups.groupby("cluster").dataset.agg(list)
+    overlap = pd.DataFrame(0, index=names, columns=names)
+    for row in dups.itertuples():
+        members = clusters[row.cluster]
+        for other in set(members):
+            # a structure is its own duplicate only if its dataset has another copy
+            if other != row.dataset or members.count(other) > 1:
+                overlap.loc[row.dataset, other] += 1
+    return overlap
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Command line entry point printing the overlap between datasets."""
+    from mat_eda.data import load_dataset
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("datasets", nargs="+", help="matminer dataset names")
+    parser.add_argument("-o", "--out", help="CSV file for all duplicate clusters")
+    parser.add_argument("--vol-tol", type=float, default=0.05)
+    parser.add_argument("-j", "--n-jobs", type=int, help="Worker processes")
+    args = parser.parse_args(argv)
+
+    datasets = {}
+    for name in args.datasets:
+        _, structures = load_dataset(name, mmap=True)
+        if structures is None:
+            parser.error(f"{name} has no structures")
+        datasets[name] = structures
+
+    duplicates = find_duplicates(datasets, args.vol_tol, n_jobs=args.n_jobs)
+    if args.out:
+        duplicates[duplicates.cluster_size > 1].to_csv(args.out, index=False)
+        print(f"Wrote {args.out}")
+    print(dataset_overlap(duplicates))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,313 @@
+"""Parallel, incremental figure export.
+
+Rendering vector PDFs (and starting kaleido for every plotly write_image() call)
+dominates the tail of a script run. save_fig() instead snapshots the figure
+(pickled matplotlib figure or plotly JSON) and queues it for rendering in a pool of
+worker processes, so the script continues immediately. Each worker keeps one
+kaleido instance alive for all plotly figures it renders. Snapshots are hashed, and
+figures whose snapshot and output file are unchanged since the last export are
+skipped. Queued figures are finished when the script exits (or call flush()).
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import pickle
+import pickletools
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Iterator
+
+from mat_eda import trace
+from mat_eda.cache import CACHE_DIR
+from mat_eda.featurize import default_n_jobs
+
+
+EXPORT_MANIFEST_PATH = f"{CACHE_DIR}/figures.json"
+
+# set in worker processes once kaleido has been started
+_kaleido_started = False
+
+
+def _init_worker() -> None:
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def _start_kaleido() -> None:
+    """Start kaleido once per worker process and reuse it for all plotly figures.
+    kaleido 0.2 keeps its subprocess alive on its own, kaleido>=1 launches a new
+    browser for every write_image() call unless a persistent server is running.
+    """
+    global _kaleido_started
+    if _kaleido_started:
+        return
+    import kaleido
+
+    if hasattr(kaleido, "start_sync_server"):
+        kaleido.start_sync_server()
+    _kaleido_started = True
+
+
+def _render(job: tuple[str, bytes, str, dict[str, Any]]) -> str:
+    """Render one queued figure in a worker process. Returns the output path."""
+    kind, snapshot, path, kwargs = job
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if kind == "plotly":
+        import plotly.io as pio
+
+        _start_kaleido()
+        pio.from_json(snapshot.decode()).write_image(path, **kwargs)
+    else:
+        import matplotlib
+        import matplotlib.pyplot as plt
+
+        rc_params, savefig_kwargs = kwargs["rc_params"], kwargs["savefig_kwargs"]
+        fig = pickle.loads(snapshot)
+        with matplotlib.rc_context(rc_params):
+            fig.savefig(path, **savefig_kwargs)
+        plt.close(fig)
+    return path
+
+
+def _snapshot(fig: Any, kwargs: dict[str, Any]) -> tuple[str, bytes, dict[str, Any]]:
+    """Serialize a figure into something a worker process can render."""
+    if type(fig).__module__.startswith("plotly"):
+        return "plotly", fig.to_json().encode(), kwargs
+    if type(fig).__module__.startswith("matplotlib"):
+        import matplotlib
+
+        # savefig() reads defaults like bbox="tight" and dpi from rcParams, which
+        # aren't part of the pickled figure
+        rc_params = {
+            key: val
+            for key, val in matplotlib.rcParams.items()
+            if key.startswith(("savefig.", "pdf."))
+        }
+        settings = dict(rc_params=rc_params, savefig_kwargs=kwargs)
+        return "matplotlib", pickle.dumps(fig), settings
+    raise TypeError(f"Expected a matplotlib or plotly figure, got {type(fig)}")
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on path (created if missing) across processes."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _read_manifest(path: str) -> dict[str, str]:
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _content_hash(kind: str, snapshot: bytes, settings: dict[str, Any]) -> str:
+    """Hash of a figure snapshot that's stable across Python processes."""
+    hasher = hashlib.blake2b(digest_size=20)
+    if kind == "matplotlib":
+        # pickled matplotlib figures contain object IDs (as keys of transform
+        # parents), replace them with their order of first appearance
+        ids: dict[int, int] = {}
+        for opcode, arg, _ in pickletools.genops(snapshot):
+            if opcode.name in ("LONG1", "LONG4") and arg > 2**32:
+                arg = f"id{ids.setdefault(arg, len(ids))}"
+            hasher.update(f"{opcode.name}{arg!r}".encode())
+    else:
+        hasher.update(snapshot)
+    hasher.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return hasher.hexdigest()
+
+
+class ExportQueue:
+    """Renders figures in a pool of worker processes, skipping figures that haven't
+    changed since they were last exported.
+    """
+
+    def __init__(
+        self, n_jobs: int | None = None, manifest_path: str = EXPORT_MANIFEST_PATH
+    ) -> None:
+        """
+        Args:
+            n_jobs (int, optional): Number of worker processes. Started on first
+                use. Defaults to default_n_jobs().
+            manifest_path (str): JSON file mapping output paths to the content
+                hash of the figure they were rendered from. Defaults to
+                EXPORT_MANIFEST_PATH.
+        """
+        self.n_jobs = n_jobs or default_n_jobs()
+        self.manifest_path = manifest_path
+        self.manifest = _read_manifest(manifest_path)
+        # futures mapped to (output path, content hash, whether traced)
+        self.pending: dict[Future, tuple[str, str, bool]] = {}
+        self.n_skipped = self.n_rendered = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(pending={len(self.pending)}, "
+            f"rendered={self.n_rendered}, skipped={self.n_skipped})"
+        )
+
+    def submit(self, fig: Any, path: str, **kwargs: Any) -> Future | None:
+        """Queue a figure for rendering.
+
+        Args:
+            fig (matplotlib.figure.Figure | plotly.graph_objects.Figure): Figure
+                to export. Later changes to fig don't affect the output.
+            path (str): Output file. Format is inferred from the extension.
+            **kwargs: Passed to savefig() or write_image().
+
+        Returns:
+            Future | None: Resolves to path once rendered. None if skipped
+                because fig is unchanged since the last export to path or if fig
+                couldn't be pickled and was rendered synchronously instead.
+        """
+        try:
+            kind, snapshot, settings = _snapshot(fig, kwargs)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            if not hasattr(fig, "savefig"):
+                raise
+            # some artists (e.g. with lambdas attached) can't be pickled, render
+            # those right away in this process
+            fig.savefig(path, **kwargs)
+            self.n_rendered += 1
+            return None
+        abs_path = os.path.abspath(path)
+        digest = _content_hash(kind, snapshot, settings)
+
+        if os.path.isfile(abs_path) and self.manifest.get(abs_path) == digest:
+            self.n_skipped += 1
+            return None
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.n_jobs, initializer=_init_worker)
+        job = (kind, snapshot, abs_path, settings)
+        func = _render
+        if traced := trace.is_enabled():
+            func = partial(trace.traced_call, _render, f"render:{kind}")
+        future = self._executor.submit(func, job)
+        with self._lock:
+            self.pending[future] = (abs_path, digest, traced)
+        return future
+
+    def flush(self) -> list[str]:
+        """Wait for all queued figures and record their hashes.
+
+        Raises:
+            RuntimeError: If any figure failed to render (after waiting for all
+                others).
+
+        Returns:
+            list[str]: Paths of figures rendered since the last flush.
+        """
+        rendered, errors = [], []
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        for future, (path, digest, traced) in pending.items():
+            try:
+                result = future.result()
+            except Exception as exc:
+                errors.append(f"{path}: {exc!r}")
+                self.manifest.pop(path, None)
+                continue
+            if traced:
+                _, event = result
+                trace.add_events([event])
+            self.manifest[path] = digest
+            rendered.append(path)
+        self.n_rendered += len(rendered)
+
+        if pending:
+            self._write_manifest([path for path, _, _ in pending.values()])
+        if errors:
+            raise RuntimeError("Failed to export figures:\n" + "\n".join(errors))
+        return rendered
+
+    def _write_manifest(self, paths: list[str]) -> None:
+        """Update the manifest file with the entries of paths flushed by this queue.
+        Other processes (e.g. scripts run in parallel by mat_eda.pipeline) may have
+        updated it since this queue read it, so it's re-read and merged under a
+        file lock rather than overwritten.
+        """
+        with _file_lock(f"{self.manifest_path}.lock"):
+            manifest = _read_manifest(self.manifest_path)
+            for path in paths:
+                if path in self.manifest:
+                    manifest[path] = self.manifest[path]
+                else:  # failed to render
+                    manifest.pop(path, None)
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(manifest, file, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+        self.manifest = manifest
+
+    def close(self) -> None:
+        """Flush and shut down the worker processes."""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+_default_queue: ExportQueue | None = None
+
+
+def get_export_queue() -> ExportQueue:
+    """Shared ExportQueue used by save_fig(). Flushed when the interpreter exits."""
+    global _default_queue
+    if _default_queue is None:
+        _default_queue = ExportQueue()
+        atexit.register(_close_default_queue)
+    return _default_queue
+
+
+def _close_default_queue() -> None:
+    if _default_queue is None:
+        return
+    try:
+        _default_queue.close()
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        raise
+
+
+def save_fig(fig: Any, path: str, **kwargs: Any) -> Future | None:
+    """Export a matplotlib or plotly figure in the background. Drop-in for
+    fig.savefig(path) and fig.write_image(path). Figures identical to their last
+    export are skipped.
+
+    Args:
+        fig (matplotlib.figure.Figure | plotly.graph_objects.Figure): Figure to
+            save. Use plt.gcf() for the current pyplot figure.
+        path (str): Output file, e.g. "dielectric-ptable-heatmap.pdf".
+        **kwargs: Passed to savefig() or write_image().
+
+    Returns:
+        Future | None: See ExportQueue.submit().
+    """
+    return get_export_queue().submit(fig, path, **kwargs)
+
+
+def flush() -> list[str]:
+    """Wait for all figures queued by save_fig() to be written."""
+    return get_export_queue().flush()
@@ -0,0 +1,427 @@
+"""Derived columns for each dataset, computed without importing any plotting or
+visualization package.
+
+The analyze_*.py scripts get their derived columns (space groups, crystal systems,
+Wyckoff labels, volumes, ...) from add_columns() (by column name) or add_features()
+(by named group of columns) and only then start plotting. Either way all requested
+columns are computed in one pass that shares intermediate results like
+compositions, symmetry datasets and neighbor lists (see DerivedColumns).
+Batch jobs that only need those columns can skip matplotlib, plotly and pymatviz
+entirely (which take seconds to import):
+
+    python -m mat_eda.features matbench_dielectric matbench_log_gvrh -o features
+
+writes one Parquet file of derived columns per dataset. Add --incremental to only
+featurize rows that changed since the last such run (see mat_eda.incremental).
+To spread one large dataset over several nodes, see mat_eda.shard.
+Optional dependencies are only imported by columns that need them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, Callable, Sequence
+
+import numpy as np
+import pandas as pd
+from pymatgen.core import Composition, Element
+from scipy.sparse import csr_matrix
+
+from mat_eda import trace
+from mat_eda.composition import element_count_matrix
+from mat_eda.featurize import SymmetryInfo, crystal_system, get_symmetry_info
+from mat_eda.structures import (
+    AMU_PER_A3_TO_G_PER_CM3,
+    ATOMIC_MASSES,
+    N_ELEMENTS,
+    StructureBatch,
+)
+
+
+if TYPE_CHECKING:
+    from mat_eda.incremental import FeatureDiff
+    from mat_eda.neighbors import NeighborList
+
+
+# atomic radii in Angstrom indexed like element_count_matrix() columns, NaN if unknown
+ATOMIC_RADII = np.array(
+    [
+        np.nan if (radius := Element.from_Z(Z).atomic_radius) is None else radius
+        for Z in range(1, N_ELEMENTS + 1)
+    ],
+    dtype=float,
+)
+
+
+class DerivedColumns:
+    """Computes derived columns of a dataset by name in a single pass.
+
+    Intermediate results (volumes, compositions, symmetry, neighbor lists, ...) are
+    computed at most once and shared by all requested columns. E.g. formula,
+    reduced_formula and n_elements count elements once, spg_num, crystal_sys and
+    n_wyckoff run spglib once per structure and isolated_r5 reuses the neighbor
+    lists of graph_size if both are requested.
+
+    Each column in COLUMNS is a method of the same name. isolated_r{r} takes the
+    radius from its name.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        structures: StructureBatch | None,
+        r: float = 5,
+        formula_col: str = "composition",
+        **kwargs: Any,
+    ) -> None:
+        """
+        Args:
+            df (pd.DataFrame): Dataset as returned by mat_eda.data.load_dataset().
+            structures (StructureBatch | None): The dataset's structures.
+            r (float): Cutoff radius in Angstrom of the graph_size neighbor lists.
+                Defaults to 5.
+            formula_col (str): Column of formula strings used by the composition
+                columns. Defaults to "composition".
+            **kwargs: Passed to get_symmetry_info() and the neighbor list helpers,
+                e.g. n_jobs.
+        """
+        self.df = df
+        self._structures = structures
+        self.r = r
+        self.formula_col = formula_col
+        self.kwargs = kwargs
+        self._requested: set[str] = set()
+
+    def compute(self, columns: Sequence[str]) -> dict[str, Any]:
+        """Values of the given columns. Duplicates are only computed once.
+
+        Raises:
+            ValueError: If a column is unknown or needs structures but the dataset
+                has none.
+        """
+        columns = list(dict.fromkeys(columns))
+        self._requested.update(columns)
+        values = {}
+        for col in columns:
+            with trace.span(f"column:{col}", items=len(self.df)):
+                if col in COLUMNS:
+                    values[col] = getattr(self, col)()
+                elif match := re.fullmatch(r"isolated_r(\d+(?:\.\d+)?)", col):
+                    values[col] = self.isolated(float(match.group(1)))
+                else:
+                    raise ValueError(
+                        f"Unknown column {col!r}, must be one of {COLUMNS} or "
+                        "isolated_r{radius}"
+                    )
+        return values
+
+    @property
+    def structures(self) -> StructureBatch:
+        """The dataset's structures, raises ValueError if it has none."""
+        if self._structures is None:
+            raise ValueError("Structure columns need a dataset with structures")
+        return self._structures
+
+    # --- intermediates shared by several columns
+    @cached_property
+    def _volumes(self) -> np.ndarray:
+        return self.structures.volumes
+
+    @cached_property
+    def _element_counts(self) -> csr_matrix:
+        return self.structures.element_counts()
+
+    @cached_property
+    def _compositions(self) -> tuple[list[Composition | None], np.ndarray]:
+        return self.structures.unique_compositions(self._element_counts)
+
+    @cached_property
+    def _symmetry(self) -> list[SymmetryInfo]:
+        return get_symmetry_info(self.structures, **self.kwargs)
+
+    @cached_property
+    def _neighbor_lists(self) -> NeighborList:
+        from mat_eda.neighbors import get_neighbor_lists
+
+        return get_neighbor_lists(self.structures, r=self.r, **self.kwargs)
+
+    @cached_property
+    def _formula_counts(self) -> csr_matrix:
+        return element_count_matrix(self.df[self.formula_col])
+
+    def _per_composition(self, func: Callable[[Composition], Any]) -> list[Any]:
+        comps, inverse = self._compositions
+        values = [None if comp is None else func(comp) for comp in comps]
+        return [values[idx] for idx in inverse]
+
+    # --- structure columns
+    def volume(self) -> np.ndarray:
+        """Cell volume in Angstrom^3."""
+        return self._volumes
+
+    def volume_per_atom(self) -> np.ndarray:
+        """Cell volume per site in Angstrom^3."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._volumes / self.structures.n_sites
+
+    def n_sites(self) -> np.ndarray:
+        """Number of sites in the cell."""
+        return self.structures.n_sites
+
+    def n_elements(self) -> np.ndarray:
+        """Number of distinct elements."""
+        return np.diff(self._element_counts.indptr)
+
+    def density(self) -> np.ndarray:
+        """Mass density in g/cm^3."""
+        return self.structures.masses / self._volumes * AMU_PER_A3_TO_G_PER_CM3
+
+    def formula(self) -> list[str | None]:
+        """Formula like Structure.formula."""
+        return self._per_composition(lambda comp: comp.formula)
+
+    def reduced_formula(self) -> list[str | None]:
+        """Reduced formula like Composition.reduced_formula."""
+        return self._per_composition(lambda comp: comp.reduced_formula)
+
+    # --- symmetry columns
+    def spg_symbol(self) -> list[str]:
+        """International space group symbol."""
+        return [info.spg_symbol for info in self._symmetry]
+
+    def spg_num(self) -> list[int]:
+        """Space group number."""
+        return [info.spg_num for info in self._symmetry]
+
+    def crystal_sys(self) -> list[str]:
+        """Crystal system."""
+        return crystal_system(self.spg_num())
+
+    def wyckoff(self) -> list[str]:
+        """AFLOW-style Wyckoff label, see mat_eda.featurize.aflow_label()."""
+        return [info.wyckoff for info in self._symmetry]
+
+    def n_wyckoff(self) -> list[int]:
+        """Number of Wyckoff positions."""
+        return [info.n_wyckoff for info in self._symmetry]
+
+    # --- neighbor columns
+    def graph_size(self) -> np.ndarray:
+        """Number of edges in the radius graph with cutoff r."""
+        return self._neighbor_lists.n_edges
+
+    def isolated(self, r: float) -> np.ndarray:
+        """Whether any site has no neighbor within r."""
+        if r == self.r and "graph_size" in self._requested:
+            # any site without edges in the neighbor lists computed anyway
+            nbrs, structures = self._neighbor_lists, self.structures
+            edge_struct = np.repeat(np.arange(len(structures)), nbrs.n_edges)
+            sites = structures.offsets[edge_struct] + nbrs.center_indices
+            degrees = np.bincount(sites, minlength=len(structures.atomic_nums))
+            lonely = structures.site_structure_idx[degrees == 0]
+            return np.bincount(lonely, minlength=len(structures)) > 0
+
+        from mat_eda.neighbors import has_isolated_sites
+
+        return has_isolated_sites(self.structures, r=r, **self.kwargs)
+
+    # --- composition columns (from df[formula_col], for datasets without
+    # structures)
+    def n_atoms(self) -> np.ndarray:
+        """Number of atoms in the formula."""
+        return np.asarray(self._formula_counts.sum(axis=1)).ravel()
+
+    def n_elems(self) -> np.ndarray:
+        """Number of elements in the formula."""
+        return np.diff(self._formula_counts.indptr)
+
+    def mean_mass(self) -> np.ndarray:
+        """Mean atomic mass of the formula in amu."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._formula_counts @ ATOMIC_MASSES[1:] / self.n_atoms()
+
+    def mean_radius(self) -> np.ndarray:
+        """Mean atomic radius of the formula in Angstrom, NaN if any element has no
+        known radius.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._formula_counts @ ATOMIC_RADII / self.n_atoms()
+
+
+# names of all columns DerivedColumns can compute (plus isolated_r{radius})
+COLUMNS = (
+    "volume",
+    "volume_per_atom",
+    "n_sites",
+    "n_elements",
+    "density",
+    "formula",
+    "reduced_formula",
+    "spg_symbol",
+    "spg_num",
+    "crystal_sys",
+    "wyckoff",
+    "n_wyckoff",
+    "graph_size",
+    "n_atoms",
+    "n_elems",
+    "mean_mass",
+    "mean_radius",
+)
+
+# bump whenever the values of any derived column change (e.g. different symprec
+# or label format) so snapshots of earlier versions aren't reused
+# 2: alphabetical element order in AFLOW Wyckoff labels
+FEATURES_VERSION = 2
+
+
+def settings_hash(groups: Sequence[str], **kwargs: Any) -> str:
+    """Short hash identifying the results of add_features() with the given groups
+    and settings under the current FEATURES_VERSION. Worker counts don't affect
+    results and are ignored.
+    """
+    settings = {key: val for key, val in kwargs.items() if key != "n_jobs"}
+    return hashlib.blake2b(
+        json.dumps(
+            [list(groups), settings, FEATURES_VERSION], sort_keys=True, default=str
+        ).encode(),
+        digest_size=8,
+    ).hexdigest()
+
+
+# named sets of columns
+FEATURE_GROUPS: dict[str, tuple[str, ...]] = {
+    "structure": ("volume", "volume_per_atom", "n_sites", "formula"),
+    "symmetry": ("spg_symbol", "spg_num", "crystal_sys", "wyckoff", "n_wyckoff"),
+    "neighbors": ("graph_size", "isolated_r5"),
+    "composition": ("n_atoms", "n_elems", "mean_mass", "mean_radius"),
+}
+
+
+# derived columns of each dataset used by its analyze_*.py script
+DATASET_FEATURES: dict[str, tuple[str, ...]] = {
+    "matbench_dielectric": ("structure", "symmetry"),
+    "matbench_expt_gap": ("composition",),
+    "matbench_jdft2d": ("symmetry",),
+    "matbench_log_gvrh": ("structure", "symmetry", "neighbors"),
+    "matbench_log_kvrh": ("structure",),
+    "matbench_mp_e_form": ("structure",),
+    "matbench_mp_gap": ("structure",),
+    "matbench_perovskites": ("structure", "symmetry"),
+    "matbench_phonons": ("symmetry",),
+    "ricci_boltztrap_mp_tabular": ("symmetry",),
+}
+
+
+def add_columns(
+    df: pd.DataFrame,
+    structures: StructureBatch | None,
+    columns: Sequence[str],
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """Add derived columns to df (in place), computed in a single pass that shares
+    intermediate results between columns (see DerivedColumns).
+
+    Args:
+        df (pd.DataFrame): Dataset as returned by mat_eda.data.load_dataset().
+        structures (StructureBatch | None): The dataset's structures.
+        columns (Sequence[str]): Names in COLUMNS or isolated_r{radius}.
+        **kwargs: Passed to DerivedColumns, e.g. n_jobs.
+
+    Returns:
+        pd.DataFrame: df
+    """
+    for col, values in (
+        DerivedColumns(df, structures, **kwargs).compute(columns).items()
+    ):
+        df[col] = values
+    return df
+
+
+def add_features(
+    df: pd.DataFrame,
+    structures: StructureBatch | None,
+    groups: Sequence[str],
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """Add the columns of the given feature groups to df (in place).
+
+    Args:
+        df (pd.DataFrame): Dataset as returned by mat_eda.data.load_dataset().
+        structures (StructureBatch | None): The dataset's structures.
+        groups (Sequence[str]): Keys of FEATURE_GROUPS.
+        **kwargs: Passed to add_columns(), e.g. n_jobs.
+
+    Returns:
+        pd.DataFrame: df
+    """
+    columns = [col for group in groups for col in FEATURE_GROUPS[group]]
+    return add_columns(df, structures, columns, **kwargs)
+
+
+def featurize_dataset(
+    name: str, incremental: bool = False, **kwargs: Any
+) -> tuple[pd.DataFrame, FeatureDiff | None]:
+    """Load a dataset and add its derived columns (see DATASET_FEATURES).
+
+    Args:
+        name (str): Key of DATASET_FEATURES, e.g. "matbench_dielectric".
+        incremental (bool): Only featurize rows that were added or changed since
+            the last incremental run, see mat_eda.incremental. Defaults to False.
+        **kwargs: Passed to add_features().
+
+    Returns:
+        tuple[pd.DataFrame, FeatureDiff | None]: All non-structure columns of the
+            dataset plus derived ones and, if incremental, how many rows were
+            reused, featurized and dropped.
+    """
+    from mat_eda.data import load_dataset
+
+    if name not in DATASET_FEATURES:
+        raise ValueError(f"Unknown {name=}, must be one of {list(DATASET_FEATURES)}")
+    df, structures = load_dataset(name)
+    if incremental:
+        from mat_eda.incremental import incremental_features
+
+        return incremental_features(
+            name, df, structures, DATASET_FEATURES[name], **kwargs
+        )
+    return add_features(df, structures, DATASET_FEATURES[name], **kwargs), None
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Command line entry point writing derived columns to Parquet files."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "datasets", nargs="*", default=list(DATASET_FEATURES), help="Default: all"
+    )
+    parser.add_argument("-o", "--out-dir", default="features")
+    parser.add_argument("-j", "--n-jobs", type=int, help="Worker processes")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only featurize rows added or changed since the last incremental run",
+    )
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name in args.datasets:
+        df, diff = featurize_dataset(name, args.incremental, n_jobs=args.n_jobs)
+        if diff is not None:
+            print(
+                f"{name}: reused {diff.n_reused:,} rows, featurized "
+                f"{diff.n_computed:,}, dropped {diff.n_removed:,}"
+            )
+        out_path = f"{args.out_dir}/{name}-features.parquet"
+        df.to_parquet(out_path)
+        print(f"Wrote {out_path} ({len(df):,} rows)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
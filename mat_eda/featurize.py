@@ -0,0 +1,503 @@
+"""Parallel featurization of pymatgen Structures shared by all analyze_*.py scripts.
+
+Symmetry detection is the most expensive step when refreshing the EDA reports
+(~45 sec for the 10,987 matbench_log_gvrh structures when run serially), so these
+helpers fan it out over a process pool and store results in a persistent
+content-addressed cache (see mat_eda.cache) so re-runs only compute new structures.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import Counter
+from functools import partial
+from math import gcd
+from multiprocessing import Pool
+from typing import Any, Callable, Iterable, NamedTuple, Sequence
+
+import numpy as np
+from pymatgen.core import Structure
+from tqdm import tqdm
+
+from mat_eda import trace
+from mat_eda.cache import DiskCache, batch_hashes, structure_hash
+from mat_eda.structures import ELEMENT_SYMBOLS, StructureBatch
+
+
+_default_cache: DiskCache | None = None
+
+
+def get_default_cache() -> DiskCache:
+    """Shared DiskCache instance used when featurizers are called with cache=True."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DiskCache()
+    return _default_cache
+
+
+def default_n_jobs() -> int:
+    """Number of worker processes to use if not specified. Can be overridden with
+    the MAT_EDA_N_JOBS environment variable.
+    """
+    return int(os.getenv("MAT_EDA_N_JOBS", os.cpu_count() or 1))
+
+
+def parallel_map(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    n_jobs: int | None = None,
+    chunksize: int | None = None,
+    desc: str | None = None,
+) -> list[Any]:
+    """Apply func to every item using a process pool. Results are returned in input
+    order with a single progress bar aggregated over all workers.
+
+    Args:
+        func (Callable): Function to apply. Must be picklable, i.e. defined at
+            module level (or a functools.partial thereof).
+        items (Iterable): Inputs to func.
+        n_jobs (int, optional): Number of worker processes. Defaults to
+            default_n_jobs(). n_jobs=1 runs serially in the current process.
+        chunksize (int, optional): Number of items sent to a worker at once. Larger
+            chunks reduce inter-process overhead, smaller chunks balance load
+            better. Defaults to splitting items into ~4 chunks per worker.
+        desc (str, optional): Progress bar description.
+
+    Returns:
+        list: func(item) for each item in items.
+    """
+    items = items if isinstance(items, Sequence) else list(items)
+    n_jobs = min(n_jobs or default_n_jobs(), max(len(items), 1))
+
+    name = getattr(func, "func", func).__name__  # unwrap functools.partial
+    tracing = trace.is_enabled()
+    if tracing:
+        # time each item where it runs and send the events back with the results
+        func = partial(trace.traced_call, func, name)
+
+    with trace.span(f"parallel_map:{name}", items=len(items), n_jobs=n_jobs):
+        if n_jobs == 1:
+            results = [func(item) for item in tqdm(items, desc=desc)]
+        else:
+            if chunksize is None:
+                chunksize = max(1, len(items) // (4 * n_jobs))
+            with Pool(n_jobs) as pool:
+                imap = pool.imap(func, items, chunksize=chunksize)
+                results = list(tqdm(imap, total=len(items), desc=desc))
+
+    if tracing:
+        results, events = zip(*results) if results else ((), ())
+        trace.add_events(list(events))
+        results = list(results)
+    return results
+
+
+def cached_parallel_map(
+    func: Callable[[Structure], Any],
+    structures: StructureBatch | Iterable[Structure],
+    cache: DiskCache | bool = True,
+    cache_settings: dict[str, Any] | None = None,
+    batch_func: Callable[[StructureBatch], list[Any]] | None = None,
+    **kwargs: Any,
+) -> list[Any]:
+    """parallel_map() over structures that skips structures whose result is already
+    in the cache and stores newly computed results.
+
+    Args:
+        func (Callable): Function to apply to each structure.
+        structures (StructureBatch | Iterable[Structure]): Structures to process.
+        cache (DiskCache | bool): Cache to use. True means get_default_cache(),
+            False disables caching. Defaults to True.
+        cache_settings (dict, optional): Identifies func and any parameters that
+            affect its result. Hashed together with each structure to form its
+            cache key. Required if cache is enabled.
+        batch_func (Callable, optional): Same as func but takes a StructureBatch
+            and returns a list of results. Used instead of func if structures is a
+            StructureBatch, so workers read structures from shared memory (see
+            mat_eda.shared) instead of unpickling one Structure per item.
+        **kwargs: Passed to parallel_map() (or map_batch()).
+
+    Returns:
+        list: func(struct) for each structure in input order.
+    """
+    as_batch = batch_func is not None and isinstance(structures, StructureBatch)
+    if not as_batch:
+        structures = list(structures)
+
+    def compute(indices: list[int] | None = None) -> list[Any]:
+        """Results of all structures or those at the given indices."""
+        if as_batch:
+            from mat_eda.shared import map_batch
+
+            batch = structures if indices is None else structures.take(indices)
+            chunks = map_batch(batch_func, batch, **kwargs)
+            return [result for chunk in chunks for result in chunk]
+        if indices is not None:
+            return parallel_map(func, [structures[idx] for idx in indices], **kwargs)
+        return parallel_map(func, structures, **kwargs)
+
+    if cache is False or cache is None:
+        return compute()
+    if cache is True:
+        cache = get_default_cache()
+    if not cache_settings:
+        raise ValueError("cache_settings must identify func when caching")
+
+    with trace.span("cache_lookup") as span:
+        if as_batch:
+            keys = batch_hashes(structures, **cache_settings)
+        else:
+            keys = [structure_hash(struct, **cache_settings) for struct in structures]
+        cached = cache.get_many(keys)
+        span.set(items=len(keys), hits=len(cached))
+
+    todo = [idx for idx, key in enumerate(keys) if key not in cached]
+    if todo:
+        new = dict(zip([keys[idx] for idx in todo], compute(todo)))
+        cache.set_many(new)
+        cached.update(new)
+
+    return [cached[key] for key in keys]
+
+
+def _spacegroup_info(
+    struct: Structure, symprec: float, angle_tolerance: float
+) -> tuple[str, int]:
+    if not struct.is_ordered:
+        return struct.get_space_group_info(symprec, angle_tolerance)
+    # type sites by element like the batch path (and the cache key), so oxidation
+    # states don't change the result
+    atomic_nums = [site.specie.Z for site in struct]
+    return _cell_spacegroup_info(
+        struct.lattice.matrix, struct.frac_coords, atomic_nums, symprec, angle_tolerance
+    )
+
+
+def _cell_spacegroup_info(
+    lattice: np.ndarray,
+    frac_coords: np.ndarray,
+    types: Sequence[int],
+    symprec: float,
+    angle_tolerance: float,
+) -> tuple[str, int]:
+    import spglib
+
+    dataset = spglib.get_symmetry_dataset(
+        (lattice, frac_coords, types), symprec, angle_tolerance
+    )
+    if dataset is None:
+        raise ValueError(
+            f"spglib failed to find the symmetry of a structure with {len(types)} sites"
+        )
+    return dataset.international, int(dataset.number)
+
+
+def _batch_spacegroup_info(
+    batch: StructureBatch, symprec: float, angle_tolerance: float
+) -> list[tuple[str, int]]:
+    results = []
+    for idx in range(len(batch)):
+        sites = slice(batch.offsets[idx], batch.offsets[idx + 1])
+        results.append(
+            _cell_spacegroup_info(
+                batch.lattices[idx],
+                batch.frac_coords[sites],
+                batch.atomic_nums[sites],
+                symprec,
+                angle_tolerance,
+            )
+        )
+    return results
+
+
+@trace.traced("get_spacegroups")
+def get_spacegroups(
+    structures: StructureBatch | Iterable[Structure],
+    symprec: float = 0.01,
+    angle_tolerance: float = 5,
+    cache: DiskCache | bool = True,
+    **kwargs: Any,
+) -> list[tuple[str, int]]:
+    """Get space group symbols and numbers for many structures in parallel.
+
+    Args:
+        structures (StructureBatch | Iterable[Structure]): Structures to process.
+            Workers read StructureBatches from shared memory, see mat_eda.shared.
+        symprec (float): Symmetry tolerance passed to spglib. Defaults to 0.01.
+        angle_tolerance (float): Angle tolerance in degrees. Defaults to 5.
+        cache (DiskCache | bool): See cached_parallel_map(). Defaults to True.
+        **kwargs: Passed to parallel_map(), e.g. n_jobs, chunksize, desc.
+
+    Returns:
+        list[tuple[str, int]]: (spg_symbol, spg_num) for each structure.
+    """
+    kwargs.setdefault("desc", "Getting spacegroups")
+    settings = dict(symprec=symprec, angle_tolerance=angle_tolerance)
+    func = partial(_spacegroup_info, **settings)
+    results = cached_parallel_map(
+        func,
+        structures,
+        cache,
+        dict(func="spacegroup", **settings),
+        batch_func=partial(_batch_spacegroup_info, **settings),
+        **kwargs,
+    )
+    # JSON round trip through the cache turns tuples into lists
+    return [tuple(result) for result in results]
+
+
+# last space group number of each crystal system
+CRYSTAL_SYSTEMS = {
+    "triclinic": 2,
+    "monoclinic": 15,
+    "orthorhombic": 74,
+    "tetragonal": 142,
+    "trigonal": 167,
+    "hexagonal": 194,
+    "cubic": 230,
+}
+
+
+def crystal_system(spg_nums: Sequence[int]) -> list[str]:
+    """Crystal system of each space group number. Same as pymatviz.utils.
+    get_crystal_sys() but vectorized and without importing plotting packages.
+
+    Raises:
+        ValueError: If any space group number is outside 1 to 230.
+    """
+    spg_nums = np.asarray(spg_nums, dtype=int)
+    if len(spg_nums) and (spg_nums.min() < 1 or spg_nums.max() > 230):
+        raise ValueError("Space group numbers must be between 1 and 230")
+    names = np.array(list(CRYSTAL_SYSTEMS))
+    return names[np.searchsorted(list(CRYSTAL_SYSTEMS.values()), spg_nums)].tolist()
+
+
+# first letter of the Pearson symbol of each crystal system
+PEARSON_LETTERS = dict(
+    triclinic="a",
+    monoclinic="m",
+    orthorhombic="o",
+    tetragonal="t",
+    trigonal="h",
+    hexagonal="h",
+    cubic="c",
+)
+
+
+class SymmetryInfo(NamedTuple):
+    """Space group and Wyckoff positions of a structure from one spglib call."""
+
+    spg_symbol: str
+    spg_num: int
+    wyckoff: str
+    n_wyckoff: int
+
+
+def _symmetry_info(
+    struct: Structure, symprec: float, angle_tolerance: float
+) -> SymmetryInfo:
+    # type sites by element like the batch path (and the cache key), so oxidation
+    # states don't change the result
+    return _cell_symmetry_info(
+        struct.lattice.matrix,
+        struct.frac_coords,
+        [site.specie.Z for site in struct],
+        [site.specie.symbol for site in struct],
+        symprec,
+        angle_tolerance,
+    )
+
+
+def _batch_symmetry_info(
+    batch: StructureBatch, symprec: float, angle_tolerance: float
+) -> list[SymmetryInfo]:
+    offsets = batch.offsets
+    results = []
+    for idx in range(len(batch)):
+        sites = slice(offsets[idx], offsets[idx + 1])
+        atomic_nums = batch.atomic_nums[sites]
+        elements = [ELEMENT_SYMBOLS[Z] for Z in atomic_nums]
+        results.append(
+            _cell_symmetry_info(
+                batch.lattices[idx],
+                batch.frac_coords[sites],
+                atomic_nums,
+                elements,
+                symprec,
+                angle_tolerance,
+            )
+        )
+    return results
+
+
+def _cell_symmetry_info(
+    lattice: np.ndarray,
+    frac_coords: np.ndarray,
+    types: np.ndarray,
+    elements: list[str],
+    symprec: float,
+    angle_tolerance: float,
+) -> SymmetryInfo:
+    import spglib
+
+    cell = (lattice, frac_coords, types)
+    dataset = spglib.get_symmetry_dataset(cell, symprec, angle_tolerance)
+    if dataset is None:
+        formula = "".join(sorted(set(elements)))
+        raise ValueError(f"spglib failed to find the symmetry of {formula}")
+
+    # one Wyckoff position per orbit of symmetry-equivalent sites
+    orbits = np.unique(dataset.equivalent_atoms)
+    return SymmetryInfo(
+        spg_symbol=dataset.international,
+        spg_num=int(dataset.number),
+        wyckoff=aflow_label(
+            elements,
+            dataset.number,
+            dataset.international,
+            [(elements[idx], dataset.wyckoffs[idx]) for idx in orbits],
+            len(dataset.std_types),
+        ),
+        n_wyckoff=len(orbits),
+    )
+
+
+def aflow_label(
+    elements: Sequence[str],
+    spg_num: int,
+    spg_symbol: str,
+    wyckoffs: Sequence[tuple[str, str]],
+    n_conventional: int,
+) -> str:
+    """AFLOW-style prototype label like AB2_hP9_180_d_j:O-Si from a symmetry dataset.
+
+    Like aviary's get_aflow_label_spglib() but without canonicalizing Wyckoff
+    letters over equivalent settings of the space group, so equivalent structures
+    can get different labels (n_wyckoff doesn't depend on the setting).
+
+    Args:
+        elements (Sequence[str]): Element symbol of each site in the structure.
+        spg_num (int): Space group number.
+        spg_symbol (str): International space group symbol.
+        wyckoffs (Sequence[tuple[str, str]]): (element, Wyckoff letter) of each
+            orbit of symmetry-equivalent sites.
+        n_conventional (int): Number of sites in the conventional cell.
+
+    Returns:
+        str: {prototype formula}_{Pearson symbol}_{spg_num}_{Wyckoff letters of
+            each element}:{chemical system}
+
+    Examples:
+        Rutile TiO2, rock salt NaCl and cubic perovskite SrTiO3:
+
+        >>> aflow_label(["Ti"] * 2 + ["O"] * 4, 136, "P4_2/mnm",
+        ...             [("Ti", "a"), ("O", "f")], 6)
+        'A2B_tP6_136_f_a:O-Ti'
+        >>> aflow_label(["Cl"] * 4 + ["Na"] * 4, 225, "Fm-3m",
+        ...             [("Cl", "a"), ("Na", "b")], 8)
+        'AB_cF8_225_a_b:Cl-Na'
+        >>> aflow_label(["Sr", "Ti", "O", "O", "O"], 221, "Pm-3m",
+        ...             [("Sr", "a"), ("Ti", "b"), ("O", "c")], 5)
+        'A3BC_cP5_221_c_a_b:O-Sr-Ti'
+    """
+    counts = Counter(elements)
+    divisor = 0
+    for count in counts.values():
+        divisor = gcd(divisor, count)
+    # prototype letters A, B, ... and Wyckoff letters in alphabetical element order
+    order = sorted(counts)
+    formula = "".join(
+        f"{chr(65 + idx)}{amount if (amount := counts[elem] // divisor) > 1 else ''}"
+        for idx, elem in enumerate(order)
+    )
+
+    centering = "C" if spg_symbol[0] in "ABCS" else spg_symbol[0]
+    # AFLOW counts sites of the rhombohedral primitive cell, spglib the hexagonal one
+    n_sites = n_conventional // 3 if centering == "R" else n_conventional
+    crys_sys = crystal_system([spg_num])[0]
+    pearson = f"{PEARSON_LETTERS[crys_sys]}{centering}{n_sites}"
+
+    elem_wyckoffs = []
+    for elem in order:
+        letters = Counter(letter for el, letter in wyckoffs if el == elem)
+        elem_wyckoffs.append(
+            "".join(
+                f"{count if count > 1 else ''}{letter}"
+                for letter, count in sorted(letters.items())
+            )
+        )
+    chemsys = "-".join(order)
+    return f"{formula}_{pearson}_{spg_num}_{'_'.join(elem_wyckoffs)}:{chemsys}"
+
+
+@trace.traced("get_symmetry_info")
+def get_symmetry_info(
+    structures: StructureBatch | Iterable[Structure],
+    symprec: float = 0.01,
+    angle_tolerance: float = 5,
+    cache: DiskCache | bool = True,
+    **kwargs: Any,
+) -> list[SymmetryInfo]:
+    """Get space group symbol and number, AFLOW-style Wyckoff label and number of
+    Wyckoff positions of many structures in parallel. Runs spglib once per
+    structure instead of once in get_spacegroups() and again in
+    get_wyckoff_labels(), and doesn't need aviary.
+
+    Args:
+        structures (StructureBatch | Iterable[Structure]): Structures to process.
+            Workers read StructureBatches from shared memory, see mat_eda.shared.
+        symprec (float): Symmetry tolerance passed to spglib. Defaults to 0.01
+            like get_spacegroups() (aviary uses 0.1 for Wyckoff labels).
+        angle_tolerance (float): Angle tolerance in degrees. Defaults to 5.
+        cache (DiskCache | bool): See cached_parallel_map(). Defaults to True.
+        **kwargs: Passed to parallel_map(), e.g. n_jobs, chunksize, desc.
+
+    Returns:
+        list[SymmetryInfo]: (spg_symbol, spg_num, wyckoff, n_wyckoff) for each
+            structure.
+    """
+    kwargs.setdefault("desc", "Getting symmetry")
+    settings = dict(symprec=symprec, angle_tolerance=angle_tolerance)
+    func = partial(_symmetry_info, **settings)
+    results = cached_parallel_map(
+        func,
+        structures,
+        cache,
+        # version 2: prototype formula and Wyckoff letters in alphabetical order
+        dict(func="symmetry_info", version=2, **settings),
+        batch_func=partial(_batch_symmetry_info, **settings),
+        **kwargs,
+    )
+    # JSON round trip through the cache turns named tuples into lists
+    return [SymmetryInfo(*result) for result in results]
+
+
+def _aflow_label(struct: Structure) -> str:
+    # aviary pulls in torch, so only import it in workers that need it
+    from aviary.wren.utils import get_aflow_label_spglib
+
+    # cache keys (see structure_hash()) ignore oxidation states, so labels must too
+    struct = struct.copy()
+    struct.remove_oxidation_states()
+    return get_aflow_label_spglib(struct)
+
+
+@trace.traced("get_wyckoff_labels")
+def get_wyckoff_labels(
+    structures: Iterable[Structure], cache: DiskCache | bool = True, **kwargs: Any
+) -> list[str]:
+    """Get AFLOW-style Wyckoff labels for many structures in parallel.
+
+    Args:
+        structures (Iterable[Structure]): pymatgen Structures.
+        cache (DiskCache | bool): See cached_parallel_map(). Defaults to True.
+        **kwargs: Passed to parallel_map(), e.g. n_jobs, chunksize, desc.
+
+    Returns:
+        list[str]: Wyckoff label for each structure.
+    """
+    kwargs.setdefault("desc", "Getting Wyckoff strings")
+    # aviary's get_aflow_label_spglib() uses symprec=0.1
+    # version 2: labels of oxidation-state decorated structures ignore the states
+    settings = dict(func="aflow_label_spglib", symprec=0.1, version=2)
+    return cached_parallel_map(_aflow_label, structures, cache, settings, **kwargs)
@@ -0,0 +1,151 @@
+"""Featurize only the rows of a dataset that changed since the last run.
+
+When a new version of a dataset is released, most rows are unchanged. Every
+featurization run stores a snapshot with the derived columns of each row and a
+hash of the row's inputs (its structure, or its non-structure columns for
+composition-only datasets). incremental_features() hashes the rows of the new
+version, reuses the derived columns of rows whose hash is in the snapshot and only
+runs the feature groups on added or changed rows. Rows are matched by content, not
+position, so reordered, inserted and deleted rows are handled too. The snapshot is
+then replaced with the features of the current version.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any, NamedTuple, Sequence
+
+import numpy as np
+import pandas as pd
+
+from mat_eda import trace
+from mat_eda.cache import CACHE_DIR
+from mat_eda.features import add_features, settings_hash
+from mat_eda.structures import StructureBatch
+
+
+SNAPSHOT_DIR = f"{CACHE_DIR}/feature-snapshots"
+
+
+class FeatureDiff(NamedTuple):
+    """Rows whose features were reused, computed or dropped from the snapshot."""
+
+    n_reused: int
+    n_computed: int
+    n_removed: int
+
+
+def structure_row_hashes(structures: StructureBatch, decimals: int = 6) -> list[str]:
+    """Content hash of each structure in a batch. Coordinates are rounded so that
+    float noise from serialization doesn't change the hash.
+    """
+    # adding 0.0 turns -0.0 into 0.0
+    lattices = np.round(structures.lattices, decimals) + 0.0
+    frac_coords = np.round(structures.frac_coords, decimals) + 0.0
+    offsets = structures.offsets
+    return [
+        hashlib.blake2b(
+            lattices[idx].tobytes()
+            + frac_coords[offsets[idx] : offsets[idx + 1]].tobytes()
+            + structures.atomic_nums[offsets[idx] : offsets[idx + 1]].tobytes(),
+            digest_size=16,
+        ).hexdigest()
+        for idx in range(len(structures))
+    ]
+
+
+def row_hashes(
+    df: pd.DataFrame,
+    structures: StructureBatch | None,
+    input_cols: Sequence[str] | None = None,
+) -> pd.Series:
+    """Hash of the featurization inputs of each row.
+
+    Args:
+        df (pd.DataFrame): Non-structure columns of the dataset.
+        structures (StructureBatch | None): The dataset's structures.
+        input_cols (Sequence[str], optional): Columns of df the features depend
+            on. Defaults to none if there are structures, else all columns.
+
+    Returns:
+        pd.Series: Hex digests with the same index as df.
+    """
+    if input_cols is None:
+        input_cols = [] if structures is not None else list(df)
+    hashes = pd.Series("", index=df.index, dtype=object)
+    if structures is not None:
+        hashes += structure_row_hashes(structures)
+    if input_cols:
+        col_hashes = pd.util.hash_pandas_object(df[list(input_cols)], index=False)
+        hashes += col_hashes.map("{:016x}".format).to_numpy()
+    return hashes
+
+
+def snapshot_path(name: str, groups: Sequence[str], **kwargs: Any) -> str:
+    """Snapshot file of a dataset featurized with the given groups and settings
+    (see mat_eda.features.settings_hash()).
+    """
+    file_name = f"{'+'.join(groups)}-{settings_hash(groups, **kwargs)}.parquet"
+    return f"{SNAPSHOT_DIR}/{name}/{file_name}"
+
+
+def incremental_features(
+    name: str,
+    df: pd.DataFrame,
+    structures: StructureBatch | None,
+    groups: Sequence[str],
+    input_cols: Sequence[str] | None = None,
+    path: str | None = None,
+    **kwargs: Any,
+) -> tuple[pd.DataFrame, FeatureDiff]:
+    """Like add_features() but reuses the features of rows that are unchanged
+    since the last call for this dataset.
+
+    Args:
+        name (str): Dataset name, identifies the snapshot.
+        df (pd.DataFrame): Non-structure columns of the current dataset version.
+        structures (StructureBatch | None): Its structures.
+        groups (Sequence[str]): Keys of mat_eda.features.FEATURE_GROUPS.
+        input_cols (Sequence[str], optional): See row_hashes().
+        path (str, optional): Snapshot file. Defaults to snapshot_path().
+        **kwargs: Passed to add_features().
+
+    Returns:
+        tuple[pd.DataFrame, FeatureDiff]: df with derived columns added (in place)
+            and how many rows were reused, computed or removed.
+    """
+    path = path or snapshot_path(name, groups, **kwargs)
+    with trace.span("incremental_features", dataset=name, items=len(df)) as span:
+        hashes = row_hashes(df, structures, input_cols).to_numpy()
+        snapshot = pd.DataFrame()
+        if os.path.isfile(path):
+            snapshot = pd.read_parquet(path).set_index("row_hash")
+        snapshot = snapshot[~snapshot.index.duplicated()]
+
+        todo = np.flatnonzero(~pd.Index(hashes).isin(snapshot.index))
+        # derived columns of every current row, looked up by row hash
+        features = snapshot
+        if len(todo) > 0 or snapshot.empty:
+            new = df.iloc[todo].copy()
+            new_structs = None if structures is None else structures.take(todo)
+            add_features(new, new_structs, groups, **kwargs)
+            new = new[[col for col in new if col not in df]]
+            new.index = pd.Index(hashes[todo], name="row_hash")
+            features = pd.concat([snapshot, new]) if len(snapshot) else new
+            features = features[~features.index.duplicated()]
+        for col in features:
+            df[col] = features[col].reindex(hashes).to_numpy()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        current = features.loc[features.index.isin(hashes)]
+        current.reset_index().to_parquet(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+        diff = FeatureDiff(
+            n_reused=len(df) - len(todo),
+            n_computed=len(todo),
+            n_removed=int((~snapshot.index.isin(hashes)).sum()),
+        )
+        span.set(**diff._asdict())
+    return df, diff
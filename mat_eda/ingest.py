@@ -0,0 +1,390 @@
+"""Streaming conversion of large JSON arrays of records into Parquet files.
+
+json.load() on a file like the CAMD 2022 dataset (~100k records) needs several times
+the file size in RAM. iter_json_array() instead decodes one record at a time from a
+fixed-size text buffer and json_array_to_parquet() writes records out in row groups,
+so peak memory is set by row_group_size rather than file size.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+import os
+import re
+from itertools import islice
+from typing import IO, Any, Iterable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+WHITESPACE = re.compile(r"\s*")
+
+
+class _JsonReader:
+    """Incremental JSON tokenizer over a binary file. Holds at most chunk_size
+    bytes of text plus the value currently being decoded.
+    """
+
+    def __init__(self, file: IO[bytes], chunk_size: int) -> None:
+        self.file, self.chunk_size = file, chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer, self.pos, self.eof = "", 0, False
+
+    def read_more(self) -> None:
+        chunk = self.file.read(self.chunk_size)
+        self.eof = not chunk
+        # drop already parsed text so the buffer stays bounded by chunk_size plus
+        # the size of the largest value
+        self.buffer = self.buffer[self.pos :] + self.utf8_decoder.decode(
+            chunk, final=self.eof
+        )
+        self.pos = 0
+
+    def next_token(self) -> str:
+        """Skip whitespace, reading more data as needed. Returns "" at EOF."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]
+            self.read_more()
+
+    def expect(self, token: str, message: str) -> None:
+        if self.next_token() != token:
+            raise ValueError(message)
+        self.pos += 1
+
+    def value(self, delimiters: str) -> Any:
+        """Decode the next value, which must be followed by one of delimiters."""
+        while True:
+            self.next_token()
+            try:
+                obj, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self.read_more()  # value is cut off at the end of the buffer
+                continue
+            # a value is only complete once it's followed by a delimiter, e.g. the
+            # number 3.5 might be the start of 3.5e10 cut off by the buffer end
+            delim_pos = WHITESPACE.match(self.buffer, end).end()
+            if (
+                delim_pos == len(self.buffer)
+                or self.buffer[delim_pos] not in delimiters
+            ):
+                if self.eof:
+                    raise ValueError(
+                        f"Expected one of {delimiters!r} after {obj!r:.50}"
+                    )
+                self.read_more()
+                continue
+            self.pos = end
+            return obj
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield the elements of the array whose "[" was just consumed."""
+        expect_value, after_comma = True, False
+        while True:
+            token = self.next_token()
+            if token == "]":
+                if after_comma:
+                    raise ValueError("Trailing comma in JSON array")
+                self.pos += 1
+                return
+            if token == "":
+                raise ValueError("Unexpected end of file inside JSON array")
+            if token == "," and not expect_value:
+                self.pos += 1
+                expect_value = after_comma = True
+                continue
+            obj = self.value(",]")
+            expect_value = after_comma = False
+            yield obj
+
+
+def iter_json_array(
+    file: str | IO[bytes], chunk_size: int = 1024**2
+) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array one at a time without reading
+    the whole file into memory.
+
+    Args:
+        file (str | IO[bytes]): Path or binary file object containing a JSON array.
+        chunk_size (int): Bytes to read at a time. Defaults to 1 MiB.
+
+    Raises:
+        ValueError: If the file doesn't contain a JSON array (e.g. has a trailing
+            comma).
+
+    Yields:
+        Any: Decoded array elements.
+    """
+    if isinstance(file, str):
+        with open(file, "rb") as opened_file:
+            yield from iter_json_array(opened_file, chunk_size)
+        return
+
+    reader = _JsonReader(file, chunk_size)
+    reader.expect("[", "Expected a JSON array")
+    yield from reader.iter_array()
+
+
+def split_json_rows(
+    file: IO[bytes], key: str = "data", chunk_size: int = 1024**2
+) -> tuple[dict[str, Any], Iterator[Any]]:
+    """Read a top-level JSON object up to its (large) array member key and stream
+    that array, e.g. {"index": [...], "columns": [...], "data": [[...], ...]} as
+    written by pandas' to_json(orient="split") and matminer.
+
+    Args:
+        file (IO[bytes]): Binary file object containing a JSON object. Must stay
+            open until the returned iterator is exhausted.
+        key (str): Member whose array to stream. Defaults to "data".
+        chunk_size (int): Bytes to read at a time. Defaults to 1 MiB.
+
+    Raises:
+        ValueError: If the file isn't a JSON object or has no array member key.
+
+    Returns:
+        tuple[dict[str, Any], Iterator[Any]]: Members preceding key (members after
+            it are skipped) and an iterator over the elements of key's array.
+
+    Examples:
+        >>> import io
+        >>> data = b'{"columns": ["a", "b"], "data": [[1, 2], [3, 4]]}'
+        >>> header, rows = split_json_rows(io.BytesIO(data))
+        >>> header, list(rows)
+        ({'columns': ['a', 'b']}, [[1, 2], [3, 4]])
+    """
+    reader = _JsonReader(file, chunk_size)
+    reader.expect("{", "Expected a JSON object")
+    header: dict[str, Any] = {}
+    while reader.next_token() != "}":
+        name = reader.value(":")
+        reader.expect(":", "Expected ':' after object key")
+        if name == key:
+            reader.expect("[", f"Expected {key!r} to be an array")
+            return header, reader.iter_array()
+        header[name] = reader.value(",}")
+        if reader.next_token() == ",":
+            reader.pos += 1
+    raise ValueError(f"JSON object has no member {key!r}")
+
+
+def _arrow_type(values: list[Any]) -> pa.DataType:
+    """Column type for a list of JSON values. Integers are stored as floats so later
+    row groups can contain nulls or non-integer numbers without breaking the
+    schema. Nested values are stored as (JSON) strings. Lists without any non-null
+    value get the null type, which _widen() merges with any other type.
+    """
+    types = {type(val) for val in values if val is not None}
+    if not types:
+        return pa.null()
+    if types == {bool}:
+        return pa.bool_()
+    if types and types <= {int, float}:
+        return pa.float64()
+    return pa.string()
+
+
+def _normalize(value: Any, dtype: pa.DataType) -> Any:
+    if value is None:
+        return None
+    if dtype == pa.string():
+        return value if isinstance(value, str) else json.dumps(value)
+    if dtype == pa.float64():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError(f"Expected a number, got {value!r}")
+        return float(value)
+    return value
+
+
+def _widen(schema: pa.Schema, other: pa.Schema) -> pa.Schema:
+    """Schema that can hold the values of both schemas: columns of other missing
+    from schema are appended, all-null columns take the type of the other schema,
+    mixed integer and float columns become float64 and columns whose types
+    otherwise conflict become strings. Keeps schema's metadata.
+
+    >>> _widen(pa.schema({"a": pa.float64()}), pa.schema({"a": pa.null()}))
+    a: double
+    >>> _widen(pa.schema({"a": pa.null()}), pa.schema({"a": pa.bool_()}))
+    a: bool
+    >>> _widen(pa.schema({"a": pa.int64()}), pa.schema({"a": pa.float64()}))
+    a: double
+    >>> _widen(pa.schema({"a": pa.float64()}), pa.schema({"a": pa.string()}))
+    a: string
+    """
+    fields = []
+    for field in schema:
+        idx = other.get_field_index(field.name)
+        other_type = pa.null() if idx == -1 else other.field(idx).type
+        if field.type == pa.null():
+            field = field.with_type(other_type)
+        elif other_type in (pa.null(), field.type):
+            pass
+        elif all(
+            pa.types.is_integer(typ) or pa.types.is_floating(typ)
+            for typ in (field.type, other_type)
+        ):
+            field = field.with_type(pa.float64())
+        else:
+            field = field.with_type(pa.string())
+        fields.append(field)
+    fields += [field for field in other if field.name not in schema.names]
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Cast a table written with an earlier, narrower schema to schema."""
+    columns = [
+        table[field.name].cast(field.type)
+        if field.name in table.column_names
+        else pa.nulls(len(table), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def _records_to_table(records: list[dict[str, Any]], schema: pa.Schema) -> pa.Table:
+    columns = {
+        field.name: [_normalize(rec.get(field.name), field.type) for rec in records]
+        for field in schema
+    }
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def tables_to_parquet(tables: Iterable[pa.Table], out_path: str) -> int:
+    """Write tables with possibly differing schemas to one Parquet file, one row
+    group per table, without holding more than one table in memory.
+
+    The schema of the first table is widened as needed by later ones (see
+    _widen()): new columns are added (null in earlier rows), columns that are all
+    null in one table take the type of the others, integer columns that later hold
+    floats become float64 and columns with otherwise conflicting types become
+    strings. Since a Parquet file has a single schema, tables after the first
+    schema change are spooled to separate files and everything is rewritten with
+    the final schema at the end, one row group at a time. Output is written to
+    out_path + ".tmp" and only renamed to out_path once complete, so an
+    interrupted conversion never leaves a truncated file behind.
+
+    Args:
+        tables (Iterable[pa.Table]): Row groups to write. Writes an empty file
+            without columns if there are none.
+        out_path (str): Parquet file to write.
+
+    Returns:
+        int: Number of rows written.
+    """
+    tmp_path = f"{out_path}.tmp"
+    writer: pq.ParquetWriter | None = None
+    schema: pa.Schema | None = None
+    # row groups written after the schema first changed
+    parts: list[str] = []
+    n_rows = 0
+
+    try:
+        for table in tables:
+            if schema is None:
+                schema = table.schema
+                writer = pq.ParquetWriter(tmp_path, schema)
+            widened = _widen(schema, table.schema)
+            if parts or not widened.equals(schema):
+                schema = widened
+                parts.append(f"{tmp_path}.part{len(parts)}")
+                pq.write_table(table, parts[-1])
+            else:
+                writer.write_table(_conform(table, schema))  # type: ignore
+            n_rows += len(table)
+        if writer is None:
+            schema = pa.schema([])
+            writer = pq.ParquetWriter(tmp_path, schema)
+        writer.close()
+        writer = None
+        if parts:
+            merged_path = f"{tmp_path}.merged"
+            with pq.ParquetWriter(merged_path, schema) as merged:
+                for path in [tmp_path, *parts]:
+                    part = pq.ParquetFile(path)
+                    for idx in range(part.num_row_groups):
+                        merged.write_table(
+                            _conform(part.read_row_group(idx), schema)  # type: ignore
+                        )
+            os.replace(merged_path, tmp_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        for path in parts:
+            if os.path.isfile(path):
+                os.remove(path)
+    os.replace(tmp_path, out_path)
+    return n_rows
+
+
+def json_array_to_parquet(
+    file: str | IO[bytes],
+    out_path: str,
+    row_group_size: int = 10_000,
+    chunk_size: int = 1024**2,
+) -> int:
+    """Convert a JSON array of records (objects) into a Parquet file one row group
+    at a time.
+
+    The schema is inferred from each row group and widened as described in
+    tables_to_parquet(), e.g. columns whose values change type (numbers in the
+    first row group, strings later on) become string columns, while row groups in
+    which a column is all null don't change its type. Keys missing from a record
+    become nulls.
+
+    Args:
+        file (str | IO[bytes]): Path or binary file object containing a JSON array
+            of objects.
+        out_path (str): Parquet file to write.
+        row_group_size (int): Records per row group. Peak memory scales with this.
+            Defaults to 10,000.
+        chunk_size (int): Bytes of JSON to read at a time. Defaults to 1 MiB.
+
+    Returns:
+        int: Number of records written.
+
+    Examples:
+        A row group of nulls between numbers keeps the column numeric:
+
+        >>> import io, tempfile
+        >>> values = [1.5] * 3 + [None] * 3 + [2] * 3
+        >>> data = json.dumps([{"a": val} for val in values]).encode()
+        >>> path = f"{tempfile.mkdtemp()}/out.parquet"
+        >>> json_array_to_parquet(io.BytesIO(data), path, row_group_size=3)
+        9
+        >>> pq.read_table(path).column("a").to_pylist()
+        [1.5, 1.5, 1.5, None, None, None, 2.0, 2.0, 2.0]
+    """
+
+    def row_groups() -> Iterator[pa.Table]:
+        schema: pa.Schema | None = None
+        records: list[dict[str, Any]] = []
+        records_iter = iter_json_array(file, chunk_size)
+        while True:
+            for record in islice(records_iter, row_group_size):
+                if not isinstance(record, dict):
+                    raise TypeError(
+                        f"Expected JSON objects, got {type(record).__name__}"
+                    )
+                records.append(record)
+            if not records and schema is not None:
+                return
+            keys = dict.fromkeys(key for rec in records for key in rec)
+            inferred = pa.schema(
+                [(key, _arrow_type([rec.get(key) for rec in records])) for key in keys]
+            )
+            # normalize values to the widened schema, e.g. numbers in a column
+            # that became a string column are stored as JSON
+            schema = inferred if schema is None else _widen(schema, inferred)
+            yield _records_to_table(records, schema)
+            if len(records) < row_group_size:
+                return
+            records.clear()
+
+    return tables_to_parquet(row_groups(), out_path)
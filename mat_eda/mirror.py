@@ -0,0 +1,272 @@
+"""Local, verified mirror of the matminer datasets used in this repo.
+
+Without a mirror, every analyze_*.py script downloads its dataset the first time it
+calls load_dataset(), one blocking download at a time, which fails on compute nodes
+without internet access. prefetch() downloads all datasets concurrently (resuming
+partial downloads) into MIRROR_DIR (MAT_EDA_MIRROR_DIR env var, default
+.cache/mirror), checks each file's SHA-256 against matminer's dataset metadata and
+records it in a manifest.json. The mirror uses matminer's data_home layout
+({name}.json.gz), and mat_eda.data.load_dataset() reads mirrored datasets from it
+instead of downloading. Set MAT_EDA_OFFLINE=1 to make loading a dataset that isn't
+mirrored an error instead of a download.
+
+    python -m mat_eda.mirror  # prefetch all datasets
+    python -m mat_eda.mirror --verify  # re-hash mirrored files
+    python -m mat_eda.mirror --base-url http://localhost:8000  # another server
+
+--base-url fetches {base_url}/{name}.json.gz instead of the URLs in matminer's
+metadata, e.g. from an internal file server or a local stand-in for testing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Sequence
+
+import requests
+
+from mat_eda.cache import CACHE_DIR
+from mat_eda.download import download
+from mat_eda.mp import pooled_session
+
+
+MIRROR_DIR = os.getenv("MAT_EDA_MIRROR_DIR", f"{CACHE_DIR}/mirror")
+
+MATBENCH_DATASETS = (
+    "matbench_dielectric",
+    "matbench_expt_gap",
+    "matbench_expt_is_metal",
+    "matbench_glass",
+    "matbench_jdft2d",
+    "matbench_log_gvrh",
+    "matbench_log_kvrh",
+    "matbench_mp_e_form",
+    "matbench_mp_gap",
+    "matbench_mp_is_metal",
+    "matbench_perovskites",
+    "matbench_phonons",
+    "matbench_steels",
+)
+MIRROR_DATASETS = (*MATBENCH_DATASETS, "boltztrap_mp", "ricci_boltztrap_mp_tabular")
+
+
+def dataset_sources(
+    names: Sequence[str] = MIRROR_DATASETS, base_url: str | None = None
+) -> dict[str, tuple[str, str | None]]:
+    """Download URL and SHA-256 of each dataset from matminer's metadata.
+
+    Args:
+        names (Sequence[str]): matminer dataset names. Defaults to
+            MIRROR_DATASETS.
+        base_url (str, optional): Fetch {base_url}/{name}.json.gz instead of the
+            URL in matminer's metadata. Checksums still come from matminer if it's
+            installed, else they're recorded on download without verification.
+
+    Returns:
+        dict[str, tuple[str, str | None]]: Dataset names mapped to (url, sha256).
+    """
+    try:
+        from matminer.datasets.utils import _load_dataset_dict
+
+        metadata = _load_dataset_dict()
+    except ImportError:
+        if base_url is None:
+            raise
+        metadata = {}
+
+    sources = {}
+    for name in names:
+        meta = metadata.get(name, {})
+        if base_url is None and "url" not in meta:
+            raise ValueError(f"Unknown dataset {name!r}, not in matminer's metadata")
+        url = f"{base_url.rstrip('/')}/{name}.json.gz" if base_url else meta["url"]
+        sources[name] = (url, meta.get("hash"))
+    return sources
+
+
+def file_sha256(path: str, chunk_size: int = 1024**2) -> str:
+    """Hex SHA-256 of a file, read in chunks."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def read_manifest(mirror_dir: str = MIRROR_DIR) -> dict[str, dict[str, Any]]:
+    """Mirrored datasets mapped to their file, size, sha256, url and fetch time."""
+    path = f"{mirror_dir}/manifest.json"
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_manifest(manifest: dict[str, dict[str, Any]], mirror_dir: str) -> None:
+    tmp_path = f"{mirror_dir}/manifest.json.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, f"{mirror_dir}/manifest.json")
+
+
+def _fetch(
+    name: str,
+    url: str,
+    sha256: str | None,
+    mirror_dir: str,
+    session: requests.Session,
+    timeout: float,
+) -> dict[str, Any]:
+    """Download one dataset into the mirror and verify it. Returns its manifest
+    entry.
+    """
+    path = f"{mirror_dir}/{name}.json.gz"
+    download(url, path, session=session, timeout=timeout, desc=name)
+    digest = file_sha256(path)
+    if sha256 is not None and digest != sha256:
+        os.remove(path)  # don't resume from a corrupt file next time
+        raise ValueError(f"{name}: checksum mismatch, expected {sha256} got {digest}")
+    return dict(
+        file=os.path.basename(path),
+        size=os.path.getsize(path),
+        sha256=digest,
+        url=url,
+        fetched_at=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    )
+
+
+def prefetch(
+    names: Sequence[str] = MIRROR_DATASETS,
+    mirror_dir: str = MIRROR_DIR,
+    max_workers: int = 4,
+    base_url: str | None = None,
+    sources: dict[str, tuple[str, str | None]] | None = None,
+    session: requests.Session | None = None,
+    timeout: float = 60,
+) -> dict[str, dict[str, Any]]:
+    """Download datasets into the mirror concurrently. Datasets already in the
+    manifest (with a file of the recorded size) are skipped.
+
+    Args:
+        names (Sequence[str]): matminer dataset names. Defaults to
+            MIRROR_DATASETS.
+        mirror_dir (str): Mirror directory. Defaults to MIRROR_DIR.
+        max_workers (int): Max concurrent downloads. Defaults to 4.
+        base_url (str, optional): See dataset_sources().
+        sources (dict[str, tuple[str, str | None]], optional): Dataset names
+            mapped to (url, sha256). Defaults to dataset_sources(names, base_url).
+        session (requests.Session, optional): Defaults to pooled_session().
+        timeout (float): Seconds to wait for the server to respond. Defaults to 60.
+
+    Raises:
+        RuntimeError: Listing all datasets that failed to download or verify
+            (after all other downloads finished and were recorded).
+
+    Returns:
+        dict[str, dict[str, Any]]: The updated manifest.
+    """
+    os.makedirs(mirror_dir, exist_ok=True)
+    manifest = read_manifest(mirror_dir)
+    todo = [
+        name
+        for name in names
+        if not (
+            name in manifest
+            and os.path.isfile(path := f"{mirror_dir}/{manifest[name]['file']}")
+            and os.path.getsize(path) == manifest[name]["size"]
+        )
+    ]
+    if not todo:
+        return manifest
+    sources = sources or dataset_sources(todo, base_url)
+    session = session or pooled_session(max_workers)
+
+    errors = []
+    with ThreadPoolExecutor(max_workers) as executor:
+        futures = {
+            executor.submit(
+                _fetch, name, *sources[name], mirror_dir, session, timeout
+            ): name
+            for name in todo
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                manifest[name] = future.result()
+            except (OSError, ValueError, requests.RequestException) as exc:
+                errors.append(f"{name}: {exc}")
+                continue
+            _write_manifest(manifest, mirror_dir)  # keep finished ones on errors
+    if errors:
+        raise RuntimeError("Failed to mirror datasets:\n" + "\n".join(errors))
+    return manifest
+
+
+def verify_mirror(mirror_dir: str = MIRROR_DIR) -> list[str]:
+    """Re-hash all mirrored files.
+
+    Returns:
+        list[str]: Names of datasets whose file is missing or doesn't match its
+            manifest checksum.
+    """
+    return [
+        name
+        for name, entry in read_manifest(mirror_dir).items()
+        if not os.path.isfile(path := f"{mirror_dir}/{entry['file']}")
+        or file_sha256(path) != entry["sha256"]
+    ]
+
+
+def mirror_kwargs(name: str, mirror_dir: str = MIRROR_DIR) -> dict[str, Any]:
+    """Keyword arguments making matminer.datasets.load_dataset() read a dataset
+    from the mirror. Empty if the dataset isn't mirrored (then matminer downloads
+    it as usual).
+
+    Raises:
+        FileNotFoundError: If the dataset isn't mirrored and the MAT_EDA_OFFLINE
+            environment variable is set.
+    """
+    if name in read_manifest(mirror_dir):
+        return dict(data_home=mirror_dir, download_if_missing=False)
+    if os.getenv("MAT_EDA_OFFLINE"):
+        raise FileNotFoundError(
+            f"{name} isn't in the mirror at {mirror_dir} and MAT_EDA_OFFLINE is "
+            "set. Run python -m mat_eda.mirror on a machine with internet access."
+        )
+    return {}
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "datasets", nargs="*", default=MIRROR_DATASETS, help="Default: all"
+    )
+    parser.add_argument("--mirror-dir", default=MIRROR_DIR)
+    parser.add_argument("--base-url", help="Fetch {base_url}/{name}.json.gz")
+    parser.add_argument("-j", "--max-workers", type=int, default=4)
+    parser.add_argument(
+        "--verify", action="store_true", help="Re-hash mirrored files and exit"
+    )
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        if bad := verify_mirror(args.mirror_dir):
+            print(f"Corrupt or missing: {', '.join(bad)}")
+            return 1
+        print(f"All {len(read_manifest(args.mirror_dir))} mirrored datasets OK")
+        return 0
+
+    manifest = prefetch(args.datasets, args.mirror_dir, args.max_workers, args.base_url)
+    total = sum(entry["size"] for entry in manifest.values())
+    print(f"{len(manifest)} datasets ({total / 1e6:,.1f} MB) in {args.mirror_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
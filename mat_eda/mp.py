@@ -0,0 +1,194 @@
+"""Bulk structure downloads from the Materials Project (MP) legacy REST API.
+
+Querying all ~48k task IDs of the ricci_boltztrap_mp_tabular dataset with a single
+MPRester.query() call means one huge request without retries or progress that has
+to be repeated from scratch if anything goes wrong. fetch_structures() instead
+splits IDs into batches that are queried concurrently over one pooled HTTP session
+with retries and exponential backoff. Every finished batch is written to a local
+DiskCache so reruns only request IDs that aren't stored yet.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Sequence
+
+import requests
+from pymatgen.core import SETTINGS, Structure
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.util.retry import Retry
+
+from mat_eda.cache import CACHE_DIR, DiskCache
+
+
+MP_API_URL = "https://legacy.materialsproject.org/rest/v2"
+
+
+def pooled_session(
+    max_workers: int = 8, retries: int = 5, backoff: float = 1
+) -> requests.Session:
+    """HTTP session whose connection pool is large enough to be shared by
+    max_workers threads and that retries failed requests with exponential backoff.
+
+    Args:
+        max_workers (int): Max number of concurrent connections per host.
+            Defaults to 8.
+        retries (int): Max retries per request on connection errors, 429 (rate
+            limited) and 5xx responses. Defaults to 5.
+        backoff (float): Wait backoff * 2^(n_retry - 1) seconds between retries
+            (unless the server sends a Retry-After header). Defaults to 1.
+
+    Returns:
+        requests.Session: For http:// and https:// URLs.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # MP queries are POST requests but read-only, so safe to repeat
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _query_batch(
+    session: requests.Session,
+    url: str,
+    api_key: str | None,
+    task_ids: Sequence[str],
+    timeout: float,
+) -> dict[str, dict[str, Any] | None]:
+    """Fetch structures for one batch of task IDs. Maps each requested ID to a
+    Structure dict or None if MP doesn't know it.
+
+    Raises:
+        ValueError: If the response is invalid or a document lacks task_ids or
+            structure.
+    """
+    payload = {
+        "criteria": json.dumps({"task_ids": {"$in": list(task_ids)}}),
+        "properties": json.dumps(["task_ids", "structure"]),
+    }
+    headers = {"x-api-key": api_key} if api_key else {}
+    resp = session.post(f"{url}/query", data=payload, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    data = resp.json()
+    if not data.get("valid_response"):
+        raise ValueError(f"Invalid MP API response: {data.get('error', data)}")
+
+    # a material can be listed under several task IDs, map all requested ones
+    structures: dict[str, dict[str, Any] | None] = dict.fromkeys(task_ids)
+    docs = data.get("response")
+    if not isinstance(docs, list):
+        raise ValueError(f"MP API response has no list of documents: {data!r:.200}")
+    for doc in docs:
+        if not (
+            isinstance(doc, dict)
+            and isinstance(doc.get("task_ids"), list)
+            and isinstance(doc.get("structure"), dict)
+        ):
+            raise ValueError(f"Malformed MP API document: {doc!r:.200}")
+        for task_id in doc["task_ids"]:
+            if task_id in structures:
+                structures[task_id] = doc["structure"]
+    return structures
+
+
+def fetch_structures(
+    task_ids: Sequence[str],
+    api_key: str | None = None,
+    url: str = MP_API_URL,
+    batch_size: int = 500,
+    max_workers: int = 8,
+    store: DiskCache | None = None,
+    session: requests.Session | None = None,
+    timeout: float = 120,
+    refresh_missing: bool = False,
+) -> dict[str, Structure | None]:
+    """Download structures for many MP task IDs in concurrent batches, skipping
+    IDs already in the local store.
+
+    Args:
+        task_ids (Sequence[str]): MP task IDs like "mp-149".
+        api_key (str, optional): MP API key. Defaults to the MAPI_KEY environment
+            variable or PMG_MAPI_KEY in ~/.pmgrc.yaml.
+        url (str): API base URL. Point this at a local mock server for testing.
+            Defaults to MP_API_URL.
+        batch_size (int): Task IDs per request. Defaults to 500.
+        max_workers (int): Max number of requests in flight at once. Defaults to 8.
+        store (DiskCache, optional): Where fetched structures are kept between runs.
+            IDs unknown to MP are stored as None so they aren't requested again
+            (unless refresh_missing).
+            Defaults to DiskCache(f"{CACHE_DIR}/mp_structures.sqlite").
+        session (requests.Session, optional): Defaults to
+            pooled_session(max_workers).
+        timeout (float): Seconds to wait for each response. Defaults to 120.
+        refresh_missing (bool): Request IDs stored as not found again, e.g. after
+            MP added them or a response left them out. Defaults to False.
+
+    Raises:
+        RuntimeError: If any batch failed, after storing all others.
+
+    Returns:
+        dict[str, Structure | None]: Task IDs mapped to structures (None if not
+            found) in the order of task_ids.
+    """
+    api_key = api_key or os.getenv("MAPI_KEY") or SETTINGS.get("PMG_MAPI_KEY")
+    task_ids = list(dict.fromkeys(task_ids))
+    if store is None:
+        # never evict, this is the only local copy of the data
+        store = DiskCache(f"{CACHE_DIR}/mp_structures.sqlite", max_size=2**63 - 1)
+    session = session or pooled_session(max_workers)
+
+    found = store.get_many(task_ids)
+    missing = [
+        task_id
+        for task_id in task_ids
+        if task_id not in found or (refresh_missing and found[task_id] is None)
+    ]
+    batches = [
+        missing[start : start + batch_size]
+        for start in range(0, len(missing), batch_size)
+    ]
+
+    with ThreadPoolExecutor(max_workers) as executor, tqdm(
+        total=len(missing), desc="Fetching MP structures", disable=not missing
+    ) as pbar:
+        futures = {
+            executor.submit(_query_batch, session, url, api_key, batch, timeout): batch
+            for batch in batches
+        }
+        errors = []
+        for future in as_completed(futures):
+            try:
+                batch_structures = future.result()
+            except (ValueError, requests.RequestException) as exc:
+                # keep storing the other batches so a rerun only fetches failed ones
+                batch = futures[future]
+                errors.append(f"{batch[0]}..{batch[-1]} ({len(batch)} IDs): {exc!r}")
+                continue
+            # write from the main thread only, SQLite connections aren't
+            # shareable across threads
+            store.set_many(batch_structures)
+            found.update(batch_structures)
+            pbar.update(len(batch_structures))
+    if errors:
+        raise RuntimeError(
+            f"Failed to fetch {len(errors)}/{len(batches)} batches of MP structures "
+            "(fetched ones were stored):\n" + "\n".join(errors)
+        )
+
+    return {
+        task_id: None if found[task_id] is None else Structure.from_dict(found[task_id])
+        for task_id in task_ids
+    }
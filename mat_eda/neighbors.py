@@ -0,0 +1,363 @@
+"""Batched periodic neighbor lists computed with cell lists.
+
+Calling Structure.get_neighbor_list() once per structure is slow for whole datasets
+(2 x 10,987 structures for matbench_log_gvrh/kvrh). get_neighbor_lists() instead
+processes chunks of a StructureBatch in parallel, with workers reading the batch
+from shared memory (see mat_eda.shared). Within each structure, periodic
+images inside the cutoff are binned into cubic cells of edge length r / 2 so every
+site only needs distances to points in the 5 x 5 x 5 block of cells around it. All
+edges come back in flat arrays with per-structure offsets.
+
+has_isolated_sites() uses the same cell lists but only needs a yes/no answer per
+structure, so each site stops searching once its first neighbor is found.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from typing import Any, Iterable, NamedTuple
+
+import numpy as np
+from pymatgen.core import Structure
+
+from mat_eda import trace
+from mat_eda.shared import map_batch
+from mat_eda.structures import StructureBatch
+
+
+# cell lists use cubic cells of edge length r / CELLS_PER_CUTOFF. Smaller cells mean
+# fewer candidate pairs to check but more cells to look up per site.
+CELLS_PER_CUTOFF = 2
+_cell_range = range(-CELLS_PER_CUTOFF, CELLS_PER_CUTOFF + 1)
+# offsets from a cell to all cells that can contain points within the cutoff,
+# sorted from nearest to farthest
+NEIGHBOR_CELLS = np.array(
+    sorted(
+        [(i, j, k) for i in _cell_range for j in _cell_range for k in _cell_range],
+        key=lambda offset: sum(x**2 for x in offset),
+    )
+)
+
+
+@dataclass
+class NeighborList:
+    """Edges of many structures stored in flat arrays.
+
+    Edges of structure i are at positions offsets[i] : offsets[i + 1] in all other
+    arrays. Site indices are relative to their own structure. Edge e connects site
+    center_indices[e] to the periodic image images[e] of site neighbor_indices[e],
+    the same convention as pymatgen's Structure.get_neighbor_list().
+    """
+
+    center_indices: np.ndarray
+    neighbor_indices: np.ndarray
+    images: np.ndarray
+    distances: np.ndarray
+    offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(
+        self, idx: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Edges of a single structure in the same format as
+        Structure.get_neighbor_list(): (center_indices, neighbor_indices, images,
+        distances).
+        """
+        idx = range(len(self))[idx]
+        edges = slice(self.offsets[idx], self.offsets[idx + 1])
+        return (
+            self.center_indices[edges],
+            self.neighbor_indices[edges],
+            self.images[edges],
+            self.distances[edges],
+        )
+
+    @property
+    def n_edges(self) -> np.ndarray:
+        """Number of edges of each structure."""
+        return np.diff(self.offsets)
+
+    @classmethod
+    def concatenate(cls, nbr_lists: Iterable[NeighborList]) -> NeighborList:
+        """Join neighbor lists of consecutive chunks of structures."""
+        nbr_lists = list(nbr_lists)
+        n_edges = np.concatenate([nl.n_edges for nl in nbr_lists])
+        return cls(
+            **{
+                key: np.concatenate([getattr(nl, key) for nl in nbr_lists])
+                for key in ("center_indices", "neighbor_indices", "images", "distances")
+            },
+            offsets=np.concatenate([[0], np.cumsum(n_edges)]),
+        )
+
+
+@lru_cache(maxsize=None)
+def _translations(n_a: int, n_b: int, n_c: int) -> np.ndarray:
+    """All integer lattice translations with |t_i| <= n_i."""
+    ranges = [np.arange(-n, n + 1) for n in (n_a, n_b, n_c)]
+    return np.stack(np.meshgrid(*ranges, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def periodic_images(
+    lattice: np.ndarray, frac_coords: np.ndarray, r: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """All periodic images of the sites in a unit cell that can be within r of a
+    site inside the cell.
+
+    Args:
+        lattice (np.ndarray): (3, 3) lattice matrix with lattice vectors as rows.
+        frac_coords (np.ndarray): (n_sites, 3) fractional coordinates.
+        r (float): Cutoff radius in Angstrom.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Cartesian
+            coordinates of sites wrapped into the unit cell, Cartesian coordinates
+            of images, site index of each image and its lattice translation
+            relative to the site's original (unwrapped) fractional coordinates.
+    """
+    shifts = np.floor(frac_coords)
+    wrapped = frac_coords - shifts
+    # distance between opposite faces of the unit cell along each lattice vector
+    face_dists = 1 / np.linalg.norm(np.linalg.inv(lattice), axis=0)
+    padding = r / face_dists
+    translations = _translations(*np.ceil(padding).astype(int).tolist())
+
+    image_frac = wrapped[None, :, :] + translations[:, None, :]
+    # only keep images close enough to the unit cell to be within r of any site
+    in_range = np.all((image_frac >= -padding) & (image_frac < 1 + padding), axis=-1)
+    trans_idx, site_idx = np.nonzero(in_range)
+    image_images = translations[trans_idx] - shifts[site_idx]
+    return (
+        wrapped @ lattice,
+        image_frac[trans_idx, site_idx] @ lattice,
+        site_idx,
+        image_images,
+    )
+
+
+def _bin_structure(
+    lattice: np.ndarray, frac_coords: np.ndarray, r: float
+) -> tuple[np.ndarray, ...]:
+    """Bin a structure's periodic images into cubic cells and compute the cell keys
+    each site needs to search. Keys start at 0 for every structure.
+    """
+    centers, points, point_sites, point_images = periodic_images(
+        lattice, frac_coords, r
+    )
+    # keep an empty border of cells so that neighbor cells of border cells don't
+    # alias onto other cells when linearizing 3d cell indices into keys
+    cell_size = r / CELLS_PER_CUTOFF
+    origin = points.min(axis=0) if len(points) else np.zeros(3)
+    point_cells = np.floor((points - origin) / cell_size).astype(np.int64)
+    center_cells = np.floor((centers - origin) / cell_size).astype(np.int64)
+    point_cells += CELLS_PER_CUTOFF
+    center_cells += CELLS_PER_CUTOFF
+    dims = point_cells.max(axis=0, initial=0) + CELLS_PER_CUTOFF + 1
+    strides = np.array([dims[1] * dims[2], dims[2], 1])
+
+    point_keys = point_cells @ strides
+    query_keys = (center_cells @ strides)[:, None] + NEIGHBOR_CELLS @ strides
+    return centers, points, point_sites, point_images, point_keys, query_keys, dims
+
+
+class CellList(NamedTuple):
+    """Periodic images of all sites in a batch of structures binned into cells.
+
+    Sites of missing structures are absent, so center i is site i of the batch.
+    Row i of query_keys holds the keys of all cells center i needs to search, in
+    order of increasing distance from its own cell.
+    """
+
+    centers: np.ndarray
+    points: np.ndarray
+    point_sites: np.ndarray
+    point_images: np.ndarray
+    order: np.ndarray
+    cell_starts: np.ndarray
+    cell_counts: np.ndarray
+    query_keys: np.ndarray
+
+    def candidates(
+        self, center_idx: np.ndarray, query_keys: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Expand (center, cell key) queries into all candidate (center, point)
+        pairs with their squared distances.
+        """
+        starts, counts = self.cell_starts[query_keys], self.cell_counts[query_keys]
+        pair_centers = np.repeat(center_idx, counts)
+        range_starts = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        pair_points = self.order[range_starts + np.arange(counts.sum())]
+        diffs = self.points[pair_points] - self.centers[pair_centers]
+        return pair_centers, pair_points, np.einsum("ij,ij->i", diffs, diffs)
+
+
+def bin_batch(batch: StructureBatch, r: float) -> CellList:
+    """Build a cell list over all structures in a batch. Per-structure work is
+    limited to generating and binning periodic images so that searching the cell
+    list can run as vectorized operations over the whole batch.
+    """
+    keys_offset = 0
+    centers, points, point_sites, point_images = [], [], [], []
+    point_keys, query_keys = [], []
+    for idx in range(len(batch)):
+        lattice = batch.lattices[idx]
+        if np.isnan(lattice).any():
+            continue
+        sites = slice(batch.offsets[idx], batch.offsets[idx + 1])
+        *arrays, struct_point_keys, struct_query_keys, dims = _bin_structure(
+            lattice, batch.frac_coords[sites], r
+        )
+        for lst, arr in zip((centers, points, point_sites, point_images), arrays):
+            lst.append(arr)
+        # shift keys so cells of different structures never share a key
+        point_keys.append(struct_point_keys + keys_offset)
+        query_keys.append(struct_query_keys + keys_offset)
+        keys_offset += int(np.prod(dims))
+
+    if not centers:
+        empty = np.zeros(0, dtype=np.int64)
+        return CellList(
+            np.zeros((0, 3)),
+            np.zeros((0, 3)),
+            empty,
+            np.zeros((0, 3)),
+            empty,
+            empty,
+            empty,
+            np.zeros((0, len(NEIGHBOR_CELLS)), dtype=np.int64),
+        )
+
+    point_keys = np.concatenate(point_keys)
+    # keys are dense, so a table of where each cell's points start in the sorted
+    # order replaces binary searches
+    cell_counts = np.bincount(point_keys, minlength=keys_offset)
+    return CellList(
+        centers=np.concatenate(centers),
+        points=np.concatenate(points),
+        point_sites=np.concatenate(point_sites),
+        point_images=np.concatenate(point_images),
+        order=np.argsort(point_keys, kind="stable"),
+        cell_starts=np.cumsum(cell_counts) - cell_counts,
+        cell_counts=cell_counts,
+        query_keys=np.concatenate(query_keys),
+    )
+
+
+def _batch_neighbors(
+    batch: StructureBatch, r: float, numerical_tol: float
+) -> NeighborList:
+    cells = bin_batch(batch, r)
+    n_cells = cells.query_keys.shape[1]
+    center_idx = np.repeat(np.arange(len(cells.centers)), n_cells)
+    center_idx, point_idx, sq_dists = cells.candidates(
+        center_idx, cells.query_keys.ravel()
+    )
+    keep = (sq_dists > numerical_tol**2) & (sq_dists <= r**2)
+    center_idx, point_idx = center_idx[keep], point_idx[keep]
+
+    # images are relative to original (possibly unwrapped) fractional coordinates
+    shifts = np.floor(batch.frac_coords[center_idx])
+    struct_idx = batch.site_structure_idx[center_idx]
+    return NeighborList(
+        center_indices=(center_idx - batch.offsets[struct_idx]).astype(np.int32),
+        neighbor_indices=cells.point_sites[point_idx].astype(np.int32),
+        images=(cells.point_images[point_idx] + shifts).astype(np.int16),
+        distances=np.sqrt(sq_dists[keep]),
+        offsets=np.concatenate(
+            [[0], np.cumsum(np.bincount(struct_idx, minlength=len(batch)))]
+        ),
+    )
+
+
+def _batch_isolated(
+    batch: StructureBatch, r: float, numerical_tol: float
+) -> np.ndarray:
+    cells = bin_batch(batch, r)
+    # sites for which no neighbor has been found yet
+    active = np.arange(len(cells.centers))
+    # search cells closest to each site first and drop sites from the search as
+    # soon as any neighbor is found
+    for col in range(cells.query_keys.shape[1]):
+        if len(active) == 0:
+            break
+        center_idx, _, sq_dists = cells.candidates(
+            active, cells.query_keys[active, col]
+        )
+        found = center_idx[(sq_dists > numerical_tol**2) & (sq_dists <= r**2)]
+        active = np.setdiff1d(active, found, assume_unique=False)
+
+    isolated = np.zeros(len(batch), dtype=bool)
+    isolated[batch.site_structure_idx[active]] = True
+    return isolated
+
+
+@trace.traced("get_neighbor_lists")
+def get_neighbor_lists(
+    structures: StructureBatch | Iterable[Structure],
+    r: float,
+    numerical_tol: float = 1e-8,
+    chunksize: int = 200,
+    **kwargs: Any,
+) -> NeighborList:
+    """Neighbor lists of many structures computed in parallel.
+
+    Args:
+        structures (StructureBatch | Iterable[Structure]): Structures to process.
+        r (float): Cutoff radius in Angstrom.
+        numerical_tol (float): Pairs closer than this are excluded. Defaults to
+            1e-8.
+        chunksize (int): Number of structures per task sent to a worker. Defaults
+            to 200.
+        **kwargs: Passed to map_batch(), e.g. n_jobs.
+
+    Returns:
+        NeighborList: Edges of all structures in flat arrays.
+    """
+    if not isinstance(structures, StructureBatch):
+        structures = StructureBatch.from_structures(structures)
+    kwargs.setdefault("desc", f"Getting neighbor lists (r={r})")
+    func = partial(_batch_neighbors, r=r, numerical_tol=numerical_tol)
+    nbr_lists = map_batch(func, structures, chunksize, **kwargs)
+    if not nbr_lists:
+        return _batch_neighbors(structures, r, numerical_tol)
+    return NeighborList.concatenate(nbr_lists)
+
+
+@trace.traced("has_isolated_sites")
+def has_isolated_sites(
+    structures: StructureBatch | Iterable[Structure],
+    r: float = 5,
+    numerical_tol: float = 1e-8,
+    chunksize: int = 200,
+    **kwargs: Any,
+) -> np.ndarray:
+    """Check for each structure whether any site has no neighbor within r,
+    including periodic images of itself and other sites.
+
+    Cheaper than computing full neighbor lists since each site stops searching
+    once its first neighbor is found, searching nearest cells first. Memory is
+    bounded by chunksize since only one chunk of structures is binned at a time
+    per worker.
+
+    Args:
+        structures (StructureBatch | Iterable[Structure]): Structures to check.
+        r (float): Radius in Angstrom. Defaults to 5.
+        numerical_tol (float): Images closer than this are treated as the site
+            itself. Defaults to 1e-8.
+        chunksize (int): Number of structures per task sent to a worker. Defaults
+            to 200.
+        **kwargs: Passed to map_batch(), e.g. n_jobs.
+
+    Returns:
+        np.ndarray: Boolean array, True for structures with an isolated site.
+            Missing structures are False.
+    """
+    if not isinstance(structures, StructureBatch):
+        structures = StructureBatch.from_structures(structures)
+    kwargs.setdefault("desc", f"Checking for isolated sites (r={r})")
+    func = partial(_batch_isolated, r=r, numerical_tol=numerical_tol)
+    results = map_batch(func, structures, chunksize, **kwargs)
+    return np.concatenate(results) if results else np.zeros(0, dtype=bool)
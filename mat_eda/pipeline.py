@@ -0,0 +1,473 @@
+"""Incremental runner for all dataset analyses.
+
+Each analysis is a pipeline of stages: loading a dataset into the columnar cache
+(mat_eda.data), computing its derived columns (mat_eda.features, which fills the
+per-structure caches) and the analyze_*.py script that aggregates and plots it.
+Stages form a dependency graph and each stage has a fingerprint: a hash of its
+parameters, the contents of its input files and the fingerprints of the stages it
+depends on. After a stage succeeds its fingerprint is recorded, and later runs
+skip it as long as its fingerprint and output files are unchanged. Independent
+stages (e.g. different datasets) run in parallel, splitting the CPU budget between
+them (each stage sees its share as MAT_EDA_N_JOBS, see _run_stage()).
+
+Run all analyses with
+
+    python -m mat_eda.pipeline
+
+Only stages whose inputs changed since the last run are executed. Pass stage name
+filters like `python -m mat_eda.pipeline dielectric` to run a subset (plus the
+stages it depends on), --force to rerun everything and --dry-run to list what would
+run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from glob import glob
+from typing import Any, Callable, Literal, Sequence
+
+from mat_eda import ROOT
+from mat_eda.cache import CACHE_DIR
+from mat_eda.featurize import default_n_jobs
+
+
+PIPELINE_STATE_PATH = f"{CACHE_DIR}/pipeline.json"
+PIPELINE_LOG_DIR = f"{CACHE_DIR}/pipeline-logs"
+
+# runs the script given as first argument with plotly's fig.show() as a no-op
+# and waits for its figure exports
+HEADLESS_BOOTSTRAP = """
+import runpy, sys
+try:
+    import plotly.io as pio
+    pio.renderers.default = None
+except ImportError:
+    pass
+runpy.run_path(sys.argv[1], run_name="__main__")
+# wait for figures queued by mat_eda.export.save_fig(), failing if any failed
+if "mat_eda.export" in sys.modules:
+    sys.modules["mat_eda.export"].flush()
+"""
+
+StageStatus = Literal["skipped", "done", "failed", "blocked"]
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A unit of work in a Pipeline.
+
+    Attributes:
+        name (str): Unique name, e.g. "load:matbench_mp_gap".
+        func (Callable): Called as func(**params). Must be picklable (i.e. defined
+            at module level) since stages run in worker processes. Stages
+            communicate through files on disk, return values are ignored.
+        params (dict): Keyword arguments for func. Must be JSON-serializable since
+            they're part of the fingerprint.
+        deps (tuple[str, ...]): Names of stages that must finish first.
+        inputs (tuple[str, ...]): Files whose contents the result depends on,
+            e.g. source code.
+        outputs (tuple[str, ...]): Files or directories the stage creates. The
+            stage reruns if any of them is missing.
+    """
+
+    name: str
+    func: Callable[..., Any]
+    params: dict[str, Any] = field(default_factory=dict)
+    deps: tuple[str, ...] = ()
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+
+
+def file_hash(path: str) -> str:
+    """blake2b hex digest of a file's contents."""
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024**2), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class Pipeline:
+    """Dependency graph of stages that are fingerprinted so unchanged stages are
+    skipped on reruns.
+    """
+
+    def __init__(
+        self, stages: Sequence[Stage], state_path: str = PIPELINE_STATE_PATH
+    ) -> None:
+        """
+        Args:
+            stages (Sequence[Stage]): All stages. Dependencies must be included.
+            state_path (str): JSON file recording the fingerprint of each stage's
+                last successful run. Defaults to PIPELINE_STATE_PATH.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        for stage in stages:
+            if unknown := set(stage.deps) - set(self.stages):
+                raise ValueError(f"{stage.name} depends on unknown stages {unknown}")
+        self.state_path = state_path
+        self.order = self._topological_order()
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(n_stages={len(self.stages)})"
+
+    def _topological_order(self) -> list[str]:
+        order: list[str] = []
+        visiting: set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle involving {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.remove(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def select(self, patterns: Sequence[str]) -> Pipeline:
+        """New Pipeline with only stages whose name contains any of the given
+        patterns, plus everything they depend on.
+        """
+        keep: set[str] = set()
+
+        def add(name: str) -> None:
+            if name not in keep:
+                keep.add(name)
+                for dep in self.stages[name].deps:
+                    add(dep)
+
+        for name in self.stages:
+            if any(pattern in name for pattern in patterns):
+                add(name)
+        stages = [self.stages[name] for name in self.order if name in keep]
+        return type(self)(stages, state_path=self.state_path)
+
+    def fingerprints(self) -> dict[str, str]:
+        """Fingerprint of every stage, computed from its params, input file contents
+        and the fingerprints of its dependencies.
+        """
+        fingerprints: dict[str, str] = {}
+        file_hashes: dict[str, str] = {}
+        for name in self.order:
+            stage = self.stages[name]
+            for path in stage.inputs:
+                if path not in file_hashes:
+                    file_hashes[path] = file_hash(path)
+            key = dict(
+                name=name,
+                func=f"{stage.func.__module__}.{stage.func.__qualname__}",
+                params=stage.params,
+                inputs={path: file_hashes[path] for path in sorted(stage.inputs)},
+                deps={dep: fingerprints[dep] for dep in sorted(stage.deps)},
+            )
+            digest = hashlib.blake2b(digest_size=20)
+            digest.update(json.dumps(key, sort_keys=True).encode())
+            fingerprints[name] = digest.hexdigest()
+        return fingerprints
+
+    def _load_state(self) -> dict[str, str]:
+        if not os.path.isfile(self.state_path):
+            return {}
+        with open(self.state_path) as file:
+            return json.load(file)
+
+    def _save_state(self, state: dict[str, str]) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(state, file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def outdated(self, force: bool = False) -> list[str]:
+        """Names of stages that would run, in topological order."""
+        state = self._load_state()
+        fingerprints = self.fingerprints()
+        return [
+            name
+            for name in self.order
+            if force
+            or state.get(name) != fingerprints[name]
+            or not all(map(os.path.exists, self.stages[name].outputs))
+        ]
+
+    def run(
+        self, n_jobs: int | None = None, force: bool = False
+    ) -> dict[str, StageStatus]:
+        """Run all outdated stages, executing independent stages in parallel.
+
+        A failing stage doesn't stop the pipeline, only stages depending on it are
+        blocked. Fingerprints of successful stages are saved as soon as they finish
+        so an interrupted run resumes where it left off.
+
+        Each stage may use n_jobs divided by the number of stages running or
+        ready to run when it starts worker processes (see _run_stage()), so
+        parallel stages don't each start a process per core.
+
+        Args:
+            n_jobs (int, optional): Max number of stages running at once and
+                total worker processes to split between them. Defaults to
+                default_n_jobs().
+            force (bool): Rerun all stages regardless of fingerprints. Defaults to
+                False.
+
+        Returns:
+            dict[str, "skipped" | "done" | "failed" | "blocked"]: Outcome of each
+                stage in topological order.
+        """
+        state = self._load_state()
+        fingerprints = self.fingerprints()
+        todo = set(self.outdated(force=force))
+        status: dict[str, StageStatus] = {
+            name: "skipped" for name in self.order if name not in todo
+        }
+        running: dict[Future, str] = {}
+        n_jobs = n_jobs or default_n_jobs()
+
+        with ProcessPoolExecutor(n_jobs) as executor:
+            while todo or running:
+                ready = []
+                for name in [name for name in self.order if name in todo]:
+                    deps = [status.get(dep) for dep in self.stages[name].deps]
+                    if any(dep in ("failed", "blocked") for dep in deps):
+                        status[name] = "blocked"
+                        todo.remove(name)
+                    elif all(dep in ("skipped", "done") for dep in deps):
+                        ready.append(name)
+                        todo.remove(name)
+                n_parallel = min(n_jobs, len(running) + len(ready))
+                for name in ready:
+                    stage = self.stages[name]
+                    print(f"Running {name}")
+                    future = executor.submit(
+                        _run_stage,
+                        stage.func,
+                        stage.params,
+                        max(1, n_jobs // n_parallel),
+                    )
+                    running[future] = name
+
+                if not running:
+                    continue  # only blocked stages were left
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if exc := future.exception():
+                        print(f"{name} failed: {exc}", file=sys.stderr)
+                        status[name] = "failed"
+                        state.pop(name, None)
+                    else:
+                        status[name] = "done"
+                        state[name] = fingerprints[name]
+                    self._save_state(state)
+
+        return {name: status[name] for name in self.order}
+
+
+def _run_stage(func: Callable[..., Any], params: dict[str, Any], n_jobs: int) -> None:
+    """Call func(**params) in a pipeline worker with MAT_EDA_N_JOBS set to the
+    stage's share of worker processes, which default_n_jobs() and the scripts
+    started by run_script() (inheriting the environment) pick up.
+    """
+    os.environ["MAT_EDA_N_JOBS"] = str(n_jobs)
+    func(**params)
+
+
+def build_dataset_cache(name: str) -> None:
+    """Pipeline stage that converts a matminer dataset to the columnar cache."""
+    from mat_eda.data import load_dataset
+
+    load_dataset(name)
+
+
+def build_features(name: str) -> None:
+    """Pipeline stage that computes a dataset's derived columns incrementally (see
+    mat_eda.features.featurize_dataset()). Scripts adding the same columns then
+    read them from the per-structure caches, so editing a script's plots doesn't
+    redo its featurization.
+    """
+    from mat_eda.features import featurize_dataset
+
+    featurize_dataset(name, incremental=True)
+
+
+def run_script(path: str) -> None:
+    """Pipeline stage that runs an analyze_*.py script headless in its own
+    directory (where it saves its figures). Output and a Chrome trace of its
+    hot paths go to PIPELINE_LOG_DIR.
+
+    Raises:
+        RuntimeError: If the script exits with an error.
+    """
+    os.makedirs(PIPELINE_LOG_DIR, exist_ok=True)
+    log_path = f"{PIPELINE_LOG_DIR}/{os.path.basename(path)}.log"
+    trace_path = f"{PIPELINE_LOG_DIR}/{os.path.basename(path)}.trace.json"
+    # don't open figure windows or browser tabs, record a timing trace (see
+    # mat_eda.trace)
+    env = dict(os.environ, MPLBACKEND="Agg", MAT_EDA_TRACE=trace_path)
+    with open(log_path, "w") as log_file:
+        proc = subprocess.run(
+            [sys.executable, "-c", HEADLESS_BOOTSTRAP, os.path.basename(path)],
+            cwd=os.path.dirname(path),
+            env=env,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+        )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{path} exited with code {proc.returncode}, see {log_path}")
+
+
+def local_imports(path: str) -> set[str]:
+    """Source files of all mat_eda modules imported (directly or indirectly) by
+    a Python file, including path itself.
+    """
+    files: set[str] = set()
+    todo = [os.path.abspath(path)]
+    while todo:
+        file_path = todo.pop()
+        if file_path in files:
+            continue
+        files.add(file_path)
+        with open(file_path) as file:
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            modules = []
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                modules = [node.module]
+                modules += [f"{node.module}.{alias.name}" for alias in node.names]
+            for module in modules:
+                if module.split(".")[0] != "mat_eda":
+                    continue
+                mod_path = f"{ROOT}/{module.replace('.', '/')}"
+                for candidate in (f"{mod_path}.py", f"{mod_path}/__init__.py"):
+                    if os.path.isfile(candidate):
+                        todo.append(candidate)
+    return files
+
+
+def default_pipeline(state_path: str = PIPELINE_STATE_PATH) -> Pipeline:
+    """One stage per matminer dataset used by any analyze_*.py script, one
+    featurize stage per dataset with derived columns (see
+    mat_eda.features.DATASET_FEATURES) that a script loads whole with
+    load_dataset() and one stage per script, depending on the featurize (or else
+    load) stages of the datasets it uses.
+
+    Scripts are fingerprinted by their own source and that of the mat_eda modules
+    they import, so e.g. editing mat_eda/neighbors.py only reruns the scripts that
+    use it. Dataset stages are fingerprinted by the code that builds the cache and
+    featurize stages by mat_eda/features.py and its imports, not by the scripts, so
+    a plotting-only edit reruns just the script. Per-structure featurization
+    results are cached in mat_eda.cache.DiskCache, so the script's own
+    add_features() call then only reads them back.
+    """
+    from mat_eda.features import DATASET_FEATURES
+    from mat_eda.incremental import snapshot_path
+
+    scripts = sorted(glob(f"{ROOT}/**/analyze_*.py", recursive=True))
+    load_pattern = re.compile(
+        r"\b(load|iter|aggregate)_dataset\(\s*[\"']([\w.-]+)[\"']"
+    )
+    dataset_inputs = tuple(sorted(local_imports(f"{ROOT}/mat_eda/data.py")))
+    feature_inputs = tuple(sorted(local_imports(f"{ROOT}/mat_eda/features.py")))
+
+    stages: dict[str, Stage] = {}
+    for script in scripts:
+        with open(script) as file:
+            calls = load_pattern.findall(file.read())
+        datasets = list(dict.fromkeys(dataset for _, dataset in calls))
+        # datasets streamed in chunks (iter/aggregate_dataset()) are featurized
+        # by the script itself to keep memory bounded
+        featurized = {
+            dataset
+            for func, dataset in calls
+            if func == "load" and dataset in DATASET_FEATURES
+        }
+        for dataset in datasets:
+            stages.setdefault(
+                f"load:{dataset}",
+                Stage(
+                    name=f"load:{dataset}",
+                    func=build_dataset_cache,
+                    params=dict(name=dataset),
+                    inputs=dataset_inputs,
+                    outputs=(f"{CACHE_DIR}/datasets/{dataset}/table.parquet",),
+                ),
+            )
+            if dataset in featurized:
+                groups = DATASET_FEATURES[dataset]
+                stages.setdefault(
+                    f"featurize:{dataset}",
+                    Stage(
+                        name=f"featurize:{dataset}",
+                        func=build_features,
+                        params=dict(name=dataset),
+                        deps=(f"load:{dataset}",),
+                        inputs=feature_inputs,
+                        outputs=(snapshot_path(dataset, groups),),
+                    ),
+                )
+        rel_path = os.path.relpath(script, ROOT)
+        name = f"script:{rel_path}"
+        stages[name] = Stage(
+            name=name,
+            func=run_script,
+            params=dict(path=script),
+            deps=tuple(
+                f"featurize:{dataset}" if dataset in featurized else f"load:{dataset}"
+                for dataset in datasets
+            ),
+            inputs=tuple(sorted(local_imports(script))),
+            # figures written by the last run
+            outputs=tuple(sorted(glob(f"{os.path.dirname(script)}/*.pdf"))),
+        )
+    return Pipeline(list(stages.values()), state_path=state_path)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Command line entry point. Returns exit code 1 if any stage failed."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "patterns", nargs="*", help="Only run stages whose name contains any of these"
+    )
+    parser.add_argument("-j", "--n-jobs", type=int, help="Max stages run at once")
+    parser.add_argument("--force", action="store_true", help="Rerun all stages")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list stages that would run"
+    )
+    args = parser.parse_args(argv)
+
+    pipeline = default_pipeline()
+    if args.patterns:
+        pipeline = pipeline.select(args.patterns)
+
+    if args.dry_run:
+        for name in pipeline.outdated(force=args.force):
+            print(name)
+        return 0
+
+    status = pipeline.run(n_jobs=args.n_jobs, force=args.force)
+    for name, outcome in status.items():
+        print(f"{outcome:>8}  {name}")
+    return int("failed" in status.values())
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,434 @@
+"""Featurize a dataset with many workers on many nodes sharing a filesystem.
+
+Even with all cores of one node, featurizing matbench_mp_e_form or matbench_mp_gap
+can take longer than the refresh window. Sharded mode splits a dataset into
+row-range shards that any number of workers (on any node that sees the same
+SHARD_DIR, e.g. over NFS) claim and featurize independently:
+
+    python -m mat_eda.shard run matbench_mp_e_form  # on every node, as often as needed
+    python -m mat_eda.shard status matbench_mp_e_form
+    python -m mat_eda.shard merge matbench_mp_e_form -o mp_e_form-features.parquet
+
+No scheduler or server is involved, all coordination goes through files in the
+job directory ({SHARD_DIR}/{dataset}/{groups}-{settings hash}):
+
+- plan.json: number of rows and shard size, written by the first worker
+- shard-00003.lock: created with O_CREAT | O_EXCL to claim shard 3. Holds a token
+  unique to the claim. Its owner touches it every heartbeat seconds while working
+  on the shard and only removes it if it still holds that token.
+- shard-00003.parquet: the featurized rows, written to a temp file and renamed so
+  it only appears once complete
+- shard-00003.errors: one line per failed attempt
+
+A worker that raises while featurizing a shard logs the error and releases the
+lock. A worker that dies (killed, node crash) stops touching its lock, and once the
+lock is older than stale_after, idle workers take the shard over. Shards that
+failed max_attempts times are skipped and reported by merge. Workers on different
+nodes need roughly synchronized clocks (NTP) for staleness checks. In the unlikely
+race where two workers end up featurizing the same shard, both write identical
+results, so the only cost is duplicate work.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, NamedTuple, Sequence
+
+import pandas as pd
+
+from mat_eda import trace
+from mat_eda.cache import CACHE_DIR
+from mat_eda.data import DATASET_CACHE_DIR, DATASET_ROW_GROUP_SIZE, load_rows, n_rows
+from mat_eda.features import DATASET_FEATURES, add_features, settings_hash
+
+
+SHARD_DIR = os.getenv("MAT_EDA_SHARD_DIR", f"{CACHE_DIR}/shards")
+
+
+class ShardStatus(NamedTuple):
+    """Number of shards in each state of a sharded featurization job."""
+
+    n_shards: int
+    done: list[int]
+    running: list[int]
+    failed: list[int]  # reached max_attempts
+    pending: list[int]
+
+
+def job_dir(
+    name: str, groups: Sequence[str], shard_dir: str = SHARD_DIR, **kwargs: Any
+) -> str:
+    """Directory holding the plan, locks and results of featurizing a dataset with
+    the given groups and settings (see mat_eda.features.settings_hash()).
+    """
+    return f"{shard_dir}/{name}/{'+'.join(groups)}-{settings_hash(groups, **kwargs)}"
+
+
+def _shard_path(directory: str, shard: int, ext: str) -> str:
+    return f"{directory}/shard-{shard:05d}.{ext}"
+
+
+def read_plan(directory: str) -> dict[str, Any]:
+    """Dataset name, number of rows and shard size of a job."""
+    with open(f"{directory}/plan.json") as file:
+        return json.load(file)
+
+
+def write_plan(
+    directory: str, name: str, n_rows: int, shard_size: int
+) -> dict[str, Any]:
+    """Write the plan of a job unless another worker already did.
+
+    Raises:
+        ValueError: If the existing plan has a different number of rows or shard
+            size, e.g. after the dataset was updated. Delete the job directory to
+            start over.
+    """
+    os.makedirs(directory, exist_ok=True)
+    plan = dict(name=name, n_rows=n_rows, shard_size=shard_size)
+    path = f"{directory}/plan.json"
+    if not os.path.isfile(path):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(plan, file)
+        os.replace(tmp_path, path)  # concurrent writers write the same plan
+    existing = read_plan(directory)
+    if existing != plan:
+        raise ValueError(f"{directory} has a different plan {existing}, not {plan}")
+    return plan
+
+
+def _n_attempts(directory: str, shard: int) -> int:
+    try:
+        with open(_shard_path(directory, shard, "errors")) as file:
+            return sum(1 for _ in file)
+    except FileNotFoundError:
+        return 0
+
+
+def _log_error(directory: str, shard: int, worker: str, message: str) -> None:
+    with open(_shard_path(directory, shard, "errors"), "a") as file:
+        file.write(json.dumps(dict(worker=worker, time=time.time(), error=message)))
+        file.write("\n")
+
+
+def _lock_age(lock_path: str) -> float | None:
+    try:
+        return time.time() - os.stat(lock_path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _lock_token(lock_path: str) -> str | None:
+    try:
+        with open(lock_path) as file:
+            return json.load(file).get("token")
+    except (FileNotFoundError, ValueError):  # missing or still being written
+        return None
+
+
+def try_claim(lock_path: str, worker: str, stale_after: float) -> str | None:
+    """Create a lock file unless it exists and was touched within stale_after
+    seconds. Stale locks are moved aside with an atomic rename, so only one of
+    several idle workers takes over a shard.
+
+    Returns:
+        str | None: Token identifying this claim (written to the lock file) if this
+            worker now holds the lock, else None.
+    """
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            age = _lock_age(lock_path)
+            if age is None:
+                continue  # released in the meantime
+            if age < stale_after:
+                return None
+            stale_path = f"{lock_path}.{uuid.uuid4().hex}.stale"
+            try:
+                os.rename(lock_path, stale_path)
+            except FileNotFoundError:
+                return None  # another worker took it over first
+            if (_lock_age(stale_path) or 0) < stale_after:
+                # the lock was replaced by a fresh one between stat and rename
+                os.rename(stale_path, lock_path)
+                return None
+            os.remove(stale_path)
+            continue
+        token = uuid.uuid4().hex
+        with os.fdopen(fd, "w") as file:
+            json.dump(dict(worker=worker, token=token, claimed_at=time.time()), file)
+        return token
+    return None
+
+
+def release(lock_path: str, token: str) -> bool:
+    """Remove a lock if it still belongs to the claim with the given token. A
+    worker whose lock was taken over (e.g. after missed heartbeats) must leave the
+    new owner's lock in place.
+
+    Returns:
+        bool: Whether the lock was removed.
+    """
+    if _lock_token(lock_path) != token:
+        return False
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _heartbeat(
+    lock_path: str, token: str, interval: float, stop: threading.Event
+) -> None:
+    while not stop.wait(interval):
+        if _lock_token(lock_path) != token:
+            return  # taken over, don't keep the new owner's lock alive
+        try:
+            os.utime(lock_path)
+        except FileNotFoundError:
+            return
+
+
+def shard_status(directory: str, max_attempts: int = 3) -> ShardStatus:
+    """State of each shard of a job (see ShardStatus)."""
+    plan = read_plan(directory)
+    n_shards = -(-plan["n_rows"] // plan["shard_size"])
+    status = ShardStatus(n_shards, [], [], [], [])
+    for shard in range(n_shards):
+        if os.path.isfile(_shard_path(directory, shard, "parquet")):
+            status.done.append(shard)
+        elif os.path.isfile(_shard_path(directory, shard, "lock")):
+            status.running.append(shard)
+        elif _n_attempts(directory, shard) >= max_attempts:
+            status.failed.append(shard)
+        else:
+            status.pending.append(shard)
+    return status
+
+
+def featurize_shard(
+    directory: str,
+    shard: int,
+    groups: Sequence[str],
+    cache_dir: str = DATASET_CACHE_DIR,
+    **kwargs: Any,
+) -> str:
+    """Featurize one shard and write its rows (all non-structure columns plus
+    derived ones) to shard-{shard}.parquet. Returns the file path.
+    """
+    plan = read_plan(directory)
+    start = shard * plan["shard_size"]
+    df, structures = load_rows(
+        plan["name"], start, start + plan["shard_size"], cache_dir=cache_dir
+    )
+    add_features(df, structures, groups, **kwargs)
+    out_path = _shard_path(directory, shard, "parquet")
+    tmp_path = f"{out_path}.{uuid.uuid4().hex}.tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def run_worker(
+    name: str,
+    groups: Sequence[str] | None = None,
+    shard_size: int = DATASET_ROW_GROUP_SIZE,
+    shard_dir: str = SHARD_DIR,
+    cache_dir: str = DATASET_CACHE_DIR,
+    stale_after: float = 600,
+    heartbeat: float = 30,
+    max_attempts: int = 3,
+    poll_interval: float = 10,
+    worker: str | None = None,
+    **kwargs: Any,
+) -> list[int]:
+    """Claim and featurize shards of a dataset until none are left. Start as many
+    workers as wanted, on any nodes sharing shard_dir and cache_dir.
+
+    While shards are running on other workers, idle workers wait and take over
+    those whose lock goes stale. Returns once every shard is done or has failed
+    max_attempts times.
+
+    Args:
+        name (str): Dataset name, e.g. "matbench_mp_e_form".
+        groups (Sequence[str], optional): Keys of mat_eda.features.FEATURE_GROUPS.
+            Defaults to DATASET_FEATURES[name].
+        shard_size (int): Rows per shard. Defaults to DATASET_ROW_GROUP_SIZE so
+            each shard reads a single Parquet row group.
+        shard_dir (str): Root of all job directories. Defaults to SHARD_DIR.
+        cache_dir (str): See mat_eda.data.load_dataset(). Workers convert the
+            dataset if it isn't cached yet (concurrent conversions are safe, see
+            mat_eda.data.ensure_cached()). Converting it once before starting
+            workers on several nodes avoids duplicate work.
+        stale_after (float): Seconds since the last heartbeat after which a lock
+            is considered abandoned. Defaults to 600.
+        heartbeat (float): Seconds between touching the lock of the running shard.
+            Must be well below stale_after (allowing for delays of the shared
+            filesystem). Defaults to 30.
+        max_attempts (int): Give up on a shard after this many failed attempts.
+            Defaults to 3.
+        poll_interval (float): Seconds to wait before checking locks of other
+            workers again. Defaults to 10.
+        worker (str, optional): Worker name in lock and error files. Defaults to
+            {hostname}:{pid}.
+        **kwargs: Passed to add_features(), e.g. n_jobs.
+
+    Raises:
+        ValueError: If heartbeat isn't shorter than stale_after.
+
+    Returns:
+        list[int]: Shards featurized by this worker.
+    """
+    if heartbeat >= stale_after:
+        raise ValueError(f"{heartbeat=} must be shorter than {stale_after=}")
+    groups = DATASET_FEATURES[name] if groups is None else groups
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    directory = job_dir(name, groups, shard_dir, **kwargs)
+    write_plan(directory, name, n_rows(name, cache_dir), shard_size)
+
+    finished = []
+    while True:
+        status = shard_status(directory, max_attempts)
+        claimable = status.pending + status.running
+        if not claimable:
+            return finished
+        claimed_any = False
+        for shard in claimable:
+            lock_path = _shard_path(directory, shard, "lock")
+            token = try_claim(lock_path, worker, stale_after)
+            if token is None:
+                continue
+            # another worker may have finished or given up on it before we claimed
+            if os.path.isfile(_shard_path(directory, shard, "parquet")) or (
+                _n_attempts(directory, shard) >= max_attempts
+            ):
+                release(lock_path, token)
+                continue
+            claimed_any = True
+            stop = threading.Event()
+            beat = threading.Thread(
+                target=_heartbeat, args=(lock_path, token, heartbeat, stop), daemon=True
+            )
+            beat.start()
+            try:
+                with trace.span("featurize_shard", dataset=name, shard=shard):
+                    featurize_shard(directory, shard, groups, cache_dir, **kwargs)
+                finished.append(shard)
+            except Exception:
+                _log_error(directory, shard, worker, traceback.format_exc())
+            finally:
+                stop.set()
+                beat.join()
+                release(lock_path, token)
+        if not claimed_any:
+            time.sleep(poll_interval)
+
+
+def merge_shards(
+    name: str,
+    groups: Sequence[str] | None = None,
+    out_path: str | None = None,
+    shard_dir: str = SHARD_DIR,
+    max_attempts: int = 3,
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """Concatenate the shards of a finished job in row order.
+
+    Args:
+        name (str): Dataset name.
+        groups (Sequence[str], optional): As passed to run_worker().
+        out_path (str, optional): Also write the result to this Parquet file.
+        shard_dir (str): As passed to run_worker().
+        max_attempts (int): As passed to run_worker().
+        **kwargs: The add_features() kwargs passed to run_worker() (they select
+            the job directory).
+
+    Raises:
+        RuntimeError: If any shard isn't done, listing running, pending and
+            failed shards with the last error of each failed one.
+
+    Returns:
+        pd.DataFrame: Same as the table returned by
+            mat_eda.features.featurize_dataset().
+    """
+    groups = DATASET_FEATURES[name] if groups is None else groups
+    directory = job_dir(name, groups, shard_dir, **kwargs)
+    status = shard_status(directory, max_attempts)
+    if len(status.done) < status.n_shards:
+        errors = []
+        for shard in status.failed:
+            with open(_shard_path(directory, shard, "errors")) as file:
+                last_error = json.loads(file.readlines()[-1])["error"]
+            errors.append(f"shard {shard}: {last_error.strip().splitlines()[-1]}")
+        raise RuntimeError(
+            f"{len(status.done)}/{status.n_shards} shards of {name} done, "
+            f"running={status.running}, pending={status.pending}, "
+            f"failed={status.failed}\n" + "\n".join(errors)
+        )
+
+    paths = sorted(glob.glob(f"{directory}/shard-*.parquet"))
+    with trace.span("merge_shards", dataset=name, items=len(paths)):
+        df = pd.concat(map(pd.read_parquet, paths))
+    if out_path:
+        df.to_parquet(out_path)
+    return df
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["run", "status", "merge"])
+    parser.add_argument("dataset", help="Key of DATASET_FEATURES")
+    parser.add_argument("--groups", nargs="+", help="Default: DATASET_FEATURES")
+    parser.add_argument("--shard-dir", default=SHARD_DIR)
+    parser.add_argument("--shard-size", type=int, default=DATASET_ROW_GROUP_SIZE)
+    parser.add_argument("--stale-after", type=float, default=600)
+    parser.add_argument("--heartbeat", type=float, default=30)
+    parser.add_argument("--poll-interval", type=float, default=10)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("-j", "--n-jobs", type=int, help="Processes per worker")
+    parser.add_argument("-o", "--out", help="Parquet file for merge")
+    args = parser.parse_args(argv)
+
+    groups = args.groups or DATASET_FEATURES[args.dataset]
+    if args.command == "run":
+        done = run_worker(
+            args.dataset,
+            groups,
+            args.shard_size,
+            args.shard_dir,
+            stale_after=args.stale_after,
+            heartbeat=args.heartbeat,
+            max_attempts=args.max_attempts,
+            poll_interval=args.poll_interval,
+            n_jobs=args.n_jobs,
+        )
+        print(f"Featurized {len(done)} shards of {args.dataset}: {done}")
+    directory = job_dir(args.dataset, groups, args.shard_dir, n_jobs=args.n_jobs)
+    status = shard_status(directory, args.max_attempts)
+    print(
+        f"{args.dataset}: {len(status.done)}/{status.n_shards} shards done, "
+        f"{len(status.running)} running, {len(status.pending)} pending, "
+        f"{len(status.failed)} failed"
+    )
+    if args.command == "merge":
+        df = merge_shards(
+            args.dataset, groups, args.out, args.shard_dir, args.max_attempts
+        )
+        print(f"Merged {len(df):,} rows" + (f" into {args.out}" if args.out else ""))
+    return 0 if not status.failed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+"""Share a StructureBatch with worker processes without pickling it.
+
+parallel_map() pickles every item it sends to a worker. For pymatgen Structures
+that serialization costs about as much as cheap per-structure work itself, so on
+100k structures most of the speedup from extra workers is lost. share_batch()
+copies the arrays of a StructureBatch into shared memory once. map_batch() then
+only sends each worker a small BatchHandle plus the index range of its chunk.
+Workers attach to the shared arrays by name (once per process) and take zero-copy
+slices. Only the (compact) results of each chunk are pickled back.
+
+    from mat_eda.shared import map_batch
+
+    n_edges = map_batch(count_edges, structures, n_jobs=8)  # list of chunk results
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Iterator, NamedTuple
+
+import numpy as np
+
+from mat_eda.featurize import default_n_jobs, parallel_map
+from mat_eda.structures import ARRAY_NAMES, StructureBatch
+
+
+class SharedArray(NamedTuple):
+    """Name of a shared memory block holding an array, plus its shape and dtype."""
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+class BatchHandle(NamedTuple):
+    """Picklable reference to a StructureBatch in shared memory."""
+
+    lattices: SharedArray
+    frac_coords: SharedArray
+    atomic_nums: SharedArray
+    offsets: SharedArray
+
+
+# batches attached by this process, keyed by their handle. Keeps the SharedMemory
+# objects alive as long as the arrays viewing them.
+_attached: dict[BatchHandle, tuple[StructureBatch, list[SharedMemory]]] = {}
+
+
+@contextmanager
+def share_batch(batch: StructureBatch) -> Iterator[BatchHandle]:
+    """Copy a StructureBatch into shared memory for as long as the context is open.
+
+    Args:
+        batch (StructureBatch): Structures to share. Memory-mapped batches are
+            read once here.
+
+    Yields:
+        BatchHandle: Pass to attach_batch() in worker processes.
+    """
+    blocks: list[SharedMemory] = []
+    try:
+        specs = {}
+        for name in ARRAY_NAMES:
+            arr = np.ascontiguousarray(getattr(batch, name))
+            # zero-size blocks aren't allowed
+            block = SharedMemory(create=True, size=max(arr.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(arr.shape, arr.dtype, buffer=block.buf)[...] = arr
+            specs[name] = SharedArray(block.name, arr.shape, arr.dtype.str)
+        yield BatchHandle(**specs)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def attach_batch(handle: BatchHandle) -> StructureBatch:
+    """StructureBatch whose arrays are read-only views of the shared memory of
+    handle. Repeated calls in the same process reuse the first attachment.
+    """
+    if handle not in _attached:
+        blocks, arrays = [], {}
+        for name, spec in zip(BatchHandle._fields, handle):
+            block = SharedMemory(name=spec.name)
+            blocks.append(block)
+            arr = np.ndarray(spec.shape, np.dtype(spec.dtype), buffer=block.buf)
+            arr.flags.writeable = False
+            arrays[name] = arr
+        _attached[handle] = (StructureBatch(**arrays), blocks)
+    return _attached[handle][0]
+
+
+def _run_chunk(
+    func: Callable[[StructureBatch], Any],
+    handle: BatchHandle,
+    bounds: tuple[int, int],
+) -> Any:
+    start, stop = bounds
+    return func(attach_batch(handle)[start:stop])
+
+
+def map_batch(
+    func: Callable[[StructureBatch], Any],
+    batch: StructureBatch,
+    chunksize: int = 200,
+    n_jobs: int | None = None,
+    **kwargs: Any,
+) -> list[Any]:
+    """Apply func to consecutive chunks of a StructureBatch in worker processes
+    reading the batch from shared memory.
+
+    Args:
+        func (Callable): Takes a StructureBatch (a chunk of batch) and returns its
+            results, ideally as NumPy arrays. Must be picklable, i.e. defined at
+            module level (or a functools.partial thereof).
+        batch (StructureBatch): Structures to process.
+        chunksize (int): Number of structures per task sent to a worker. Defaults
+            to 200.
+        n_jobs (int, optional): Number of worker processes. Defaults to
+            default_n_jobs(). With a single worker, chunks are processed in this
+            process without shared memory.
+        **kwargs: Passed to parallel_map(), e.g. desc.
+
+    Returns:
+        list: func(chunk) for each chunk in order.
+    """
+    bounds = [
+        (start, min(start + chunksize, len(batch)))
+        for start in range(0, len(batch), chunksize)
+    ]
+    n_jobs = min(n_jobs or default_n_jobs(), max(len(bounds), 1))
+    if n_jobs == 1:
+        chunks = [batch[start:stop] for start, stop in bounds]
+        return parallel_map(func, chunks, n_jobs=1, **kwargs)
+
+    with share_batch(batch) as handle:
+        return parallel_map(
+            partial(_run_chunk, func, handle),
+            bounds,
+            n_jobs=n_jobs,
+            chunksize=1,
+            **kwargs,
+        )
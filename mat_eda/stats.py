@@ -0,0 +1,478 @@
+"""Histograms, moments and quantiles of all numeric columns in one pass.
+
+Calling df.hist() and df.describe() several times on the same dataset rescans all
+of it for every call. summarize() instead reads a dataset once, chunk by chunk
+(from a DataFrame, an iterable of DataFrames or a Parquet file), and keeps for
+each numeric column:
+
+- counts, min, max and the first four central moments (mean, std, skew, kurtosis)
+- an equal-width histogram whose bin width is a power of 2, so any two histograms
+  can be merged exactly by coarsening the finer one
+- a DDSketch-style quantile sketch with logarithmic buckets, accurate to within
+  1% relative error by default. Relative error is poor for data far from zero
+  compared to its spread (e.g. normal(1000, 5) puts all quartiles in one bucket),
+  so summaries of a whole in-memory DataFrame also keep the sorted values and
+  report exact quantiles. Only summaries of chunked or merged inputs fall back to
+  the sketch.
+
+All three merge exactly, so chunks can be summarized separately (e.g. in
+different processes or from files that don't fit in memory) and combined with
+merge(). The resulting DatasetSummary serves describe() and plot_histograms()
+for any number of plots without touching the data again.
+"""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class Moments:
+    """Count, extrema and central moments of a stream of numbers. Merged with the
+    pairwise update formulas of Pébay (2008), which are stable for large counts.
+    """
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0  # sums of powers of deviations from the mean
+    m3: float = 0.0
+    m4: float = 0.0
+    min: float = math.inf
+    max: float = -math.inf
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> Moments:
+        """Moments of finite values."""
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        dev = values - mean
+        dev2 = dev * dev
+        return cls(
+            count=len(values),
+            mean=mean,
+            m2=dev2.sum(),
+            m3=(dev2 * dev).sum(),
+            m4=(dev2 * dev2).sum(),
+            min=values.min(),
+            max=values.max(),
+        )
+
+    def merge(self, other: Moments) -> Moments:
+        """Moments of the union of both streams."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        n_a, n_b = self.count, other.count
+        n = n_a + n_b
+        delta = other.mean - self.mean
+        delta_n = delta / n
+        m2 = self.m2 + other.m2 + delta * delta_n * n_a * n_b
+        m3 = (
+            self.m3
+            + other.m3
+            + delta * delta_n**2 * n_a * n_b * (n_a - n_b)
+            + 3 * delta_n * (n_a * other.m2 - n_b * self.m2)
+        )
+        m4 = (
+            self.m4
+            + other.m4
+            + delta * delta_n**3 * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b)
+            + 6 * delta_n**2 * (n_a * n_a * other.m2 + n_b * n_b * self.m2)
+            + 4 * delta_n * (n_a * other.m3 - n_b * self.m3)
+        )
+        return Moments(
+            count=n,
+            mean=self.mean + delta_n * n_b,
+            m2=m2,
+            m3=m3,
+            m4=m4,
+            min=min(self.min, other.min),
+            max=max(self.max, other.max),
+        )
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (ddof=1, like pandas)."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    @property
+    def skew(self) -> float:
+        """Population skewness."""
+        if self.count == 0 or self.m2 == 0:
+            return math.nan
+        return math.sqrt(self.count) * self.m3 / self.m2**1.5
+
+    @property
+    def kurtosis(self) -> float:
+        """Population excess kurtosis (0 for a normal distribution)."""
+        if self.count == 0 or self.m2 == 0:
+            return math.nan
+        return self.count * self.m4 / self.m2**2 - 3
+
+
+@dataclass
+class DyadicHistogram:
+    """Equal-width histogram with bin width 2**exponent and bin i covering
+    [(offset + i) * width, (offset + i + 1) * width). The width doubles whenever
+    the data would need more than max_bins bins.
+    """
+
+    max_bins: int = 4096
+    exponent: int = 0
+    offset: int = 0
+    counts: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+    def _exponent_for(self, lo: float, hi: float) -> int:
+        """Smallest bin width exponent that spans [lo, hi] in max_bins bins."""
+        # bins at least 2**-40 times the largest magnitude keep bin indices well
+        # within int64 (and give a single distinct value a narrow bin)
+        exponent = math.floor(math.log2(max(abs(lo), abs(hi)) or 1)) - 40
+        if hi > lo:
+            exponent = max(
+                exponent, math.ceil(math.log2((hi - lo) / (self.max_bins - 1)))
+            )
+        while math.floor(hi / 2.0**exponent) - math.floor(lo / 2.0**exponent) >= (
+            self.max_bins
+        ):
+            exponent += 1
+        return exponent
+
+    def _bounds(self) -> tuple[float, float]:
+        width = 2.0**self.exponent
+        return self.offset * width, (self.offset + len(self.counts)) * width
+
+    def _coarsened(self, exponent: int) -> DyadicHistogram:
+        """Copy of this histogram with bin width 2**exponent >= the current one."""
+        # right shift = floor division by 2**shift, also for negative bins
+        shift = min(exponent - self.exponent, 63)
+        bins = (self.offset + np.arange(len(self.counts))) >> shift
+        offset = int(bins[0]) if len(bins) else 0
+        counts = np.bincount(bins - offset, self.counts).astype(np.int64)
+        return DyadicHistogram(self.max_bins, exponent, offset, counts)
+
+    def merge(self, other: DyadicHistogram) -> DyadicHistogram:
+        """Histogram of the union of both streams."""
+        if len(other.counts) == 0:
+            return self
+        if len(self.counts) == 0:
+            return other
+        lo = min(self._bounds()[0], other._bounds()[0])
+        hi = max(self._bounds()[1], other._bounds()[1])
+        # hi is an exclusive bin edge, use the largest number below it
+        exponent = max(
+            self.exponent, other.exponent, self._exponent_for(lo, np.nextafter(hi, lo))
+        )
+        hist_a, hist_b = self._coarsened(exponent), other._coarsened(exponent)
+        offset = min(hist_a.offset, hist_b.offset)
+        counts = np.zeros(
+            max(hist_a.offset + len(hist_a.counts), hist_b.offset + len(hist_b.counts))
+            - offset,
+            dtype=np.int64,
+        )
+        for hist in (hist_a, hist_b):
+            start = hist.offset - offset
+            counts[start : start + len(hist.counts)] += hist.counts
+        return DyadicHistogram(self.max_bins, exponent, offset, counts)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, max_bins: int = 4096) -> DyadicHistogram:
+        """Histogram of finite values."""
+        hist = cls(max_bins)
+        if len(values) == 0:
+            return hist
+        hist.exponent = hist._exponent_for(values.min(), values.max())
+        bins = np.floor(values / 2.0**hist.exponent).astype(np.int64)
+        hist.offset = int(bins.min())
+        hist.counts = np.bincount(bins - hist.offset).astype(np.int64)
+        return hist
+
+    def histogram(self, bins: int = 50) -> tuple[np.ndarray, np.ndarray]:
+        """Counts and bin edges with at most the given number of bins. Bins are
+        groups of whole stored bins, so counts are exact, but the outer edges can
+        extend slightly beyond the data range.
+        """
+        nonzero = np.flatnonzero(self.counts)
+        if len(nonzero) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(1)
+        counts = self.counts[nonzero[0] : nonzero[-1] + 1]
+        group = math.ceil(len(counts) / bins)
+        counts = np.pad(counts, (0, -len(counts) % group))
+        counts = counts.reshape(-1, group).sum(axis=1)
+        edges = (self.offset + nonzero[0] + group * np.arange(len(counts) + 1)) * (
+            2.0**self.exponent
+        )
+        return counts, edges
+
+
+@dataclass
+class QuantileSketch:
+    """Quantile sketch with logarithmically sized buckets (DDSketch, Masson et al.
+    2019). Every quantile is within relative_accuracy of a value in the data of
+    about that rank. Buckets are stored sparsely, so memory grows with the log of
+    the data's dynamic range, not with the number of values.
+    """
+
+    relative_accuracy: float = 0.01
+    positive: dict[int, int] = field(default_factory=dict)
+    negative: dict[int, int] = field(default_factory=dict)
+    n_zeros: int = 0
+
+    @property
+    def gamma(self) -> float:
+        return (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+
+    def _add(self, store: dict[int, int], values: np.ndarray) -> None:
+        keys = np.ceil(np.log(values) / math.log(self.gamma)).astype(np.int64)
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            store[int(key)] = store.get(int(key), 0) + int(count)
+
+    @classmethod
+    def from_values(
+        cls, values: np.ndarray, relative_accuracy: float = 0.01
+    ) -> QuantileSketch:
+        """Sketch of finite values."""
+        sketch = cls(relative_accuracy)
+        tiny = np.finfo(float).tiny
+        sketch._add(sketch.positive, values[values > tiny])
+        sketch._add(sketch.negative, -values[values < -tiny])
+        sketch.n_zeros = int((np.abs(values) <= tiny).sum())
+        return sketch
+
+    def merge(self, other: QuantileSketch) -> QuantileSketch:
+        """Sketch of the union of both streams."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can only merge sketches with equal relative_accuracy")
+        merged = QuantileSketch(self.relative_accuracy, n_zeros=self.n_zeros)
+        merged.n_zeros += other.n_zeros
+        for store in ("positive", "negative"):
+            counts = dict(getattr(self, store))
+            for key, count in getattr(other, store).items():
+                counts[key] = counts.get(key, 0) + count
+            setattr(merged, store, counts)
+        return merged
+
+    def quantile(self, q: float | Sequence[float]) -> np.ndarray:
+        """Approximate quantiles for q in [0, 1] (nearest rank)."""
+        neg_keys = sorted(self.negative, reverse=True)
+        pos_keys = sorted(self.positive)
+        # bucket key k holds values in (gamma^(k-1), gamma^k], represent it by the
+        # value with equal relative error to both bounds
+        values = np.concatenate(
+            [
+                -2 * self.gamma ** np.array(neg_keys, dtype=float) / (self.gamma + 1),
+                [0.0],
+                2 * self.gamma ** np.array(pos_keys, dtype=float) / (self.gamma + 1),
+            ]
+        )
+        counts = np.array(
+            [self.negative[key] for key in neg_keys]
+            + [self.n_zeros]
+            + [self.positive[key] for key in pos_keys]
+        )
+        cum_counts = np.cumsum(counts)
+        if cum_counts[-1] == 0:
+            return np.full(np.shape(q), np.nan)
+        ranks = np.asarray(q, dtype=float) * (cum_counts[-1] - 1)
+        return values[np.searchsorted(cum_counts, ranks, side="right")]
+
+
+@dataclass
+class ColumnSummary:
+    """Moments, histogram and quantile sketch of one column."""
+
+    moments: Moments = field(default_factory=Moments)
+    histogram: DyadicHistogram = field(default_factory=DyadicHistogram)
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+    n_missing: int = 0  # NaNs and infs
+    # all finite values, sorted. Only kept for summaries of in-memory DataFrames
+    # (see summarize()) and dropped on merge()
+    sorted_values: np.ndarray | None = None
+
+    @classmethod
+    def from_values(
+        cls,
+        values: Sequence[float],
+        max_bins: int = 4096,
+        relative_accuracy: float = 0.01,
+    ) -> ColumnSummary:
+        """Summary of one chunk of a column."""
+        values = np.asarray(values, dtype=float)
+        finite = values[np.isfinite(values)]
+        return cls(
+            moments=Moments.from_values(finite),
+            histogram=DyadicHistogram.from_values(finite, max_bins),
+            sketch=QuantileSketch.from_values(finite, relative_accuracy),
+            n_missing=len(values) - len(finite),
+        )
+
+    def merge(self, other: ColumnSummary) -> ColumnSummary:
+        """Summary of both chunks."""
+        return ColumnSummary(
+            moments=self.moments.merge(other.moments),
+            histogram=self.histogram.merge(other.histogram),
+            sketch=self.sketch.merge(other.sketch),
+            n_missing=self.n_missing + other.n_missing,
+        )
+
+    def quantile(self, q: float | Sequence[float]) -> np.ndarray:
+        """Exact quantiles (linearly interpolated like pandas) if sorted_values are
+        kept, else approximate ones clipped to the exact min and max.
+        """
+        if self.sorted_values is not None:
+            if len(self.sorted_values) == 0:
+                return np.full(np.shape(q), np.nan)
+            return np.quantile(self.sorted_values, q)
+        return np.clip(self.sketch.quantile(q), self.moments.min, self.moments.max)
+
+
+@dataclass
+class DatasetSummary:
+    """ColumnSummary of each numeric column of a dataset."""
+
+    columns: dict[str, ColumnSummary] = field(default_factory=dict)
+
+    def update(self, df: pd.DataFrame, **kwargs: Any) -> DatasetSummary:
+        """Add a chunk of rows (in place). Non-numeric and boolean columns are
+        ignored.
+
+        Args:
+            df (pd.DataFrame): Chunk of the dataset.
+            **kwargs: Passed to ColumnSummary.from_values().
+
+        Returns:
+            DatasetSummary: self
+        """
+        numeric = df.select_dtypes("number").columns
+        for col in numeric:
+            chunk = ColumnSummary.from_values(df[col].to_numpy(float), **kwargs)
+            self.columns[col] = (
+                self.columns[col].merge(chunk) if col in self.columns else chunk
+            )
+        return self
+
+    def merge(self, other: DatasetSummary) -> DatasetSummary:
+        """Summary of the rows of both (e.g. of different shards of a dataset)."""
+        columns = dict(self.columns)
+        for col, summary in other.columns.items():
+            columns[col] = columns[col].merge(summary) if col in columns else summary
+        return DatasetSummary(columns)
+
+    def describe(
+        self, percentiles: Sequence[float] = (0.25, 0.5, 0.75)
+    ) -> pd.DataFrame:
+        """Like DataFrame.describe() plus skew, kurtosis and missing counts.
+        Percentiles are exact for summaries of an in-memory DataFrame, else
+        approximate (see QuantileSketch).
+        """
+        rows = {}
+        for col, summary in self.columns.items():
+            moments = summary.moments
+            rows[col] = {
+                "count": moments.count,
+                "mean": moments.mean if moments.count else math.nan,
+                "std": moments.std,
+                "min": moments.min if moments.count else math.nan,
+                **dict(
+                    zip(
+                        (f"{p:.0%}" for p in percentiles), summary.quantile(percentiles)
+                    )
+                ),
+                "max": moments.max if moments.count else math.nan,
+                "skew": moments.skew,
+                "kurtosis": moments.kurtosis,
+                "missing": summary.n_missing,
+            }
+        return pd.DataFrame(rows)
+
+
+def summarize(
+    source: pd.DataFrame | Iterable[pd.DataFrame] | str,
+    columns: Sequence[str] | None = None,
+    chunk_size: int = 100_000,
+    **kwargs: Any,
+) -> DatasetSummary:
+    """Summarize all numeric columns of a dataset in one pass.
+
+    Args:
+        source (pd.DataFrame | Iterable[pd.DataFrame] | str): Dataset, chunks of a
+            dataset or path to a Parquet file (read one batch at a time).
+        columns (Sequence[str], optional): Only summarize these columns.
+        chunk_size (int): Rows per chunk for DataFrames and Parquet files.
+            Defaults to 100_000.
+        **kwargs: Passed to ColumnSummary.from_values(), e.g. max_bins or
+            relative_accuracy.
+
+    Returns:
+        DatasetSummary: Reusable for describe() and plot_histograms(). For
+            DataFrames, it keeps each column's sorted values for exact quantiles.
+    """
+    if isinstance(source, str):
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(source).iter_batches(chunk_size, columns=columns)
+        chunks: Iterable[pd.DataFrame] = (batch.to_pandas() for batch in batches)
+    elif isinstance(source, pd.DataFrame):
+        chunks = (
+            source.iloc[start : start + chunk_size]
+            for start in range(0, len(source), chunk_size)
+        )
+    else:
+        chunks = source
+
+    summary = DatasetSummary()
+    for chunk in chunks:
+        summary.update(chunk if columns is None else chunk[list(columns)], **kwargs)
+    if isinstance(source, pd.DataFrame):
+        # the data is in memory anyway, so skip the sketch's relative error
+        for col, col_summary in summary.columns.items():
+            values = source[col].to_numpy(float)
+            col_summary.sorted_values = np.sort(values[np.isfinite(values)])
+    return summary
+
+
+def plot_histograms(
+    summary: DatasetSummary,
+    columns: Sequence[str] | None = None,
+    bins: int = 50,
+    log: bool = False,
+    layout: Sequence[int] | None = None,
+    figsize: Sequence[float] | None = None,
+) -> np.ndarray:
+    """Grid of histograms like DataFrame.hist() but drawn from a DatasetSummary.
+
+    Args:
+        summary (DatasetSummary): Output of summarize().
+        columns (Sequence[str], optional): Columns to plot. Defaults to all.
+        bins (int): Max number of bins per histogram. Defaults to 50.
+        log (bool): Log-scale counts. Defaults to False.
+        layout (Sequence[int], optional): (rows, cols) of the grid. Defaults to a
+            near-square grid.
+        figsize (Sequence[float], optional): Figure size in inches.
+
+    Returns:
+        np.ndarray: 2D array of matplotlib Axes.
+    """
+    import matplotlib.pyplot as plt
+
+    columns = list(summary.columns if columns is None else columns)
+    if layout is None:
+        n_cols = math.ceil(math.sqrt(len(columns)))
+        layout = (math.ceil(len(columns) / n_cols), n_cols)
+    fig, axs = plt.subplots(*layout, figsize=figsize, squeeze=False)
+    for ax, col in zip(axs.flat, columns):
+        counts, edges = summary.columns[col].histogram.histogram(bins)
+        ax.stairs(counts, edges, fill=True)
+        if log:
+            ax.set_yscale("log")
+        ax.set_title(col)
+        ax.grid(True)
+    for ax in axs.flat[len(columns) :]:
+        ax.set_visible(False)
+    return axs
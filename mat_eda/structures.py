@@ -0,0 +1,354 @@
+"""Compact array-backed storage for many crystal structures.
+
+Instead of one pymatgen Structure object per row, a StructureBatch holds all
+lattices in a single (N, 3, 3) array and all sites in flat (ragged) arrays indexed by
+per-structure offsets. This makes saving/loading a whole dataset a handful of
+contiguous array reads, lets Structure objects be built only when needed and turns
+properties like volume or density into single NumPy operations over all structures.
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from typing import IO, Iterable, Iterator, Sequence
+
+import numpy as np
+from pymatgen.core import Composition, Element, Lattice, Structure
+from pymatgen.core.units import amu_to_kg
+from scipy.sparse import csr_matrix
+
+
+ARRAY_NAMES = ("lattices", "frac_coords", "atomic_nums", "offsets")
+N_ELEMENTS = 118
+
+# atomic masses in amu indexed by atomic number (index 0 unused)
+ATOMIC_MASSES = np.array(
+    [0] + [float(Element.from_Z(Z).atomic_mass) for Z in range(1, N_ELEMENTS + 1)]
+)
+# element symbols indexed by atomic number (index 0 unused)
+ELEMENT_SYMBOLS = [""] + [Element.from_Z(Z).symbol for Z in range(1, N_ELEMENTS + 1)]
+# converts amu / Angstrom^3 to g / cm^3
+AMU_PER_A3_TO_G_PER_CM3 = amu_to_kg * 1e3 / 1e-24
+
+
+class StructureBatch(Sequence):
+    """Many ordered crystal structures stored as flat NumPy arrays.
+
+    Sites of structure i are frac_coords[offsets[i] : offsets[i + 1]] and
+    atomic_nums[offsets[i] : offsets[i + 1]]. Missing structures (None) are stored
+    with NaN lattices and no sites.
+
+    Only element identities are kept, i.e. oxidation states, site properties and
+    partial occupancies are dropped.
+    """
+
+    def __init__(
+        self,
+        lattices: np.ndarray,
+        frac_coords: np.ndarray,
+        atomic_nums: np.ndarray,
+        offsets: np.ndarray,
+    ) -> None:
+        """
+        Args:
+            lattices (np.ndarray): shape (N, 3, 3) lattice matrices in Angstrom
+                with lattice vectors as rows.
+            frac_coords (np.ndarray): shape (n_sites_total, 3) fractional
+                coordinates of all sites of all structures.
+            atomic_nums (np.ndarray): shape (n_sites_total,) atomic numbers.
+            offsets (np.ndarray): shape (N + 1,) start index of each structure's
+                sites in frac_coords and atomic_nums, followed by n_sites_total.
+        """
+        if len(offsets) != len(lattices) + 1:
+            raise ValueError(
+                f"Expected {len(lattices) + 1} offsets for {len(lattices)} "
+                f"lattices, got {len(offsets)}"
+            )
+        if not len(frac_coords) == len(atomic_nums) == offsets[-1]:
+            raise ValueError(
+                f"{len(frac_coords)=} and {len(atomic_nums)=} must equal the last "
+                f"offset {offsets[-1]}"
+            )
+        self.lattices = lattices
+        self.frac_coords = frac_coords
+        self.atomic_nums = atomic_nums
+        self.offsets = offsets
+
+    @classmethod
+    def from_structures(cls, structures: Iterable[Structure | None]) -> StructureBatch:
+        """Pack pymatgen Structures into arrays.
+
+        Raises:
+            ValueError: If a structure has disordered sites.
+        """
+        lattices, frac_coords, atomic_nums, n_sites = [], [], [], [0]
+        for struct in structures:
+            if struct is None:
+                lattices.append(np.full((3, 3), np.nan))
+                n_sites.append(0)
+                continue
+            if not struct.is_ordered:
+                raise ValueError(
+                    f"StructureBatch only supports ordered structures, got "
+                    f"{struct.formula}"
+                )
+            lattices.append(struct.lattice.matrix)
+            frac_coords.append(struct.frac_coords)
+            atomic_nums.append([site.specie.Z for site in struct])
+            n_sites.append(len(struct))
+
+        return cls(
+            lattices=np.array(lattices, dtype=float).reshape(-1, 3, 3),
+            frac_coords=np.concatenate(frac_coords or [np.zeros((0, 3))]),
+            atomic_nums=np.concatenate(atomic_nums or [[]]).astype(np.uint8),
+            offsets=np.cumsum(n_sites, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.lattices)
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(n_structures={len(self):,}, "
+            f"n_sites={len(self.atomic_nums):,})"
+        )
+
+    def __getitem__(self, idx):  # type: ignore[override]
+        """Integer indices return a pymatgen Structure (or None for missing
+        structures), slices return a new StructureBatch.
+        """
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(len(self))
+            if step != 1:
+                return self.take(np.arange(start, stop, step))
+            stop = max(start, stop)
+            site_start, site_stop = self.offsets[start], self.offsets[stop]
+            return type(self)(
+                lattices=self.lattices[start:stop],
+                frac_coords=self.frac_coords[site_start:site_stop],
+                atomic_nums=self.atomic_nums[site_start:site_stop],
+                offsets=self.offsets[start : stop + 1] - site_start,
+            )
+
+        idx = range(len(self))[idx]  # supports negative indices, raises IndexError
+        lattice = self.lattices[idx]
+        if np.isnan(lattice).any():
+            return None
+        site_slice = slice(self.offsets[idx], self.offsets[idx + 1])
+        return Structure(
+            Lattice(lattice),
+            self.atomic_nums[site_slice].tolist(),
+            self.frac_coords[site_slice],
+        )
+
+    def __iter__(self) -> Iterator[Structure | None]:
+        return (self[idx] for idx in range(len(self)))
+
+    def take(self, indices: Sequence[int] | np.ndarray) -> StructureBatch:
+        """New StructureBatch with only the structures at the given indices."""
+        indices = np.asarray(indices, dtype=np.int64)
+        starts, stops = self.offsets[indices], self.offsets[indices + 1]
+        n_sites = stops - starts
+        # site indices of all selected structures, concatenated
+        site_idx = np.repeat(starts - np.cumsum(n_sites) + n_sites, n_sites)
+        site_idx += np.arange(n_sites.sum())
+        return type(self)(
+            lattices=self.lattices[indices],
+            frac_coords=self.frac_coords[site_idx],
+            atomic_nums=self.atomic_nums[site_idx],
+            offsets=np.concatenate([[0], np.cumsum(n_sites)]),
+        )
+
+    @property
+    def n_sites(self) -> np.ndarray:
+        """Number of sites in each structure."""
+        return np.diff(self.offsets)
+
+    @property
+    def site_structure_idx(self) -> np.ndarray:
+        """Index of the structure each site belongs to."""
+        return np.repeat(np.arange(len(self)), self.n_sites)
+
+    @property
+    def volumes(self) -> np.ndarray:
+        """Unit cell volumes in Angstrom^3 (NaN for missing structures)."""
+        with np.errstate(invalid="ignore"):
+            return np.abs(np.linalg.det(self.lattices))
+
+    @property
+    def volumes_per_atom(self) -> np.ndarray:
+        """Unit cell volumes divided by number of sites in Angstrom^3."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.volumes / self.n_sites
+
+    @property
+    def n_elements(self) -> np.ndarray:
+        """Number of distinct elements in each structure."""
+        return np.diff(self.element_counts().indptr)
+
+    @property
+    def masses(self) -> np.ndarray:
+        """Total mass of each unit cell in amu."""
+        site_masses = ATOMIC_MASSES[self.atomic_nums]
+        return np.bincount(
+            self.site_structure_idx, weights=site_masses, minlength=len(self)
+        )
+
+    @property
+    def densities(self) -> np.ndarray:
+        """Mass densities in g/cm^3."""
+        return self.masses / self.volumes * AMU_PER_A3_TO_G_PER_CM3
+
+    def element_counts(self) -> csr_matrix:
+        """Sparse (n_structures, 118) matrix counting how many sites of each element
+        each structure (row) has. Column j holds atomic number j + 1, same layout as
+        mat_eda.composition.element_count_matrix().
+        """
+        ones = np.ones(len(self.atomic_nums), dtype=np.int32)
+        elem_idx = self.atomic_nums.astype(np.int64) - 1
+        shape = (len(self), N_ELEMENTS)
+        return csr_matrix((ones, (self.site_structure_idx, elem_idx)), shape)
+
+    def unique_compositions(
+        self, element_counts: csr_matrix | None = None
+    ) -> tuple[list[Composition | None], np.ndarray]:
+        """Distinct compositions in the batch and the index of each structure's
+        composition in that list. Missing structures have composition None.
+
+        Args:
+            element_counts (csr_matrix, optional): Output of element_counts() if
+                already computed.
+        """
+        counts = self.element_counts() if element_counts is None else element_counts
+        rows = [
+            tuple(zip(counts.indices[start:stop].tolist(), counts.data[start:stop]))
+            for start, stop in zip(counts.indptr[:-1], counts.indptr[1:])
+        ]
+        row_idx: dict[tuple[tuple[int, int], ...], int] = {}
+        inverse = np.array([row_idx.setdefault(row, len(row_idx)) for row in rows])
+        comps = [
+            Composition({Element.from_Z(idx + 1): amt for idx, amt in row})
+            if row
+            else None
+            for row in row_idx
+        ]
+        return comps, inverse.astype(np.int64)
+
+    def formulas(self, reduced: bool = False) -> list[str | None]:
+        """Chemical formulas as returned by Structure.formula (or
+        Composition.reduced_formula if reduced=True).
+
+        Only builds one pymatgen Composition per unique composition in the batch.
+        """
+        comps, inverse = self.unique_compositions()
+        formulas = [
+            None if comp is None else comp.reduced_formula if reduced else comp.formula
+            for comp in comps
+        ]
+        return [formulas[idx] for idx in inverse]
+
+    def to_structures(self) -> list[Structure | None]:
+        """Build pymatgen Structures for all entries."""
+        return list(self)
+
+    def save(self, dir_path: str) -> None:
+        """Write each array as a separate .npy file so they can later be
+        memory-mapped.
+        """
+        os.makedirs(dir_path, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(f"{dir_path}/{name}.npy", getattr(self, name))
+
+    @classmethod
+    def load(cls, dir_path: str, mmap_mode: str | None = None) -> StructureBatch:
+        """Read arrays written by save().
+
+        Args:
+            dir_path (str): Directory passed to save().
+            mmap_mode (str, optional): Passed to np.load(). Use "r" to memory-map
+                the arrays instead of reading them into RAM.
+        """
+        arrays = {
+            name: np.load(f"{dir_path}/{name}.npy", mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(**arrays)
+
+
+class StructureBatchWriter:
+    """Write a StructureBatch piece by piece in the layout read by
+    StructureBatch.load(), without holding more than one piece in memory. Arrays
+    are appended to raw files and only get their .npy header on close().
+
+    Usage:
+        with StructureBatchWriter(dir_path) as writer:
+            for batch in batches:
+                writer.append(batch)
+    """
+
+    def __init__(self, dir_path: str) -> None:
+        self.dir_path = dir_path
+        self.n_structures = self.n_sites = 0
+        self._files: dict[str, IO[bytes]] = {}
+        self._dtypes: dict[str, np.dtype] = {}
+        self._shapes: dict[str, tuple[int, ...]] = {}
+
+    def __enter__(self) -> StructureBatchWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:  # type: ignore
+        self.close(write=exc_type is None)
+
+    def append(self, batch: StructureBatch) -> None:
+        """Add the structures of batch after those appended so far."""
+        if not self._files:
+            os.makedirs(self.dir_path, exist_ok=True)
+            for name in ARRAY_NAMES:
+                self._files[name] = open(f"{self.dir_path}/{name}.npy.part", "wb")
+        arrays = dict(
+            lattices=batch.lattices,
+            frac_coords=batch.frac_coords,
+            atomic_nums=batch.atomic_nums,
+            # the closing offset (total number of sites) is written by close()
+            offsets=batch.offsets[:-1] + self.n_sites,
+        )
+        for name, arr in arrays.items():
+            dtype = self._dtypes.setdefault(name, arr.dtype)
+            self._shapes.setdefault(name, arr.shape[1:])
+            self._files[name].write(np.ascontiguousarray(arr, dtype=dtype).tobytes())
+        self.n_structures += len(batch)
+        self.n_sites += len(batch.atomic_nums)
+
+    def close(self, write: bool = True) -> None:
+        """Write the .npy files. Does nothing if nothing was appended.
+
+        Args:
+            write (bool): If False, only close and remove the raw files, e.g.
+                after an error. Defaults to True.
+        """
+        if not self._files:
+            return
+        if write:
+            offsets = self._files["offsets"]
+            offsets.write(np.array([self.n_sites], self._dtypes["offsets"]).tobytes())
+        lengths = dict(
+            lattices=self.n_structures,
+            frac_coords=self.n_sites,
+            atomic_nums=self.n_sites,
+            offsets=self.n_structures + 1,
+        )
+        for name, part in self._files.items():
+            part.close()
+            if write:
+                header = dict(
+                    descr=np.lib.format.dtype_to_descr(self._dtypes[name]),
+                    fortran_order=False,
+                    shape=(lengths[name], *self._shapes[name]),
+                )
+                with open(f"{self.dir_path}/{name}.npy", "wb") as out_file:
+                    np.lib.format.write_array_header_1_0(out_file, header)
+                    with open(part.name, "rb") as in_file:
+                        shutil.copyfileobj(in_file, out_file)
+            os.remove(part.name)
+        self._files.clear()
@@ -0,0 +1,262 @@
+"""Lightweight timing spans exportable as Chrome trace JSON.
+
+Wrap hot paths in nestable spans:
+
+    with span("spacegroups", items=len(structures)):
+        ...
+
+Each span records wall time, CPU time of the current process and an optional item
+count (plus items/sec). Tracing is off by default, in which case span() returns a
+shared no-op object. Set the MAT_EDA_TRACE environment variable to a file path to
+enable tracing for a whole run and write the trace to that path on exit, or call
+enable() and save() yourself. Open the file in chrome://tracing or
+https://ui.perfetto.dev.
+
+The shared helpers (load_dataset(), get_spacegroups(), get_wyckoff_labels(),
+get_neighbor_lists(), element_count_matrix(), ...) are instrumented, and
+parallel_map() records one event per item from within the worker processes, so
+slow structures stand out. While tracing is enabled, matplotlib's savefig() and
+plotly's write_image() are also wrapped in spans (once a script has imported them),
+so every analyze_*.py script is traced without changes.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from multiprocessing import parent_process
+from typing import Any, Callable, TypeVar
+
+
+Func = TypeVar("Func", bound=Callable[..., Any])
+
+_events: list[dict[str, Any]] = []
+_lock = threading.Lock()
+_enabled = False
+_local = threading.local()  # per-thread stack of open spans for nesting depth
+
+
+def _now_us() -> float:
+    # perf_counter() is a system-wide monotonic clock on Linux and macOS, so
+    # timestamps from worker processes line up with those of the parent
+    return time.perf_counter() * 1e6
+
+
+def _add_event(event: dict[str, Any]) -> None:
+    with _lock:
+        _events.append(event)
+
+
+class Span:
+    """Context manager recording one complete ("X") event in Chrome trace format.
+    Use span() to create one.
+    """
+
+    def __init__(self, name: str, category: str, args: dict[str, Any]) -> None:
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def set(self, **args: Any) -> None:
+        """Attach extra info like item counts that are only known inside the span."""
+        self.args.update(args)
+
+    def __enter__(self) -> Span:
+        stack = _local.__dict__.setdefault("stack", [])
+        self.depth = len(stack)
+        stack.append(self)
+        self.start_us = _now_us()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        dur_us = _now_us() - self.start_us
+        cpu_s = time.process_time() - self.start_cpu
+        _local.stack.pop()
+        args = dict(self.args, cpu_ms=round(cpu_s * 1e3, 3), depth=self.depth)
+        if self.args.get("items"):
+            args["items_per_sec"] = round(self.args["items"] / (dur_us / 1e6), 2)
+        if exc_info[0] is not None:
+            args["error"] = exc_info[0].__name__
+        _add_event(
+            dict(
+                name=self.name,
+                cat=self.category,
+                ph="X",
+                ts=self.start_us,
+                dur=dur_us,
+                pid=os.getpid(),
+                tid=threading.get_ident(),
+                args=args,
+            )
+        )
+
+
+class _NullSpan:
+    """Returned by span() while tracing is disabled. Does nothing."""
+
+    def set(self, **args: Any) -> None:
+        pass
+
+    def __enter__(self) -> _NullSpan:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(
+    name: str, category: str = "mat_eda", items: int | None = None, **args: Any
+) -> Span | _NullSpan:
+    """Time a block of code.
+
+    Args:
+        name (str): Event name shown in the trace viewer.
+        category (str): Event category for filtering. Defaults to "mat_eda".
+        items (int, optional): Number of items (e.g. structures) processed. Adds
+            items/sec to the event.
+        **args: Extra JSON-serializable info shown with the event.
+
+    Returns:
+        Span: Context manager. Use its set() method to add info like item counts
+            discovered inside the block.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    _patch_plotting()
+    if items is not None:
+        args["items"] = items
+    return Span(name, category, args)
+
+
+def traced(
+    name: str | None = None, category: str = "mat_eda"
+) -> Callable[[Func], Func]:
+    """Decorator wrapping every call of a function in a span.
+
+    Args:
+        name (str, optional): Span name. Defaults to the function's qualified name.
+        category (str): Event category. Defaults to "mat_eda".
+    """
+
+    def decorator(func: Func) -> Func:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(span_name, category):
+                return func(*args, **kwargs)
+
+        wrapper.is_traced = True  # type: ignore[attr-defined]
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def traced_call(
+    func: Callable[[Any], Any], name: str, item: Any
+) -> tuple[Any, dict[str, Any]]:
+    """Call func(item) and return its result with a trace event. Used by
+    parallel_map() to collect per-item timings from worker processes (which don't
+    share the parent's event list).
+    """
+    start_us, start_cpu = _now_us(), time.process_time()
+    result = func(item)
+    event = dict(
+        name=name,
+        cat="item",
+        ph="X",
+        ts=start_us,
+        dur=_now_us() - start_us,
+        pid=os.getpid(),
+        tid=threading.get_ident(),
+        args=dict(cpu_ms=round((time.process_time() - start_cpu) * 1e3, 3)),
+    )
+    return result, event
+
+
+def add_events(events: list[dict[str, Any]]) -> None:
+    """Record events created elsewhere, e.g. by traced_call() in worker processes."""
+    with _lock:
+        _events.extend(events)
+
+
+def _patch_plotting() -> None:
+    """Wrap matplotlib's savefig() and plotly's write_image() in spans if those
+    packages have been imported. Never imports them itself so featurize-only runs
+    don't pay their import time. Called on every span() while tracing is enabled
+    so packages imported later are patched before their first figure is saved.
+    """
+    if (figure := sys.modules.get("matplotlib.figure")) and not getattr(
+        figure.Figure.savefig, "is_traced", False
+    ):
+        figure.Figure.savefig = traced("savefig", "plot")(figure.Figure.savefig)
+    if (basedatatypes := sys.modules.get("plotly.basedatatypes")) and not getattr(
+        basedatatypes.BaseFigure.write_image, "is_traced", False
+    ):
+        basedatatypes.BaseFigure.write_image = traced("write_image", "plot")(
+            basedatatypes.BaseFigure.write_image
+        )
+
+
+def enable() -> None:
+    """Start recording spans."""
+    global _enabled
+    _enabled = True
+    _patch_plotting()
+
+
+def disable() -> None:
+    """Stop recording spans. Already recorded events are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """Whether spans are currently recorded."""
+    return _enabled
+
+
+def events() -> list[dict[str, Any]]:
+    """Copy of all recorded events."""
+    with _lock:
+        return list(_events)
+
+
+def clear() -> None:
+    """Delete all recorded events."""
+    with _lock:
+        _events.clear()
+
+
+def save(path: str) -> str:
+    """Write all recorded events as Chrome trace JSON.
+
+    Args:
+        path (str): Output file, e.g. "trace.json".
+
+    Returns:
+        str: path
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    trace = dict(traceEvents=events(), displayTimeUnit="ms")
+    with open(path, "w") as file:
+        json.dump(trace, file)
+    return path
+
+
+# worker processes return their events to the parent via traced_call() instead of
+# writing (and overwriting) the trace file themselves
+if (trace_path := os.getenv("MAT_EDA_TRACE")) and parent_process() is None:
+    enable()
+    atexit.register(save, trace_path)
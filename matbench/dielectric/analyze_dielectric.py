@@ -15,18 +15,19 @@ https://ml.materialsproject.org/projects/matbench_dielectric
 
 # %%
 import matplotlib.pyplot as plt
-import plotly.express as px
 import plotly.io as pio
-from aviary.wren.utils import count_wyks, get_aflow_label_spglib
-from matminer.datasets import load_dataset
 from pymatviz import (
     ptable_heatmap,
     ptable_heatmap_plotly,
     spacegroup_hist,
     spacegroup_sunburst,
 )
-from pymatviz.utils import get_crystal_sys
-from tqdm import tqdm
+
+from mat_eda.aggregate import scatter, violin
+from mat_eda.composition import element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import DATASET_FEATURES, add_features
 
 
 pio.templates.default = "plotly_white"
@@ -38,48 +39,36 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_diel = load_dataset("matbench_dielectric")
-
-df_diel[["spg_symbol", "spg_num"]] = [
-    struct.get_space_group_info()
-    for struct in tqdm(df_diel.structure, desc="Getting spacegroups")
-]
-
-df_diel["wyckoff"] = [
-    get_aflow_label_spglib(struct)
-    for struct in tqdm(df_diel.structure, desc="Getting Wyckoff strings")
-]
-df_diel["n_wyckoff"] = df_diel.wyckoff.map(count_wyks)
-
-df_diel["crystal_sys"] = df_diel.spg_num.map(get_crystal_sys)
+df_diel, structures = load_dataset("matbench_dielectric")
 
-df_diel["volume"] = [x.volume for x in df_diel.structure]
-df_diel["formula"] = [x.formula for x in df_diel.structure]
+# volume, formula, space group, crystal system and Wyckoff columns
+add_features(df_diel, structures, DATASET_FEATURES["matbench_dielectric"])
 
 
 # %%
-ptable_heatmap(df_diel.formula, log=True)
+elem_counts = structures.element_counts()
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elemental prevalence in the Matbench dielectric dataset")
-plt.savefig("dielectric-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "dielectric-ptable-heatmap.pdf")
 
 
 # %%
-fig = ptable_heatmap_plotly(df_diel.formula)
+fig = ptable_heatmap_plotly(element_prevalence(elem_counts))
 title = "Elements in Matbench Dielectric"
 fig.update_layout(title=dict(text=f"<b>{title}</b>", x=0.4, y=0.94, font_size=20))
-# fig.write_image("dielectric-ptable-heatmap-plotly.pdf")
+# save_fig(fig, "dielectric-ptable-heatmap-plotly.pdf")
 
 
 # %%
 ax = spacegroup_hist(df_diel.spg_num)
 ax.set_title("Space group histogram", y=1.1)
-plt.savefig("dielectric-spacegroup-hist.pdf")
+save_fig(plt.gcf(), "dielectric-spacegroup-hist.pdf")
 
 
 # %%
 fig = spacegroup_sunburst(df_diel.spg_num, show_counts="percent")
 fig.update_layout(title="Space group sunburst")
-# fig.write_image("dielectric-spacegroup-sunburst.pdf")
+# save_fig(fig, "dielectric-spacegroup-sunburst.pdf")
 fig.show()
 
 
@@ -96,16 +85,14 @@ cry_sys_order = (
 
 
 # %%
-fig = px.violin(
+fig = violin(
     df_diel,
-    color="crystal_sys",
     x="crystal_sys",
     y="n",
     labels=plot_labels,
-    points="all",
     hover_data=["spg_num"],
     hover_name="formula",
-).update_traces(jitter=1)
+)
 fig.update_layout(
     title="<b>Refractive index distribution by crystal system</b>",
     title_x=0.5,
@@ -125,23 +112,21 @@ for cry_sys, df_group in sorted(
 xaxis = dict(tickvals=list(range(len(cry_sys_order))), ticktext=list(x_ticks.values()))
 fig.update_layout(xaxis=xaxis)
 
-# fig.write_image("dielectric-violin.pdf")
+# save_fig(fig, "dielectric-violin.pdf")
 fig.show()
 
 
 # %%
-fig = px.violin(
+fig = violin(
     df_diel,
-    color="crystal_sys",
     x="crystal_sys",
     y="n_wyckoff",
     labels=plot_labels,
-    points="all",
     hover_data=["spg_num"],
     hover_name="formula",
     category_orders={"crystal_sys": cry_sys_order},
     log_y=True,
-).update_traces(jitter=1)
+)
 
 fig.update_layout(
     title="<b>Matbench dielectric: Number of Wyckoff positions by crystal system</b>",
@@ -173,12 +158,12 @@ for cry_sys, df_group in sorted(
 xaxis = dict(tickvals=list(range(7)), ticktext=list(x_ticks.values()))
 fig.update_layout(xaxis=xaxis)
 
-# fig.write_image("dielectric-violin-num-wyckoffs.pdf")
+# save_fig(fig, "dielectric-violin-num-wyckoffs.pdf")
 fig.show()
 
 
 # %%
-fig = px.scatter(
+fig = scatter(
     df_diel.round(2),
     x="volume",
     y="n",
@@ -197,5 +182,5 @@ fig.update_layout(
 # slightly increase scatter point size (lower sizeref means larger)
 fig.update_traces(marker_sizeref=0.08, selector=dict(mode="markers"))
 
-# fig.write_image("dielectric-scatter.pdf")
+# save_fig(fig, "dielectric-scatter.pdf")
 fig.show()
@@ -24,12 +24,15 @@ https://ml.materialsproject.org/projects/matbench_expt_gap
 
 # %%
 import matplotlib.pyplot as plt
-import plotly.express as px
 import plotly.io as pio
-from matminer.datasets import load_dataset
-from pymatgen.core import Composition
 from pymatviz import ptable_heatmap
 
+from mat_eda.aggregate import scatter
+from mat_eda.composition import element_count_matrix, element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import DATASET_FEATURES, add_features
+
 
 pio.templates.default = "plotly_white"
 
@@ -40,33 +43,24 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_gap = load_dataset("matbench_expt_gap")
-
-df_gap["pmg_comp"] = df_gap.composition.map(Composition)
-df_gap["n_atoms"] = [x.num_atoms for x in df_gap.pmg_comp]
-df_gap["n_elems"] = df_gap.pmg_comp.map(len)
-
+df_gap, _ = load_dataset("matbench_expt_gap")
 
-def mean_atomic_prop(comp: Composition, prop: str) -> float | None:
-    try:
-        return sum(getattr(el, prop) * amt for el, amt in comp.items()) / comp.num_atoms
-    except Exception:
-        print(f"Could not compute mean {prop} for {comp}")
-        return None
-
-
-df_gap["mean_mass"] = [mean_atomic_prop(x, "atomic_mass") for x in df_gap.pmg_comp]
-df_gap["mean_radius"] = [mean_atomic_prop(x, "atomic_radius") for x in df_gap.pmg_comp]
+# n_atoms, n_elems, mean_mass and mean_radius (NaN if any element has no known
+# radius) as sparse matrix products over all compositions at once
+add_features(df_gap, None, DATASET_FEATURES["matbench_expt_gap"])
 
 
 # %%
+elem_counts = element_count_matrix(
+    df_gap.query("~composition.str.contains('Xe')").composition
+)
 ptable_heatmap(
-    df_gap.query("~composition.str.contains('Xe')").composition,
+    element_prevalence(elem_counts),
     log=True,
     text_color="black",
 )
 plt.title("Elements in Matbench experimental band gap dataset")
-plt.savefig("expt-gap-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "expt-gap-ptable-heatmap.pdf")
 
 
 # %%
@@ -75,7 +69,7 @@ plot_labels = {
     "n_elems": "Element Count",
     "gap expt": "Experimental band gap (eV)",
 }
-fig = px.scatter(
+fig = scatter(
     df_gap,
     x="n_atoms",
     y="gap expt",
@@ -86,5 +80,5 @@ fig = px.scatter(
     log_x=True,
 )
 fig.update_layout(title="Marker size = mean atomic mass")
-fig.write_image("expt-gap-scatter.pdf")
+save_fig(fig, "expt-gap-scatter.pdf")
 fig.show()
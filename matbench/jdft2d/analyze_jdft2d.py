@@ -14,9 +14,12 @@ https://ml.materialsproject.org/projects/matbench_jdft2d
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap, spacegroup_hist, spacegroup_sunburst
-from tqdm import tqdm
+
+from mat_eda.composition import element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import DATASET_FEATURES, add_features
 
 
 plt.rc("font", size=16)
@@ -26,36 +29,32 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_2d = load_dataset("matbench_jdft2d")
+df_2d, structures = load_dataset("matbench_jdft2d")
 
-df_2d[["spg_symbol", "spg_num"]] = [
-    struct.get_space_group_info() for struct in tqdm(df_2d.structure)
-]
+add_features(df_2d, structures, DATASET_FEATURES["matbench_jdft2d"])
 
 df_2d.describe()
 
 
 # %%
 df_2d.hist(column="exfoliation_en", bins=50, log=True)
-plt.savefig("jdft2d-exfoliation-energy-hist.pdf")
+save_fig(plt.gcf(), "jdft2d-exfoliation-energy-hist.pdf")
 
 
 # %%
-df_2d["volume"] = [x.volume for x in df_2d.structure]
-df_2d["formula"] = [x.formula for x in df_2d.structure]
-
-ptable_heatmap(df_2d.formula, log=True)
+elem_counts = structures.element_counts()
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elemental prevalence in the Matbench Jarvis DFT 2D dataset")
-plt.savefig("jdft2d-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "jdft2d-ptable-heatmap.pdf")
 
 
 # %%
 spacegroup_hist(df_2d.spg_num, log=True)
-plt.savefig("jdft2d-spacegroup-hist.pdf")
+save_fig(plt.gcf(), "jdft2d-spacegroup-hist.pdf")
 
 
 # %%
 fig = spacegroup_sunburst(df_2d.spg_num, show_counts="percent")
 fig.update_layout(title="Spacegroup sunburst of the JARVIS DFT 2D dataset")
-fig.write_image("jdft2d-spacegroup-sunburst.pdf")
+save_fig(fig, "jdft2d-spacegroup-sunburst.pdf")
 fig.show()
@@ -11,18 +11,15 @@ https://ml.materialsproject.org/projects/matbench_log_kvrh
 
 
 # %%
-from time import perf_counter
-
 import matplotlib.pyplot as plt
-import numpy as np
-import plotly.express as px
 import plotly.io as pio
-from aviary.wren.utils import count_wyks, get_aflow_label_spglib
-from matminer.datasets import load_dataset
-from pymatgen.core import Structure
 from pymatviz import ptable_heatmap, spacegroup_hist, spacegroup_sunburst
-from pymatviz.utils import get_crystal_sys
-from tqdm import tqdm
+
+from mat_eda.aggregate import violin
+from mat_eda.composition import element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import add_columns
 
 
 plt.rc("font", size=16)
@@ -34,24 +31,27 @@ pio.templates.default = "plotly_white"
 
 
 # %%
-df_grvh = load_dataset("matbench_log_gvrh")
-df_kvrh = load_dataset("matbench_log_kvrh")
-
-# getting space group symbols and numbers for 10,987 structures takes about 45 sec
-df_grvh[["spg_symbol", "spg_num"]] = [
-    struct.get_space_group_info()
-    for struct in tqdm(df_grvh.structure, desc="Getting matbench_log_gvrh spacegroups")
-]
-df_grvh["crystal_sys"] = [get_crystal_sys(x) for x in df_grvh.spg_num]
-
-df_grvh["wyckoff"] = [
-    get_aflow_label_spglib(struct)
-    for struct in tqdm(
-        df_grvh.structure, desc="Getting matbench_log_gvrh Wyckoff strings"
-    )
-]
-df_grvh["n_wyckoff"] = df_grvh.wyckoff.map(count_wyks)
-df_grvh["formula"] = [x.formula for x in df_grvh.structure]
+df_grvh, grvh_strucs = load_dataset("matbench_log_gvrh")
+df_kvrh, kvrh_strucs = load_dataset("matbench_log_kvrh")
+
+# all derived columns in one pass over the structures: spglib runs once per
+# structure for space group, crystal system and Wyckoff positions (about 45 sec for
+# 10,987 structures serially, spread over all CPU cores). isolated_r5 (any site
+# without neighbors within 5 Angstrom, accounting for periodic images) reuses the
+# neighbor lists counted in graph_size
+add_columns(
+    df_grvh,
+    grvh_strucs,
+    [
+        "volume",
+        "formula",
+        "spg_num",
+        "crystal_sys",
+        "n_wyckoff",
+        "graph_size",
+        "isolated_r5",
+    ],
+)
 
 
 # %%
@@ -68,80 +68,42 @@ print(sum(df_kvrh["log10(K_VRH)"] == 0))  # sum is 14
 ax = df_kvrh.hist(column="log10(K_VRH)", bins=50, alpha=0.8)
 
 df_grvh.hist(column="log10(G_VRH)", bins=50, ax=ax, alpha=0.8)
-plt.savefig("log_g+kvrh-target-hist.pdf")
+save_fig(plt.gcf(), "log_g+kvrh-target-hist.pdf")
 
 
 # %%
-df_grvh["volume"] = [x.volume for x in df_grvh.structure]
-df_grvh["formula"] = [x.formula for x in df_grvh.structure]
-
 df_grvh.hist(column="volume", bins=50, log=True, alpha=0.8)
-plt.savefig("log_gvrh-volume-hist.pdf")
+save_fig(plt.gcf(), "log_gvrh-volume-hist.pdf")
 
 
 # %%
-start = perf_counter()
-radius = 5
-df_grvh[f"neighbor_list_r{radius}"] = [
-    x.get_neighbor_list(r=radius) for x in df_grvh.structure
-]
-print(f"took {perf_counter() - start:.3f} sec")
-
-df_kvrh[f"neighbor_list_r{radius}"] = [
-    x.get_neighbor_list(r=radius) for x in df_kvrh.structure
-]
-
-
-# %%
-start = perf_counter()
-
-
-def has_isolated_atom(crystal: Structure, radius: float = 5) -> bool:
-    dists = crystal.distance_matrix
-    np.fill_diagonal(dists, np.inf)
-    return (dists.min(1) > radius).any()
-
-
-df_grvh["isolated_r5"] = df_grvh.structure.apply(has_isolated_atom)
-print(f"took {perf_counter() - start:.3f} sec")
-
-
-# %%
-df_grvh["graph_size"] = df_grvh[f"neighbor_list_r{radius}"].apply(
-    lambda lst: len(lst[0])
-)
-
-
-# %%
-for idx, structure, target, *_ in df_grvh.query("graph_size == 0").itertuples():
+for idx, target, *_ in df_grvh.query("graph_size == 0").itertuples():
+    structure = grvh_strucs[idx]
     print(f"\n{idx = }")
     print(f"{structure = }")
     print(f"{target = }")
 
 
 # %%
-df_grvh["volume"] = df_grvh.structure.apply(lambda struct: struct.volume)
-
 df_grvh.hist(column="volume", bins=50, log=True)
 
 
 # %%
-df_grvh["formula"] = df_grvh.structure.apply(lambda struct: struct.formula)
-
-ptable_heatmap(df_grvh.formula, log=True)
+elem_counts = grvh_strucs.element_counts()
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elemental prevalence in the Matbench bulk/shear modulus datasets")
-plt.savefig("log_gvrh-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "log_gvrh-ptable-heatmap.pdf")
 
 
 # %%
 spacegroup_hist(df_grvh.spg_num)
-plt.savefig("log_gvrh-spacegroup-hist.pdf")
+save_fig(plt.gcf(), "log_gvrh-spacegroup-hist.pdf")
 
 
 # %%
 fig = spacegroup_sunburst(df_grvh.spg_num, show_counts="percent")
 fig.update_layout(title="Spacegroup sunburst of the JARVIS DFT 2D dataset")
-fig.write_image("log_gvrh-spacegroup-sunburst.pdf")
+save_fig(fig, "log_gvrh-spacegroup-sunburst.pdf")
 fig.show()
 
 
@@ -158,18 +120,16 @@ cry_sys_order = (
 
 
 # %%
-fig = px.violin(
+fig = violin(
     df_grvh,
-    color="crystal_sys",
     x="crystal_sys",
     y="n_wyckoff",
     labels=plot_labels,
-    points="all",
     hover_data=["spg_num"],
     hover_name="formula",
     category_orders={"crystal_sys": cry_sys_order},
     log_y=True,
-).update_traces(jitter=1)
+)
 
 fig.update_layout(
     title="Matbench dielectric: Number of Wyckoff positions by crystal system",
@@ -200,5 +160,5 @@ for cry_sys, df_group in sorted(
 
 fig.update_layout(xaxis=dict(tickvals=list(range(7)), ticktext=list(x_ticks.values())))
 
-# fig.write_image("log_grvh-violin-num-wyckoffs.pdf")
+# save_fig(fig, "log_grvh-violin-num-wyckoffs.pdf")
 fig.show()
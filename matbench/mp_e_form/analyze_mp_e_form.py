@@ -14,9 +14,12 @@ https://ml.materialsproject.org/projects/matbench_mp_e_form
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap
 
+from mat_eda.chunked import aggregate_dataset
+from mat_eda.export import save_fig
+from mat_eda.stats import plot_histograms
+
 
 plt.rc("font", size=16)
 plt.rc("savefig", bbox="tight", dpi=200)
@@ -25,19 +28,18 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_e_form = load_dataset("matbench_mp_e_form")
-
-
-# %%
-df_e_form.hist(column="e_form", bins=50, log=True)
-plt.savefig("mp_e_form_hist.pdf")
+# first call converts the dataset to a columnar cache. Then it's streamed in chunks
+# of MAT_EDA_CHUNK_SIZE rows (default 10,000) which are reduced to histograms and
+# per-element totals, so peak memory doesn't grow with the dataset size
+e_form_agg = aggregate_dataset("matbench_mp_e_form")
 
 
 # %%
-df_e_form["formula"] = df_e_form.structure.apply(lambda struct: struct.formula)
+plot_histograms(e_form_agg.stats, ["e_form"], bins=50, log=True)
+save_fig(plt.gcf(), "mp_e_form_hist.pdf")
 
 
 # %%
-ptable_heatmap(df_e_form.formula, log=True)
+ptable_heatmap(e_form_agg.elements.prevalence(), log=True)
 plt.title("Elemental prevalence in the Matbench formation energy dataset")
-plt.savefig("mp_e_form-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "mp_e_form-ptable-heatmap.pdf")
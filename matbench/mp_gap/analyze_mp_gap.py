@@ -11,9 +11,12 @@ https://ml.materialsproject.org/projects/matbench_mp_gap
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap
 
+from mat_eda.chunked import aggregate_dataset
+from mat_eda.export import save_fig
+from mat_eda.stats import plot_histograms
+
 
 plt.rc("font", size=16)
 plt.rc("savefig", bbox="tight", dpi=200)
@@ -22,30 +25,24 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_gap = load_dataset("matbench_mp_gap")
+# first call converts the dataset to a columnar cache. Then it's streamed in chunks
+# of MAT_EDA_CHUNK_SIZE rows (default 10,000) which are reduced to histograms and
+# per-element totals, so peak memory doesn't grow with the dataset size
+gap_agg = aggregate_dataset("matbench_mp_gap")
 
 
 # %%
-df_gap.hist(column="gap pbe", bins=50, log=True)
+plot_histograms(gap_agg.stats, ["gap pbe"], bins=50, log=True)
 plt.xlabel("eV")
-plt.savefig("pbe_gap_hist.pdf")
-
-
-# %%
-df_gap["volume/atom"] = df_gap.structure.apply(
-    lambda cryst: cryst.volume / cryst.num_sites
-)
-df_gap["num_sites"] = df_gap.structure.apply(lambda cryst: cryst.num_sites)
-
-df_gap["formula"] = df_gap.structure.apply(lambda cryst: cryst.formula)
+save_fig(plt.gcf(), "pbe_gap_hist.pdf")
 
 
 # %%
-ptable_heatmap(df_gap.formula, log=True)
+ptable_heatmap(gap_agg.elements.prevalence(), log=True)
 plt.title("Elemental prevalence in the Matbench MP band gap dataset")
-plt.savefig("mp_gap-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "mp_gap-ptable-heatmap.pdf")
 
 
 # %%
-df_gap.hist(column="volume/atom", bins=50, log=True)
-plt.savefig("volume_per_atom_hist.pdf")
+plot_histograms(gap_agg.stats, ["volume_per_atom"], bins=50, log=True)
+save_fig(plt.gcf(), "volume_per_atom_hist.pdf")
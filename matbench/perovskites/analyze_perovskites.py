@@ -16,15 +16,17 @@ https://ml.materialsproject.org/projects/matbench_perovskites
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import (
     annotate_bars,
     plot_structure_2d,
     ptable_heatmap,
     spacegroup_sunburst,
 )
-from pymatviz.utils import get_crystal_sys
-from tqdm import tqdm
+
+from mat_eda.composition import element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import DATASET_FEATURES, add_features
 
 
 plt.rc("font", size=16)
@@ -34,37 +36,32 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_perov = load_dataset("matbench_perovskites")
-
-df_perov[["spg_symbol", "spg_num"]] = [
-    struct.get_space_group_info() for struct in tqdm(df_perov.structure)
-]
-df_perov["volume"] = df_perov.structure.map(lambda struct: struct.volume)
-
-df_perov["formula"] = df_perov.structure.map(lambda cryst: cryst.formula)
+df_perov, structures = load_dataset("matbench_perovskites")
 
-df_perov["crystal_sys"] = [get_crystal_sys(x) for x in df_perov.spg_num]
+# volume, formula, space group and crystal system columns
+add_features(df_perov, structures, DATASET_FEATURES["matbench_perovskites"])
 
 
 # %%
 fig, axs = plt.subplots(3, 4, figsize=(12, 12))
 
-for struct, ax in zip(df_perov.structure.head(12), axs.flat):
+for struct, ax in zip(structures[:12], axs.flat):
     ax = plot_structure_2d(struct, ax=ax)
     ax.set_title(struct.composition.reduced_formula, fontsize=14)
 
-plt.savefig("perovskite-structures-2d.pdf")
+save_fig(plt.gcf(), "perovskite-structures-2d.pdf")
 
 
 # %%
 df_perov.hist(column="e_form", bins=50)
-plt.savefig("perovskites-e_form-hist.pdf")
+save_fig(plt.gcf(), "perovskites-e_form-hist.pdf")
 
 
 # %%
-ax = ptable_heatmap(df_perov.formula, log=True)
+elem_counts = structures.element_counts()
+ax = ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elements in Matbench Perovskites dataset")
-plt.savefig("perovskites-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "perovskites-ptable-heatmap.pdf")
 
 
 # %%
@@ -75,7 +72,7 @@ plt.xticks(rotation="horizontal")
 
 annotate_bars(v_offset=250)
 
-plt.savefig("perovskites-crystal-system-counts.pdf")
+save_fig(plt.gcf(), "perovskites-crystal-system-counts.pdf")
 
 
 # %%
@@ -85,5 +82,5 @@ df_perov.plot.scatter(x="volume", y="e_form", c="spg_num", colormap="viridis")
 # %%
 fig = spacegroup_sunburst(df_perov.spg_num, show_counts="percent")
 fig.update_layout(title="Matbench Perovskites spacegroup sunburst")
-fig.write_image("perovskite-spacegroup-sunburst.pdf")
+save_fig(fig, "perovskite-spacegroup-sunburst.pdf")
 fig.show()
@@ -18,9 +18,12 @@ https://ml.materialsproject.org/projects/matbench_phonons
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap, spacegroup_hist
-from tqdm import tqdm
+
+from mat_eda.composition import element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import DATASET_FEATURES, add_features
 
 
 plt.rc("font", size=16)
@@ -30,27 +33,23 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_phonon = load_dataset("matbench_phonons")
+df_phonon, structures = load_dataset("matbench_phonons")
 
-df_phonon[["spg_symbol", "spg_num"]] = [
-    struct.get_space_group_info() for struct in tqdm(df_phonon.structure)
-]
+add_features(df_phonon, structures, DATASET_FEATURES["matbench_phonons"])
 
 
 # %%
 df_phonon.hist(column="last phdos peak", bins=50)
-plt.savefig("phonons-last-dos-peak-hist.pdf")
+save_fig(plt.gcf(), "phonons-last-dos-peak-hist.pdf")
 
 
 # %%
-df_phonon["formula"] = df_phonon.structure.apply(lambda cryst: cryst.formula)
-df_phonon["volume"] = df_phonon.structure.apply(lambda cryst: cryst.volume)
-
-ptable_heatmap(df_phonon.formula, log=True)
+elem_counts = structures.element_counts()
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elemental prevalence in the Matbench phonons dataset")
-plt.savefig("phonons-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "phonons-ptable-heatmap.pdf")
 
 
 # %%
 spacegroup_hist(df_phonon.spg_num)
-plt.savefig("phonons-spacegroup-hist.pdf")
+save_fig(plt.gcf(), "phonons-spacegroup-hist.pdf")
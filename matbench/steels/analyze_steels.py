@@ -10,9 +10,12 @@ https://ml.materialsproject.org/projects/matbench_steels
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap
 
+from mat_eda.composition import element_count_matrix, element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+
 
 plt.rc("font", size=16)
 plt.rc("savefig", bbox="tight", dpi=200)
@@ -21,15 +24,16 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_steels = load_dataset("matbench_steels")
+df_steels, _ = load_dataset("matbench_steels")
 
 
 # %%
 df_steels.hist(column="yield strength", bins=50)
-plt.savefig("steels-yield-strength-hist.pdf")
+save_fig(plt.gcf(), "steels-yield-strength-hist.pdf")
 
 
 # %%
-ptable_heatmap(df_steels.composition, log=True)
+elem_counts = element_count_matrix(df_steels.composition)
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elemental prevalence in the Matbench steels dataset")
-plt.savefig("steels-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "steels-ptable-heatmap.pdf")
@@ -20,9 +20,13 @@ https://hackingmaterials.lbl.gov/matminer/dataset_summary.html#ricci-boltztrap-m
 
 # %%
 import matplotlib.pyplot as plt
-from matminer.datasets import load_dataset
 from pymatviz import ptable_heatmap, spacegroup_hist
-from tqdm import tqdm
+
+from mat_eda.composition import element_count_matrix, element_prevalence
+from mat_eda.data import load_dataset
+from mat_eda.export import save_fig
+from mat_eda.features import DATASET_FEATURES, add_features
+from mat_eda.stats import plot_histograms, summarize
 
 
 plt.rc("font", size=16)
@@ -32,32 +36,38 @@ plt.rcParams["figure.constrained_layout.use"] = True
 
 
 # %%
-df_carrier = load_dataset("ricci_boltztrap_mp_tabular")
+df_carrier, structures = load_dataset("ricci_boltztrap_mp_tabular")
 
-# getting space group symbols and numbers takes about 2 min
-df_carrier[["spg_symbol", "spg_num"]] = [
-    struct.get_space_group_info() for struct in tqdm(df_carrier.structure)
-]
+# getting space group symbols and numbers takes about 2 min serially
+add_features(df_carrier, structures, DATASET_FEATURES["ricci_boltztrap_mp_tabular"])
 
 
 # %%
-ptable_heatmap(df_carrier.pretty_formula.dropna(), log=True)
+elem_counts = element_count_matrix(df_carrier.pretty_formula)
+ptable_heatmap(element_prevalence(elem_counts), log=True)
 plt.title("Elemental prevalence in the Ricci Carrier Transport dataset")
-plt.savefig("carrier-transport-ptable-heatmap.pdf")
+save_fig(plt.gcf(), "carrier-transport-ptable-heatmap.pdf")
+
+
+# %%
+# one pass over all numeric columns, reused by the histogram plots below
+carrier_stats = summarize(df_carrier)
+carrier_stats.describe()
 
 
 # %%
-df_carrier.hist(bins=50, log=True, figsize=[30, 16])
+plot_histograms(carrier_stats, bins=50, log=True, figsize=[30, 16])
 plt.suptitle("Ricci Carrier Transport Dataset", y=1.05)
-plt.savefig("carrier-transport-hists.pdf")
+save_fig(plt.gcf(), "carrier-transport-hists.pdf")
 
 
 # %%
-df_carrier[["S.p [µV/K]", "S.n [µV/K]"]].hist(bins=50, log=True, figsize=[18, 8])
+seebeck_cols = ["S.p [µV/K]", "S.n [µV/K]"]
+plot_histograms(carrier_stats, seebeck_cols, bins=50, log=True, figsize=[18, 8])
 plt.suptitle(
     "Ricci Carrier Transport dataset histograms for n- and p-type Seebeck coefficients"
 )
-plt.savefig("carrier-transport-seebeck-n+p.pdf")
+save_fig(plt.gcf(), "carrier-transport-seebeck-n+p.pdf")
 
 
 # %%
@@ -80,12 +90,12 @@ dependent_vars = [
     "κₑᵉ.n.v [W/K/m/s]",
 ]
 
-df_carrier[dependent_vars].hist(bins=50, log=True, figsize=[30, 16])
+plot_histograms(carrier_stats, dependent_vars, bins=50, log=True, figsize=[30, 16])
 plt.suptitle("Ricci Carrier Transport Dataset dependent variables", y=1.05)
-plt.savefig("carrier-transport-hists-dependent-vars.pdf")
+save_fig(plt.gcf(), "carrier-transport-hists-dependent-vars.pdf")
 
 
 # %%
 spacegroup_hist(df_carrier.spg_num)
 plt.title("Spacegroup distribution in the Ricci carrier transport dataset")
-plt.savefig("carrier-transport-spacegroup-hist.pdf")
+save_fig(plt.gcf(), "carrier-transport-spacegroup-hist.pdf")
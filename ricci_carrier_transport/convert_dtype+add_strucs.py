@@ -5,8 +5,11 @@ Unprocessed data in data/carrier_transport.json.gz obtained from https://git.io/
 
 # %%
 import pandas as pd
-from matminer.datasets import load_dataset, store_dataframe_as_json
-from pymatgen.ext.matproj import MPRester
+from matminer.datasets import load_dataset
+
+from mat_eda.compact import compact_dataframe
+from mat_eda.data import save_columnar, to_columnar
+from mat_eda.mp import fetch_structures
 
 
 # %%
@@ -22,19 +25,10 @@ df_carrier.set_index("identifier", inplace=True)
 df_carrier.index.name = "mp_id"
 
 
-# %%
-with MPRester() as mpr:
-    strucs = mpr.query(
-        {"task_ids": {"$in": df_carrier.index.to_list()}},
-        ["task_ids", "structure"],
-    )
-
+# %% fetch structures in concurrent batches, reruns only fetch IDs not stored locally
+structures = fetch_structures(df_carrier.index.to_list())
 
-# %%
-# get a map from task ID to its structure
-struc_df = pd.DataFrame(strucs).explode("task_ids").set_index("task_ids")
-
-df_carrier[struc_df.columns] = struc_df
+df_carrier["structure"] = df_carrier.index.map(structures)
 
 df_carrier["pretty_formula"] = [struct.formula for struct in df_carrier.structure]
 
@@ -88,13 +82,17 @@ col_map = {
 df_carrier.rename(columns=col_map, inplace=True)
 
 
-# %% convert all target columns to dtype float
+# %% strip units from all target columns in one vectorized pass, downcast them to
+# float32 where that keeps 6 significant digits and store the functional as a
+# categorical
 units = ["Å³", "µV/K", "cm⁻³", "1/Ω/m/s", "K", "µW/cm/K²/s", "mₑ", "eV", "W/K/m/s"]
+unit_cols = [col for col in col_map.values() if col != "functional"]
 
-
-for col, vals in df_carrier[col_map.values()].items():
-    df_carrier[col] = vals.str.replace("|".join(units), "", regex=True).astype(float)
+df_table, structures = to_columnar(df_carrier)
+df_table, mem_report = compact_dataframe(df_table, unit_cols, units)
+print(mem_report.to_string())
 
 
-# %%
-store_dataframe_as_json(df_carrier, "cleaned_ricci_boltztrap_mp_tabular.json.gz")
+# %% Parquet table plus structures as flat arrays, read back with
+# load_dataset("cleaned_ricci_boltztrap_mp_tabular", cache_dir=".")
+save_columnar(df_table, structures, "cleaned_ricci_boltztrap_mp_tabular")